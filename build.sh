@@ -126,6 +126,28 @@ case "$1" in
         echo "Running type-check..."
         pyright ha-sip
         ;;
+    benchmark)
+        echo "Running benchmarks..."
+        python3 "$SCRIPT_DIR"/ha-sip/src/benchmarks/run.py "${@:2}"
+        ;;
+    benchmark-ha)
+        echo "Running home-assistant pipeline benchmarks..."
+        python3 "$SCRIPT_DIR"/ha-sip/src/benchmarks/ha_pipeline.py "${@:2}"
+        ;;
+    soak)
+        echo "Running soak test..."
+        python3 "$SCRIPT_DIR"/ha-sip/src/benchmarks/soak.py "${@:2}"
+        ;;
+    replay)
+        echo "Replaying trace..."
+        python3 "$SCRIPT_DIR"/ha-sip/src/benchmarks/replay.py "${@:2}"
+        ;;
+    load-test)
+        echo "Running SIP load generator..."
+        export LD_LIBRARY_PATH="$SCRIPT_DIR"/venv/lib:$LD_LIBRARY_PATH
+        source "$SCRIPT_DIR"/venv/bin/activate
+        python3 "$SCRIPT_DIR"/ha-sip/src/benchmarks/load_generator.py "${@:2}"
+        ;;
     run-local)
         export LD_LIBRARY_PATH="$SCRIPT_DIR"/venv/lib:$LD_LIBRARY_PATH
         source "$SCRIPT_DIR"/venv/bin/activate
@@ -155,7 +177,7 @@ case "$1" in
         python setup.py install
         ;;
     *)
-        echo "Supply one of 'update-next-repo', 'build-next', 'build-amd64', 'build-arm', 'test', 'update', 'run-local' or 'create-venv'"
+        echo "Supply one of 'update-next-repo', 'build-next', 'build-amd64', 'build-arm', 'test', 'benchmark', 'benchmark-ha', 'soak', 'replay', 'load-test', 'update', 'run-local' or 'create-venv'"
         exit 1
         ;;
 esac
@@ -1,21 +1,26 @@
 from __future__ import annotations
 
-import re
-from typing import Dict, List, Optional
+import time
+from typing import Dict, Optional
 
 import pjsua2 as pj
 
+import admission
 import call
+import early_media
 import ha
 import incoming_call
+import trace_recorder
 import utils
 import webhook
 from constants import DEFAULT_RING_TIMEOUT
 from event_sender import EventSender
-from log import log
+from log import log, error, warning
 from command_handler import CommandHandler
+from number_matcher import NumberMatcher
 from options_global import GlobalOptions
 from options_sip import SipOptions
+from sip_headers import SipHeaders
 
 
 class MyAccountConfig(object):
@@ -65,6 +70,10 @@ class Account(pj.Account):
         self.event_sender = event_sender
         self.ha_config = ha_config
         self.make_default = make_default
+        self.early_media_file: Optional[str] = None
+        self.early_media_retry_at: Optional[float] = None
+        self.early_media_retry_delay = early_media.PREPARE_RETRY_DELAY
+        self.admission = admission.AdmissionControl(config.options.max_concurrent_calls, config.options.max_call_rate, config.options.overload_policy)
 
     def init(self) -> None:
         account_config = pj.AccountConfig()
@@ -96,32 +105,54 @@ class Account(pj.Account):
 
     def onIncomingCall(self, prm) -> None:
         if not self.config:
-            log(None, 'Error: No config set when onIncomingCall was called.')
+            error(None, 'Error: No config set when onIncomingCall was called.')
             return
         menu = self.config.incoming_call_config.get('menu') if self.config.incoming_call_config else None
-        allowed_numbers = self.config.incoming_call_config.get('allowed_numbers') if self.config.incoming_call_config else None
-        blocked_numbers = self.config.incoming_call_config.get('blocked_numbers') if self.config.incoming_call_config else None
+        allowed_numbers = self.config.incoming_call_config.get('allowed_numbers_matcher') if self.config.incoming_call_config else None
+        blocked_numbers = self.config.incoming_call_config.get('blocked_numbers_matcher') if self.config.incoming_call_config else None
         answer_after = float(utils.convert_to_int(self.config.incoming_call_config.get('answer_after'), 0)) if self.config.incoming_call_config else 0.0
         webhook_to_call = self.config.incoming_call_config.get('webhook_to_call') if self.config.incoming_call_config else None
         extract_headers = self.config.options.extract_headers
         sip_headers: Dict[str, Optional[str]] = {}
-        if self.config.global_options.debug_headers:
-            Account.log_all_sip_headers(self.config.index, prm.rdata.wholeMsg)
-        if extract_headers:
-            sip_headers = Account.parse_sip_headers(prm.rdata.wholeMsg, extract_headers)
+        needs_headers = self.config.global_options.debug_headers or extract_headers
+        if needs_headers:
+            parsed_headers = SipHeaders(prm.rdata.wholeMsg)
+            if self.config.global_options.debug_headers:
+                parsed_headers.log_all(self.config.index)
+            if extract_headers:
+                sip_headers = parsed_headers.extract(extract_headers)
         incoming_call_instance = call.Call(
             self.end_point, self, prm.callId, None, menu, self.command_handler, self.event_sender,
             self.ha_config, DEFAULT_RING_TIMEOUT, webhook_to_call, sip_headers,
         )
         ci = incoming_call_instance.get_call_info()
+        trace_recorder.record(
+            'incoming_call',
+            account=self.config.index,
+            remote_uri=ci['remote_uri'],
+            local_uri=ci['local_uri'],
+            sip_call_id=ci['call_id'],
+            message=prm.rdata.wholeMsg if needs_headers else None,
+        )
         answer_mode = self.get_sip_return_code(self.config.mode, allowed_numbers, blocked_numbers, ci['parsed_caller'])
         log(self.config.index, f"Incoming call  from  '{ci['remote_uri']}' (parsed: '{ci['parsed_caller']}') to '{ci['local_uri']}' (parsed: '{ci['parsed_called']}')")
         if allowed_numbers:
-            log(self.config.index, f'Allowed numbers: {allowed_numbers}')
+            log(self.config.index, f'Allowed numbers: {len(allowed_numbers)} entries')
         if blocked_numbers:
-            log(self.config.index, f'Blocked numbers: {blocked_numbers}')
+            log(self.config.index, f'Blocked numbers: {len(blocked_numbers)} entries')
         log(self.config.index, f'Answer mode: {answer_mode.name}')
-        incoming_call_instance.accept(answer_mode, answer_after)
+        if answer_mode == call.CallHandling.ACCEPT:
+            # only calls which are answered take from the limits, the new call itself is already registered
+            rejection = self.admission.admit(self.command_handler.active_calls_on_account(self) - 1)
+            if rejection:
+                self.reject_incoming_call(incoming_call_instance, rejection)
+                return
+        early_media_config = self.config.incoming_call_config.get('early_media') if self.config.incoming_call_config else None
+        if early_media_config and answer_mode == call.CallHandling.ACCEPT:
+            # without a prepared prompt, the call gets only the ringback tone or a plain 180 ringing
+            incoming_call_instance.accept(answer_mode, answer_after, early_media_config, self.early_media_file)
+        else:
+            incoming_call_instance.accept(answer_mode, answer_after)
         webhook.trigger_webhook(
             {'event': 'incoming_call'},
             ci,
@@ -129,62 +160,61 @@ class Account(pj.Account):
             incoming_call_instance.callback_id,
             self.event_sender,
         )
+        incoming_call_instance.timeline.mark('webhook_sent', event='incoming_call')
+
+    def prepare_early_media(self) -> None:
+        """
+        Called at start-up, and again by the main loop with a growing delay while the prompt could not be prepared,
+        so incoming calls never wait for TTS or ffmpeg.
+        """
+        early_media_config = self.config.incoming_call_config.get('early_media') if self.config.incoming_call_config else None
+        if not early_media_config or not (early_media_config.get('message') or early_media_config.get('audio_file')):
+            return
+        self.early_media_file = early_media.prepare_prompt(self.ha_config, early_media_config)
+        if self.early_media_file:
+            log(self.config.index, f'Early media prompt ready: {self.early_media_file}')
+            self.early_media_retry_at = None
+            self.early_media_retry_delay = early_media.PREPARE_RETRY_DELAY
+            return
+        if not self.ha_config.cache_dir:
+            return
+        warning(self.config.index, 'Warning: Early media prompt not ready, trying again in %ss', self.early_media_retry_delay)
+        self.early_media_retry_at = time.time() + self.early_media_retry_delay
+        self.early_media_retry_delay = min(self.early_media_retry_delay * 2, early_media.MAX_PREPARE_RETRY_DELAY)
+
+    def handle_early_media_retry(self) -> None:
+        if self.early_media_retry_at and self.early_media_retry_at <= time.time():
+            self.early_media_retry_at = None
+            self.prepare_early_media()
+
+    def reject_incoming_call(self, rejected_call: call.Call, reason: admission.RejectionReason) -> None:
+        # the call was never announced by an incoming_call event, so it must not send any other web-hook events
+        rejected_call.silent = True
+        call_prm = pj.CallOpParam(True)
+        call_prm.statusCode = 486 if reason == 'max_concurrent_calls' else 503
+        rejected_call.hangup(call_prm)
+        ci = rejected_call.get_call_info()
+        self.command_handler.send_call_rejected(self, 'incoming', ci['parsed_caller'] or ci['remote_uri'], reason)
 
     def get_sip_return_code(
         self,
         mode: call.CallHandling,
-        allowed_numbers: Optional[list[str]],
-        blocked_numbers: Optional[list[str]],
+        allowed_numbers: Optional[NumberMatcher],
+        blocked_numbers: Optional[NumberMatcher],
         parsed_caller: Optional[str],
     ) -> call.CallHandling:
         if allowed_numbers and blocked_numbers:
-            log(self.config.index, 'Error: cannot specify both of allowed and blocked numbers. Call won\'t be accepted!')
+            error(self.config.index, "Error: cannot specify both of allowed and blocked numbers. Call won't be accepted!")
             return call.CallHandling.LISTEN
         if mode == call.CallHandling.ACCEPT and allowed_numbers:
-            return call.CallHandling.ACCEPT if Account.is_number_in_list(parsed_caller, allowed_numbers) else call.CallHandling.LISTEN
+            return call.CallHandling.ACCEPT if allowed_numbers.matches(parsed_caller) else call.CallHandling.LISTEN
         if mode == call.CallHandling.ACCEPT and blocked_numbers:
-            return call.CallHandling.ACCEPT if not Account.is_number_in_list(parsed_caller, blocked_numbers) else call.CallHandling.LISTEN
+            return call.CallHandling.ACCEPT if not blocked_numbers.matches(parsed_caller) else call.CallHandling.LISTEN
         return mode
 
-    @staticmethod
-    def parse_sip_headers(whole_msg: str, header_names: List[str]) -> Dict[str, Optional[str]]:
-        result: Dict[str, Optional[str]] = {name: None for name in header_names}
-        for line in whole_msg.split('\r\n'):
-            if not line.strip():
-                break  # End of headers
-            for name in header_names:
-                if line.lower().startswith(name.lower() + ':'):
-                    result[name] = line.split(':', 1)[1].strip()
-        return result
-
-    @staticmethod
-    def log_all_sip_headers(account_index: int, whole_msg: str) -> None:
-        log(account_index, 'Available SIP headers:')
-        for line in whole_msg.split('\r\n'):
-            if not line.strip():
-                break  # End of headers
-            if ':' in line:
-                name, value = line.split(':', 1)
-                log(account_index, f'  {name.strip()}: {value.strip()}')
-
     @staticmethod
     def is_number_in_list(number: Optional[str], number_list: list[str]) -> bool:
-        def map_to_regex(st: str) -> str:
-            if st == '{*}':
-                return '.*'
-            if st == '{?}':
-                return '.'
-            return re.escape(st)
-        if not number:
-            return False
-        for n in number_list:
-            # split by {*} and {?} keeping delimiters
-            n_split = re.split(r'(\{\*}|\{\?})', n)
-            n_regex = '^' + ''.join(map(map_to_regex, n_split)) + '$'
-            match = re.match(n_regex, number)
-            if match:
-                return True
-        return False
+        return NumberMatcher(number_list).matches(number)
 
 
 def create_account(
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import collections
+import time
+from typing import TYPE_CHECKING, Deque, List, Literal, Optional
+
+from typing_extensions import TypedDict
+
+if TYPE_CHECKING:
+    from command_client import CommandDial
+    from dial_group import DialGroup
+
+OverloadPolicy = Literal['queue', 'reject']
+RejectionReason = Literal['max_concurrent_calls', 'max_call_rate', 'queue_full', 'queue_timeout']
+
+MAX_QUEUED_DIALS = 100
+DEFAULT_QUEUE_TIMEOUT = 60.0
+
+
+class CallRejectedEvent(TypedDict):
+    event: Literal['call_rejected']
+    sip_account: int
+    direction: Literal['incoming', 'outgoing']
+    number: Optional[str]
+    reason: RejectionReason
+
+
+class QueuedDial(object):
+    def __init__(self, command: CommandDial, queued_at: float, group: Optional[DialGroup]):
+        self.command = command
+        self.queued_at = queued_at
+        self.group = group
+
+
+class AdmissionControl(object):
+    """
+    Limits the number of concurrent calls and the number of call attempts per second (token bucket) of one account.
+    Dial commands exceeding the limits are kept in a queue when the policy is "queue", and are dialed by the main loop
+    as soon as the limits allow it.
+    """
+    def __init__(self, max_concurrent_calls: int, max_call_rate: float, policy: OverloadPolicy, queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_call_rate = max_call_rate
+        self.policy = policy
+        self.queue_timeout = queue_timeout
+        self.bucket_size = max(max_call_rate, 1.0)
+        self.tokens = self.bucket_size
+        self.tokens_updated_at = time.monotonic()
+        self.queue: Deque[QueuedDial] = collections.deque()
+
+    def is_limited(self) -> bool:
+        return bool(self.max_concurrent_calls or self.max_call_rate)
+
+    def admit(self, active_calls: int) -> Optional[RejectionReason]:
+        """Returns why a new call can't be made right now, or None and takes a call attempt from the bucket."""
+        if self.max_concurrent_calls and active_calls >= self.max_concurrent_calls:
+            return 'max_concurrent_calls'
+        if self.max_call_rate:
+            now = time.monotonic()
+            self.tokens = min(self.bucket_size, self.tokens + (now - self.tokens_updated_at) * self.max_call_rate)
+            self.tokens_updated_at = now
+            if self.tokens < 1.0:
+                return 'max_call_rate'
+            self.tokens -= 1.0
+        return None
+
+    def enqueue(self, command: CommandDial, group: Optional[DialGroup] = None) -> bool:
+        if len(self.queue) >= MAX_QUEUED_DIALS:
+            return False
+        self.queue.append(QueuedDial(command, time.monotonic(), group))
+        return True
+
+    def drop_group(self, group: DialGroup) -> None:
+        """Removes the queued dials of a dial group which is already finished."""
+        self.queue = collections.deque(queued for queued in self.queue if queued.group is not group)
+
+    def expire(self) -> List[QueuedDial]:
+        """Removes and returns the dial commands which waited longer than the queue timeout."""
+        expired: List[QueuedDial] = []
+        now = time.monotonic()
+        while self.queue and now - self.queue[0].queued_at > self.queue_timeout:
+            expired.append(self.queue.popleft())
+        return expired
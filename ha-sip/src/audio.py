@@ -6,6 +6,7 @@ from typing import Optional
 from enum import Enum
 from pathlib import Path
 
+import metrics
 from log import log
 
 
@@ -20,8 +21,10 @@ def convert_audio_stream_to_wav_file(
     stream: bytes,
     input_format: AudioInputFormat,
 ) -> Optional[str]:
+    wav_file_name: Optional[str] = None
     try:
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file:
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file, metrics.FFMPEG_SECONDS.time():
+            wav_file_name = wav_file.name
             subprocess.run(
                 [
                     "ffmpeg",
@@ -39,6 +42,15 @@ def convert_audio_stream_to_wav_file(
             return wav_file.name
     except subprocess.CalledProcessError as e:
         log(None, f"ffmpeg error: {e.stderr.decode(errors='ignore')}")
+        metrics.FFMPEG_FAILURES.inc()
+        if wav_file_name:
+            Path(wav_file_name).unlink(missing_ok=True)
+        return None
+    except OSError as e:
+        log(None, f"Could not run ffmpeg: {e}")
+        metrics.FFMPEG_FAILURES.inc()
+        if wav_file_name:
+            Path(wav_file_name).unlink(missing_ok=True)
         return None
 
 
@@ -3,7 +3,8 @@ import hashlib
 import os
 import shutil
 
-from log import log
+import metrics
+from log import log, warning
 
 cache_type = Union[Literal['audio_file'], Literal['message']]
 
@@ -12,13 +13,15 @@ def get_cached_file(should_cache: bool, cache_dir: Optional[str], file_or_messag
     if not should_cache:
         return None
     if not cache_dir:
-        log(None, 'Warning: Caching enabled but no cache directory configured.')
+        warning(None, 'Warning: Caching enabled but no cache directory configured.')
         return None
     file_name = get_cache_file_name(cache_dir, file_or_message, file_name_or_message)
     if not os.path.isfile(file_name):
         log(None, f'Cache file not found: {file_name}')
+        metrics.AUDIO_CACHE_REQUESTS.inc(result='miss')
         return None
     log(None, f'Using cache from file: {file_name}')
+    metrics.AUDIO_CACHE_REQUESTS.inc(result='hit')
     return file_name
 
 
@@ -26,7 +29,7 @@ def cache_file(should_cache: bool, cache_dir: Optional[str], file_or_message: ca
     if not should_cache:
         return
     if not cache_dir:
-        log(None, 'Warning: Caching enabled but no cache directory configured.')
+        warning(None, 'Warning: Caching enabled but no cache directory configured.')
         return
     file_name = get_cache_file_name(cache_dir, file_or_message, file_name_or_message)
     try:
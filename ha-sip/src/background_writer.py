@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class BackgroundWriter(Generic[T]):
+    """
+    Hands items to a daemon thread which processes them in batches, so slow I/O (stdout, files, databases)
+    does not block the main loop. The buffer is bounded: when it is full, new items are dropped and counted.
+    """
+    def __init__(self, name: str, handle_batch: Callable[[List[T]], None], max_size: int = 10000, max_batch_size: int = 500):
+        self.name = name
+        self.handle_batch = handle_batch
+        self.max_batch_size = max_batch_size
+        self.queue: queue.Queue[T] = queue.Queue(max_size)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread:
+                return
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def put(self, item: T) -> bool:
+        if not self.thread:
+            self.start()
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.handle_batch(batch)
+            except Exception as e:
+                print(f'| {self.name}: error while writing: {e}', file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def pop_dropped(self) -> int:
+        """Returns the number of items dropped since the last call."""
+        dropped = self.dropped
+        newly_dropped = dropped - self.reported_dropped
+        self.reported_dropped = dropped
+        return newly_dropped
+
+    def flush(self, timeout: float = 2.0) -> None:
+        if not self.thread:
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the home-assistant REST and websocket API used by ha-sip, with configurable latency, error rate
+and payload size.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+import websockets
+
+SAMPLE_RATE = 8000
+
+
+class FakeHaSettings(object):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, payload_size: int = 16000, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+def create_wav(payload_size: int) -> bytes:
+    """Mono 16 bit PCM with payload_size bytes of silence."""
+    data_size = payload_size - payload_size % 2
+    output = io.BytesIO()
+    output.write(b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE')
+    output.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16))
+    output.write(b'data' + struct.pack('<I', data_size) + bytes(data_size))
+    return output.getvalue()
+
+
+class FakeHaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method: str) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        fake_ha = cast(FakeHaHttpServer, self.server).fake_ha
+        fake_ha.count_request(self.path)
+        time.sleep(fake_ha.settings.delay())
+        if fake_ha.settings.should_fail():
+            self.send(500, b'{"message": "Simulated error"}')
+            return
+        if self.headers.get('Authorization') != 'Bearer ' + fake_ha.token:
+            self.send(401, b'{"message": "Unauthorized"}')
+            return
+        status, content = fake_ha.handle(method, self.path, body)
+        self.send(status, content)
+
+    def send(self, status: int, content: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/wav' if content[:4] == b'RIFF' else 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeHaHttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], fake_ha: FakeHa):
+        self.fake_ha = fake_ha
+        super().__init__(address, FakeHaRequestHandler)
+
+
+class FakeHa(object):
+    def __init__(self, settings: Optional[FakeHaSettings] = None, token: str = 'token', host: str = '127.0.0.1', port: int = 0):
+        self.settings = settings or FakeHaSettings()
+        self.token = token
+        self.host = host
+        self.http_server = FakeHaHttpServer((host, port), self)
+        self.port = self.http_server.server_address[1]
+        self.websocket_port = 0
+        self.websocket_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.websocket_stop: Optional[asyncio.Future] = None
+        self.threads: List[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {}
+        self.webhook_events: List[Tuple[float, str, Any]] = []
+        self.service_calls: List[Tuple[str, Any]] = []
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/api'
+
+    @property
+    def websocket_url(self) -> str:
+        return f'ws://{self.host}:{self.websocket_port}/api/websocket'
+
+    def start(self) -> FakeHa:
+        http_thread = threading.Thread(target=self.http_server.serve_forever, name='fake-ha-http', daemon=True)
+        http_thread.start()
+        started = threading.Event()
+        websocket_thread = threading.Thread(target=self.run_websocket_server, args=(started,), name='fake-ha-websocket', daemon=True)
+        websocket_thread.start()
+        started.wait(5)
+        self.threads = [http_thread, websocket_thread]
+        return self
+
+    def stop(self) -> None:
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        if self.websocket_loop and self.websocket_stop:
+            self.websocket_loop.call_soon_threadsafe(self.websocket_stop.set_result, None)
+        for thread in self.threads:
+            thread.join(5)
+
+    def count_request(self, path: str) -> None:
+        endpoint = '/'.join(path.split('?', 1)[0].split('/')[:3])
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, bytes]:
+        payload = json.loads(body) if body else {}
+        if method == 'POST' and path == '/api/tts_get_url':
+            if 'message' not in payload:
+                return 400, b'{"message": "Missing message"}'
+            url = f'{self.base_url}/tts_proxy/{uuid.uuid4().hex}.wav'
+            return 200, json.dumps({'url': url, 'path': url[len(self.base_url) - 4:]}).encode()
+        if method == 'GET' and path.startswith('/api/tts_proxy/'):
+            return 200, create_wav(self.settings.payload_size)
+        if method == 'POST' and path == '/api/template':
+            return 200, f"rendered {payload.get('template', '')}".encode()
+        if method == 'POST' and path.startswith('/api/services/'):
+            with self.lock:
+                self.service_calls.append((path[len('/api/services/'):], payload))
+            return 200, b'[]'
+        if method == 'POST' and path.startswith('/api/webhook/'):
+            with self.lock:
+                self.webhook_events.append((time.time(), path[len('/api/webhook/'):], payload))
+            return 200, b''
+        return 404, b'{"message": "Not found"}'
+
+    def run_websocket_server(self, started: threading.Event) -> None:
+        async def serve() -> None:
+            self.websocket_loop = asyncio.get_running_loop()
+            self.websocket_stop = self.websocket_loop.create_future()
+            async with websockets.serve(self.handle_websocket, self.host, 0) as server:
+                self.websocket_port = next(iter(server.sockets)).getsockname()[1]
+                started.set()
+                await self.websocket_stop
+        asyncio.run(serve())
+
+    async def handle_websocket(self, websocket: Any) -> None:
+        await websocket.send(json.dumps({'type': 'auth_required', 'ha_version': 'fake'}))
+        auth = json.loads(await websocket.recv())
+        if auth.get('access_token') != self.token:
+            await websocket.send(json.dumps({'type': 'auth_invalid', 'message': 'Invalid access token'}))
+            return
+        await websocket.send(json.dumps({'type': 'auth_ok', 'ha_version': 'fake'}))
+        async for raw_message in websocket:
+            message = json.loads(raw_message)
+            await asyncio.sleep(self.settings.delay())
+            if self.settings.should_fail():
+                result: Dict[str, Any] = {'id': message.get('id'), 'type': 'result', 'success': False, 'error': {'code': 'unknown_error'}}
+            elif message.get('type') == 'tts/engine/list':
+                result = {'id': message.get('id'), 'type': 'result', 'success': True, 'result': {'providers': [
+                    {'engine_id': 'tts.fake', 'supported_languages': ['de', 'en', 'fr']},
+                ]}}
+            elif message.get('type') == 'tts/engine/voices':
+                result = {'id': message.get('id'), 'type': 'result', 'success': True, 'result': {'voices': [
+                    {'voice_id': 'fake', 'name': 'Fake voice'},
+                ]}}
+            else:
+                result = {'id': message.get('id'), 'type': 'result', 'success': False, 'error': {'code': 'unknown_command'}}
+            await websocket.send(json.dumps(result))
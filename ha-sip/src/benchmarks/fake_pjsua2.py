@@ -0,0 +1,314 @@
+"""
+Minimal stand-in for the pjsua2 SWIG bindings, so the Python code of ha-sip can be exercised without PJSIP.
+
+Only the parts used by ha-sip are provided. Methods which would talk to the network or the sound device are no-ops,
+calls can be driven from the outside with the simulate_* helpers.
+"""
+from __future__ import annotations
+
+import sys
+import types
+from typing import Any, Dict, List, Optional
+
+PJSUA_INVALID_ID = -1
+
+PJSIP_INV_STATE_NULL = 0
+PJSIP_INV_STATE_CALLING = 1
+PJSIP_INV_STATE_INCOMING = 2
+PJSIP_INV_STATE_EARLY = 3
+PJSIP_INV_STATE_CONNECTING = 4
+PJSIP_INV_STATE_CONFIRMED = 5
+PJSIP_INV_STATE_DISCONNECTED = 6
+
+PJMEDIA_TYPE_AUDIO = 1
+PJSUA_CALL_MEDIA_NONE = 0
+PJSUA_CALL_MEDIA_ACTIVE = 1
+PJSUA_CALL_MEDIA_LOCAL_HOLD = 2
+PJSUA_CALL_MEDIA_REMOTE_HOLD = 3
+
+PJSUA_DTMF_METHOD_RFC2833 = 0
+PJSUA_DTMF_METHOD_SIP_INFO = 1
+
+PJSIP_TRANSPORT_UDP = 1
+PJSIP_TRANSPORT_TCP = 2
+PJSIP_TRANSPORT_TLS = 3
+
+PJSUA_STUN_USE_DEFAULT = 0
+PJSUA_STUN_USE_DISABLED = 1
+
+PJMEDIA_FILE_NO_LOOP = 1
+
+PJ_TURN_TP_UDP = 17
+PJ_TURN_TP_TCP = 6
+PJ_TURN_TP_TLS = 255
+
+
+class Config(object):
+    """Accepts any attribute, nested configs are created on first access."""
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = Config()
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+
+
+class StringVector(list):
+    pass
+
+
+class ToneDigitVector(list):
+    pass
+
+
+class EpConfig(Config):
+    pass
+
+
+class TransportConfig(Config):
+    pass
+
+
+class AccountConfig(Config):
+    def __init__(self):
+        self.sipConfig = Config()
+        self.sipConfig.authCreds = []
+        self.sipConfig.proxies = StringVector()
+
+
+class AuthCredInfo(object):
+    def __init__(self, scheme: str = '', realm: str = '', user_name: str = '', data_type: int = 0, data: str = ''):
+        self.scheme = scheme
+        self.realm = realm
+        self.username = user_name
+        self.dataType = data_type
+        self.data = data
+
+
+class CallOpParam(object):
+    def __init__(self, use_default_call_setting: bool = False):
+        self.statusCode = 0
+        self.reason = ''
+        self.opt = Config()
+
+
+class CallSendDtmfParam(object):
+    def __init__(self):
+        self.method = PJSUA_DTMF_METHOD_RFC2833
+        self.duration = 0
+        self.digits = ''
+
+
+class SipRxData(object):
+    def __init__(self, whole_msg: str = ''):
+        self.wholeMsg = whole_msg
+
+
+class OnIncomingCallParam(object):
+    def __init__(self, call_id: int, whole_msg: str = ''):
+        self.callId = call_id
+        self.rdata = SipRxData(whole_msg)
+
+
+class OnDtmfDigitParam(object):
+    def __init__(self, digit: str = ''):
+        self.digit = digit
+        self.method = PJSUA_DTMF_METHOD_RFC2833
+        self.duration = 0
+
+
+class ToneDigit(object):
+    def __init__(self):
+        self.digit = ''
+        self.volume = 0
+        self.on_msec = 0
+        self.off_msec = 0
+
+
+class CallMediaInfo(object):
+    def __init__(self, status: int = PJSUA_CALL_MEDIA_ACTIVE):
+        self.type = PJMEDIA_TYPE_AUDIO
+        self.status = status
+
+
+class CallInfo(object):
+    def __init__(self, remote_uri: str, local_uri: str, call_id_string: str):
+        self.remoteUri = remote_uri
+        self.localUri = local_uri
+        self.callIdString = call_id_string
+        self.state = PJSIP_INV_STATE_NULL
+        self.lastStatusCode = 0
+        self.lastReason = ''
+        self.media: List[CallMediaInfo] = []
+
+
+class AudioMedia(object):
+    def __init__(self):
+        self.transmitting_to: List[AudioMedia] = []
+
+    def startTransmit(self, sink: AudioMedia) -> None:
+        self.transmitting_to.append(sink)
+
+    def stopTransmit(self, sink: AudioMedia) -> None:
+        if sink in self.transmitting_to:
+            self.transmitting_to.remove(sink)
+
+
+class AudioMediaPlayer(AudioMedia):
+    def createPlayer(self, file_name: str, options: int = 0) -> None:
+        self.file_name = file_name
+
+    def onEof2(self) -> None:
+        pass
+
+
+class AudioMediaRecorder(AudioMedia):
+    def createRecorder(self, file_name: str) -> None:
+        self.file_name = file_name
+
+
+class ToneDesc(object):
+    def __init__(self):
+        self.freq1 = 0
+        self.freq2 = 0
+        self.on_msec = 0
+        self.off_msec = 0
+
+
+class ToneDescVector(list):
+    pass
+
+
+class ToneGenerator(AudioMedia):
+    def createToneGenerator(self) -> None:
+        pass
+
+    def play(self, tones: ToneDescVector, loop: bool = False) -> None:
+        self.tones = tones
+
+    def playDigits(self, digits: ToneDigitVector) -> None:
+        pass
+
+
+class Endpoint(object):
+    def libCreate(self) -> None:
+        pass
+
+    def libInit(self, ep_config: EpConfig) -> None:
+        pass
+
+    def transportCreate(self, transport_type: int, transport_config: TransportConfig) -> int:
+        return 0
+
+    def libStart(self) -> None:
+        pass
+
+    def libHandleEvents(self, msec_timeout: int) -> int:
+        return 0
+
+    def libDestroy(self) -> None:
+        pass
+
+    def audDevManager(self) -> Any:
+        return Config()
+
+
+class Account(object):
+    def __init__(self):
+        self.account_config: Optional[AccountConfig] = None
+
+    def create(self, account_config: AccountConfig, make_default: bool = False) -> None:
+        self.account_config = account_config
+
+    def onIncomingCall(self, prm: OnIncomingCallParam) -> None:
+        pass
+
+    def simulate_incoming_call(self, remote_uri: str, local_uri: str, call_id_string: str, whole_msg: str = '') -> None:
+        Call.next_id += 1
+        incoming_calls[Call.next_id] = CallInfo(remote_uri, local_uri, call_id_string)
+        self.onIncomingCall(OnIncomingCallParam(Call.next_id, whole_msg))
+
+
+class Call(object):
+    next_id = 0
+
+    def __init__(self, account: Account, call_id: int = PJSUA_INVALID_ID):
+        if call_id in incoming_calls:
+            self.fake_id = call_id
+            self.fake_info = incoming_calls.pop(call_id)
+        else:
+            Call.next_id += 1
+            self.fake_id = Call.next_id
+            self.fake_info = CallInfo(
+                f'<sip:caller{self.fake_id}@fake.invalid>',
+                '<sip:ha-sip@fake.invalid>',
+                f'fake-call-{self.fake_id}',
+            )
+        self.fake_audio_media = AudioMedia()
+        self.operations: List[Any] = []
+        self.fake_rx_packets = 0
+
+    def getInfo(self) -> CallInfo:
+        return self.fake_info
+
+    def makeCall(self, dest_uri: str, prm: CallOpParam) -> None:
+        self.fake_info.remoteUri = f'<{dest_uri}>'
+        self.operations.append(('makeCall', dest_uri))
+
+    def answer(self, prm: CallOpParam) -> None:
+        self.operations.append(('answer', prm.statusCode))
+
+    def hangup(self, prm: CallOpParam) -> None:
+        self.operations.append(('hangup', prm.statusCode))
+
+    def xfer(self, dest: str, prm: CallOpParam) -> None:
+        self.operations.append(('xfer', dest))
+
+    def sendDtmf(self, prm: CallSendDtmfParam) -> None:
+        self.operations.append(('sendDtmf', prm.digits))
+
+    def getAudioMedia(self, media_index: int) -> AudioMedia:
+        return self.fake_audio_media
+
+    def getStreamStat(self, med_idx: int) -> Config:
+        stat = Config()
+        stat.rtcp.rxStat.pkt = self.fake_rx_packets
+        return stat
+
+    def onCallState(self, prm: Any) -> None:
+        pass
+
+    def onCallMediaState(self, prm: Any) -> None:
+        pass
+
+    def onDtmfDigit(self, prm: OnDtmfDigitParam) -> None:
+        pass
+
+    def simulate_state(self, state: int, status_code: int = 200) -> None:
+        self.fake_info.state = state
+        self.fake_info.lastStatusCode = status_code
+        self.onCallState(None)
+
+    def simulate_media_active(self) -> None:
+        self.simulate_media_state([PJSUA_CALL_MEDIA_ACTIVE])
+
+    def simulate_media_state(self, statuses: List[int]) -> None:
+        self.fake_info.media = [CallMediaInfo(status) for status in statuses]
+        self.onCallMediaState(None)
+
+    def simulate_dtmf(self, digit: str) -> None:
+        self.onDtmfDigit(OnDtmfDigitParam(digit))
+
+
+# call infos of simulated incoming calls, picked up by the Call created in onIncomingCall
+incoming_calls: Dict[int, CallInfo] = {}
+
+
+def install() -> types.ModuleType:
+    """Registers this module as pjsua2, must be called before any ha-sip module is imported."""
+    module = sys.modules[__name__]
+    sys.modules['pjsua2'] = module
+    return module
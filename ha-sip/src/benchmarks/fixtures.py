@@ -0,0 +1,163 @@
+"""
+Builders for the objects ha-sip needs to handle calls. fake_pjsua2 must be installed before importing this module.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, List, Optional
+
+import pjsua2 as pj
+
+import account
+import call
+import cdr
+import ha
+import incoming_call
+import options_global
+import options_sip
+import state
+from command_client import Command
+from command_handler import CommandHandler
+from event_sender import EventSender
+
+FAKE_CALL: Any = object()
+
+TTS_CONFIG: ha.TtsConfigFromEnv = {'platform': 'tts.fake', 'engine_id': None, 'language': 'en', 'voice': None, 'debug_print': None}
+
+
+class FakeCommandClient(object):
+    def __init__(self, commands: Optional[List[Command]] = None):
+        self.commands = commands or []
+
+    def get_command_list(self) -> List[Command]:
+        commands = self.commands
+        self.commands = []
+        return commands
+
+
+def create_event_sender(events: Optional[List[Any]] = None) -> EventSender:
+    """Events are appended to the given list, or dropped if there is none."""
+    event_sender = EventSender()
+    event_sender.register_sender(lambda event, webhook_id: events.append(event) if events is not None else None)
+    return event_sender
+
+
+def create_ha_config(cache_dir: Optional[str] = None) -> ha.HaConfig:
+    return ha.HaConfig(
+        'http://127.0.0.1:8123/api',
+        'ws://127.0.0.1:8123/api/websocket',
+        'token',
+        TTS_CONFIG,
+        'webhook-id',
+        cache_dir,
+    )
+
+
+def create_command_handler(
+    ha_config: Optional[ha.HaConfig] = None,
+    event_sender: Optional[EventSender] = None,
+    cdr_store: Optional[cdr.CdrStore] = None,
+    events: Optional[List[Any]] = None,
+) -> CommandHandler:
+    return CommandHandler(
+        pj.Endpoint(), {}, state.create(), ha_config or create_ha_config(), event_sender or create_event_sender(events), cdr_store=cdr_store,
+    )
+
+
+def create_account(
+    command_handler: CommandHandler,
+    index: int = 1,
+    settle_time: float = 0.0,
+    mode: call.CallHandling = call.CallHandling.ACCEPT,
+    incoming_call_config: Optional[incoming_call.IncomingCallConfig] = None,
+) -> account.Account:
+    config = account.MyAccountConfig(
+        enabled=True,
+        index=index,
+        id_uri='sip:ha-sip@fake.invalid',
+        registrar_uri='sip:fake.invalid',
+        realm='*',
+        user_name='ha-sip',
+        password='secret',
+        mode=mode,
+        settle_time=settle_time,
+        incoming_call_config=incoming_call_config,
+        options=options_sip.parse_sip_options('', index),
+        global_options=options_global.parse_global_options(''),
+    )
+    sip_account = account.Account(command_handler.end_point, config, command_handler, command_handler.event_sender, command_handler.ha_config)
+    command_handler.sip_accounts[index] = sip_account
+    sip_account.init()
+    return sip_account
+
+
+def create_call(
+    command_handler: Optional[CommandHandler] = None,
+    menu: Optional[call.MenuFromStdin] = None,
+    connected: bool = False,
+) -> call.Call:
+    command_handler = command_handler or create_command_handler()
+    sip_account = command_handler.sip_accounts.get(1) or create_account(command_handler)
+    new_call = call.Call(
+        command_handler.end_point, sip_account, pj.PJSUA_INVALID_ID, None, menu, command_handler, command_handler.event_sender,
+        command_handler.ha_config, 300, None, {},
+    )
+    if connected:
+        new_call.connected = True
+        new_call.menu['timeout'] = 1e9
+        new_call.last_seen = time.time()
+    return new_call
+
+
+def create_large_menu(depth: int, width: int, prefix: str = 'menu') -> call.MenuFromStdin:
+    menu: Any = {'id': prefix, 'message': f'Message of {prefix}', 'post_action': 'noop'}
+    if depth > 0:
+        menu['choices'] = {str(index): create_large_menu(depth - 1, width, f'{prefix}-{index}') for index in range(width)}
+    return menu
+
+
+def pin(number: int) -> str:
+    return f'{number:06d}'
+
+
+def create_pin_menu(count: int) -> call.MenuFromStdin:
+    menu: Any = {
+        'id': 'pin',
+        'choices_are_pin': True,
+        'choices': {pin(index): {'id': f'pin-{index}', 'post_action': 'noop'} for index in range(count)},
+    }
+    return menu
+
+
+def create_number_list(count: int) -> List[str]:
+    exact = [f'+49301234{index:05d}' for index in range(count - count // 10)]
+    wildcards = [f'+4940{index:04d}{{*}}' for index in range(count // 10)]
+    return exact + wildcards
+
+
+def create_sip_message() -> str:
+    return '\r\n'.join([
+        'INVITE sip:ha-sip@192.168.1.10:5060 SIP/2.0',
+        'Via: SIP/2.0/UDP 192.168.1.1:5060;branch=z9hG4bK776asdhds',
+        'Max-Forwards: 70',
+        'To: <sip:ha-sip@192.168.1.10>',
+        'From: "Alice" <sip:alice@fritz.box>;tag=1928301774',
+        'Call-ID: a84b4c76e66710@192.168.1.1',
+        'CSeq: 314159 INVITE',
+        'Contact: <sip:alice@192.168.1.1>',
+        'P-Asserted-Identity: "Alice" <sip:+4930123456@fritz.box>',
+        'X-Caller-Name: Alice',
+        'User-Agent: FRITZ!OS',
+        'Allow: INVITE, ACK, CANCEL, BYE, NOTIFY, REFER, OPTIONS, INFO, SUBSCRIBE, PRACK, UPDATE',
+        'Supported: replaces, timer, 100rel',
+        'Content-Type: application/sdp',
+        'Content-Length: 142',
+        '',
+        'v=0',
+        'o=alice 2890844526 2890844526 IN IP4 192.168.1.1',
+        's=-',
+        'c=IN IP4 192.168.1.1',
+        't=0 0',
+        'm=audio 49170 RTP/AVP 0 8 101',
+        'a=rtpmap:101 telephone-event/8000',
+    ])
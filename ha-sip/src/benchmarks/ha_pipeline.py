@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Measures prompt latency and throughput of the home-assistant pipeline (ha.py, audio.py, audio_cache.py) against a local
+fake home-assistant, e.g. with a slow, flaky or unreachable home-assistant.
+
+Usage: ha_pipeline.py [--scenario slow] [--prompts 50] [--unique-messages 10] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import audio_cache  # noqa: E402
+import cdr  # noqa: E402
+import ha  # noqa: E402
+import metrics  # noqa: E402
+from benchmarks.fake_ha import FakeHa, FakeHaSettings  # noqa: E402
+from log import LogLevel, configure_logging  # noqa: E402
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    'fast': {},
+    'slow': {'latency': 0.5, 'jitter': 0.1},
+    'flaky': {'error_rate': 0.2},
+    'large_payload': {'payload_size': 2 * 1024 * 1024},
+    'down': {},
+}
+
+
+def summarize(latencies: List[float], failures: int, duration: float) -> Dict[str, Any]:
+    sorted_latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'failures': failures,
+        'throughput_per_second': round(len(latencies) / duration, 3) if duration else None,
+        'p50_ms': round((cdr.percentile(sorted_latencies, 50) or 0.0) * 1000, 3),
+        'p95_ms': round((cdr.percentile(sorted_latencies, 95) or 0.0) * 1000, 3),
+        'max_ms': round((sorted_latencies[-1] if sorted_latencies else 0.0) * 1000, 3),
+    }
+
+
+def measure(count: int, operation: Callable[[int], bool]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    failures = 0
+    start = time.perf_counter()
+    for index in range(count):
+        operation_start = time.perf_counter()
+        try:
+            successful = operation(index)
+        except Exception:
+            successful = False
+        latencies.append(time.perf_counter() - operation_start)
+        if not successful:
+            failures += 1
+    return summarize(latencies, failures, time.perf_counter() - start)
+
+
+def play_prompt(ha_config: ha.HaConfig, message: str) -> bool:
+    """Same steps as Call.play_message, without handing the file to pjsua2."""
+    cached_file = audio_cache.get_cached_file(True, ha_config.cache_dir, 'message', message)
+    if cached_file:
+        return True
+    sound_file_name, must_be_deleted, was_successful = ha.create_and_get_tts(ha_config, message, 'en')
+    audio_cache.cache_file(was_successful, ha_config.cache_dir, 'message', message, sound_file_name)
+    if must_be_deleted:
+        os.remove(sound_file_name)
+    return was_successful
+
+
+def send_webhook(ha_config: ha.HaConfig, index: int) -> bool:
+    failures_before = metrics.EVENT_SEND_FAILURES.get(transport='webhook')
+    ha.trigger_webhook(ha_config, {'event': 'dtmf_digit', 'digit': str(index % 10), 'internal_id': 'benchmark'})
+    return metrics.EVENT_SEND_FAILURES.get(transport='webhook') == failures_before
+
+
+def list_tts_providers(ha_config: ha.HaConfig) -> bool:
+    asyncio.run(asyncio.wait_for(ha.print_tts_providers(ha_config), 10))
+    return True
+
+
+def run_scenario(name: str, prompts: int, unique_messages: int) -> Dict[str, Any]:
+    settings = FakeHaSettings(**SCENARIOS[name])
+    fake_ha = FakeHa(settings).start()
+    if name == 'down':
+        fake_ha.stop()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        ha_config = ha.HaConfig(
+            fake_ha.base_url,
+            fake_ha.websocket_url,
+            fake_ha.token,
+            {'platform': 'tts.fake', 'engine_id': None, 'language': 'en', 'voice': None, 'debug_print': None},
+            'benchmark',
+            cache_dir,
+        )
+        results: Dict[str, Any] = {'settings': SCENARIOS[name]}
+        if shutil.which('ffmpeg'):
+            results['prompt'] = measure(prompts, lambda index: play_prompt(ha_config, f'Message number {index % unique_messages}'))
+        else:
+            results['prompt'] = {'skipped': 'ffmpeg not found'}
+        results['template'] = measure(prompts, lambda index: ha.render_template(ha_config, f'{{{{ {index} }}}}').startswith('rendered'))
+        results['webhook'] = measure(prompts, lambda index: send_webhook(ha_config, index))
+        results['websocket_tts_engine_list'] = measure(1, lambda index: list_tts_providers(ha_config))
+    if name != 'down':
+        results['requests'] = dict(fake_ha.request_counts)
+        fake_ha.stop()
+    return results
+
+
+def main_ha_pipeline(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='ha_pipeline')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS.keys()), help='Scenario to run, can be repeated (default: all)')
+    parser.add_argument('--prompts', type=int, default=50, help='Number of prompts, templates and webhooks per scenario (default: 50)')
+    parser.add_argument('--unique-messages', type=int, default=10, help='Number of different messages, the others come from the cache (default: 10)')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    args = parser.parse_args(argv)
+    configure_logging(LogLevel.ERROR, {}, False)
+    results: Dict[str, Any] = {}
+    for name in args.scenario or SCENARIOS.keys():
+        results[name] = run_scenario(name, args.prompts, max(args.unique_messages, 1))
+        print(f'{name}: ' + ', '.join(f'{key} p50 {value["p50_ms"]}ms' for key, value in results[name].items() if 'p50_ms' in value), file=sys.stderr)
+    output = json.dumps({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_ha_pipeline(sys.argv[1:]))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Loopback SIP load generator: places concurrent calls to a running ha-sip instance with pjsua2, sends DTMF digits
+through the configured menu and holds the calls for a while. A fake home-assistant receives the webhooks of ha-sip,
+so the time from sending a DTMF digit until its webhook arrives can be measured.
+
+ha-sip must use the fake home-assistant, e.g. HA_BASE_URL=http://127.0.0.1:18123/api, HA_TOKEN=token,
+HA_WEBHOOK_ID=load-generator, and accept incoming calls (answer mode "accept").
+
+Usage: load_generator.py --target sip:ha-sip@127.0.0.1:5060 --calls 100 --concurrency 20 --digits 1234 [--ha-sip-pid PID]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import pjsua2 as pj  # noqa: E402
+
+import cdr  # noqa: E402
+from benchmarks.fake_ha import FakeHa  # noqa: E402
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+class ProcessSampler(object):
+    """Samples CPU usage and RSS of a process from /proc."""
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_kib: List[int] = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'sampler-{pid}', daemon=True)
+
+    def read_cpu_ticks(self) -> int:
+        with open(f'/proc/{self.pid}/stat') as f:
+            # the process name may contain spaces, the fields after it are fixed
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[11]) + int(fields[12])
+
+    def read_rss_kib(self) -> int:
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return 0
+
+    def run(self) -> None:
+        try:
+            last_ticks = self.read_cpu_ticks()
+            last_time = time.monotonic()
+            while not self.stopped.wait(self.interval):
+                ticks = self.read_cpu_ticks()
+                now = time.monotonic()
+                self.cpu_percent.append((ticks - last_ticks) / CLOCK_TICKS / (now - last_time) * 100)
+                self.rss_kib.append(self.read_rss_kib())
+                last_ticks, last_time = ticks, now
+        except (FileNotFoundError, ProcessLookupError):
+            pass
+
+    def start(self) -> ProcessSampler:
+        self.thread.start()
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        self.stopped.set()
+        self.thread.join()
+        return {
+            'pid': self.pid,
+            'cpu_percent_avg': round(sum(self.cpu_percent) / len(self.cpu_percent), 1) if self.cpu_percent else None,
+            'cpu_percent_max': round(max(self.cpu_percent), 1) if self.cpu_percent else None,
+            'rss_kib_start': self.rss_kib[0] if self.rss_kib else None,
+            'rss_kib_max': max(self.rss_kib) if self.rss_kib else None,
+        }
+
+
+class LoadCall(pj.Call):
+    def __init__(self, generator: LoadGenerator, account: LoadAccount, call_id: int = pj.PJSUA_INVALID_ID, incoming: bool = False):
+        pj.Call.__init__(self, account, call_id)
+        self.generator = generator
+        self.incoming = incoming
+        self.created_at = time.time()
+        self.ringing_at: Optional[float] = None
+        self.confirmed_at: Optional[float] = None
+        self.disconnected_at: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.sip_call_id: Optional[str] = None
+        self.remaining_digits = list(generator.digits)
+        self.next_action_at: Optional[float] = None
+        self.dtmf_sent: List[tuple[str, float]] = []
+        self.hangup_sent = False
+
+    def onCallState(self, prm) -> None:
+        call_info = self.getInfo()
+        now = time.time()
+        self.sip_call_id = call_info.callIdString
+        if call_info.state == pj.PJSIP_INV_STATE_EARLY and self.ringing_at is None:
+            self.ringing_at = now
+        elif call_info.state == pj.PJSIP_INV_STATE_CONFIRMED:
+            self.confirmed_at = now
+            self.next_action_at = now + self.generator.dtmf_delay
+        elif call_info.state == pj.PJSIP_INV_STATE_DISCONNECTED:
+            self.disconnected_at = now
+            self.status_code = call_info.lastStatusCode
+            self.generator.on_call_finished(self)
+
+    def step(self, now: float) -> None:
+        if self.next_action_at is None or now < self.next_action_at or self.hangup_sent:
+            return
+        if self.remaining_digits:
+            digit = self.remaining_digits.pop(0)
+            dtmf_prm = pj.CallSendDtmfParam()
+            dtmf_prm.method = pj.PJSUA_DTMF_METHOD_RFC2833
+            dtmf_prm.digits = digit
+            self.sendDtmf(dtmf_prm)
+            self.dtmf_sent.append((digit, time.time()))
+            self.next_action_at = now + (self.generator.dtmf_interval if self.remaining_digits else self.generator.hold_time)
+            return
+        self.hangup_sent = True
+        self.hangup(pj.CallOpParam(True))
+
+
+class LoadAccount(pj.Account):
+    def __init__(self, generator: LoadGenerator):
+        pj.Account.__init__(self)
+        self.generator = generator
+
+    def onIncomingCall(self, prm) -> None:
+        incoming_call = LoadCall(self.generator, self, prm.callId, incoming=True)
+        self.generator.on_call_started(incoming_call)
+        call_prm = pj.CallOpParam()
+        call_prm.statusCode = 200
+        incoming_call.answer(call_prm)
+
+
+class LoadGenerator(object):
+    def __init__(self, args: argparse.Namespace):
+        self.target: str = args.target
+        self.total_calls: int = args.calls
+        self.concurrency: int = args.concurrency
+        self.call_rate: float = args.call_rate
+        self.digits: str = args.digits
+        self.dtmf_delay: float = args.dtmf_delay
+        self.dtmf_interval: float = args.dtmf_interval
+        self.hold_time: float = args.hold_time
+        self.port: int = args.port
+        self.active_calls: Dict[int, LoadCall] = {}
+        self.finished_calls: List[LoadCall] = []
+        self.placed_calls = 0
+        self.end_point: Optional[pj.Endpoint] = None
+        self.account: Optional[LoadAccount] = None
+
+    def create_endpoint(self) -> None:
+        ep_cfg = pj.EpConfig()
+        ep_cfg.logConfig.level = 1
+        ep_cfg.uaConfig.threadCnt = 0
+        ep_cfg.uaConfig.mainThreadOnly = True
+        ep_cfg.uaConfig.maxCalls = min(max(self.concurrency * 2, 4), 32)
+        end_point = pj.Endpoint()
+        end_point.libCreate()
+        end_point.libInit(ep_cfg)
+        end_point.audDevManager().setNullDev()
+        transport_config = pj.TransportConfig()
+        transport_config.port = self.port
+        end_point.transportCreate(pj.PJSIP_TRANSPORT_UDP, transport_config)
+        end_point.libStart()
+        self.end_point = end_point
+        account_config = pj.AccountConfig()
+        account_config.idUri = f'sip:load-generator@127.0.0.1:{self.port}'
+        self.account = LoadAccount(self)
+        self.account.create(account_config)
+
+    def on_call_started(self, load_call: LoadCall) -> None:
+        self.active_calls[id(load_call)] = load_call
+
+    def on_call_finished(self, load_call: LoadCall) -> None:
+        if self.active_calls.pop(id(load_call), None):
+            self.finished_calls.append(load_call)
+
+    def place_call(self) -> None:
+        assert self.account is not None
+        load_call = LoadCall(self, self.account)
+        self.on_call_started(load_call)
+        self.placed_calls += 1
+        load_call.makeCall(self.target, pj.CallOpParam(True))
+
+    def run(self, timeout: float) -> float:
+        assert self.end_point is not None
+        start = time.monotonic()
+        deadline = start + timeout
+        next_call_at = start
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if self.placed_calls < self.total_calls and len(self.active_calls) < self.concurrency and now >= next_call_at:
+                self.place_call()
+                next_call_at = now + 1 / self.call_rate if self.call_rate else now
+            self.end_point.libHandleEvents(5)
+            wall_clock = time.time()
+            for load_call in list(self.active_calls.values()):
+                load_call.step(wall_clock)
+            if self.placed_calls >= self.total_calls and not self.active_calls:
+                break
+        for load_call in list(self.active_calls.values()):
+            load_call.hangup(pj.CallOpParam(True))
+        return time.monotonic() - start
+
+    def report(self, duration: float, fake_ha: FakeHa) -> Dict[str, Any]:
+        calls = self.finished_calls + list(self.active_calls.values())
+        outgoing = [c for c in calls if not c.incoming]
+        established = [c for c in outgoing if c.confirmed_at is not None]
+        setup_times = sorted(c.ringing_at - c.created_at for c in outgoing if c.ringing_at is not None)
+        answer_times = sorted(c.confirmed_at - c.created_at for c in established if c.confirmed_at is not None)
+        return {
+            'duration_seconds': round(duration, 3),
+            'calls_placed': self.placed_calls,
+            'calls_established': len(established),
+            'calls_failed': len(outgoing) - len(established),
+            'calls_received': len(calls) - len(outgoing),
+            'failure_status_codes': sorted({c.status_code for c in outgoing if c.confirmed_at is None and c.status_code}),
+            'setup_rate_per_second': round(len(established) / duration, 3) if duration else None,
+            'setup_time': latency_summary(setup_times),
+            'answer_latency': latency_summary(answer_times),
+            'dtmf_to_webhook_latency': latency_summary(sorted(match_dtmf_webhooks(established, fake_ha.webhook_events))),
+            'webhooks_received': len(fake_ha.webhook_events),
+        }
+
+
+def match_dtmf_webhooks(calls: List[LoadCall], webhook_events: List[tuple[float, str, Any]]) -> List[float]:
+    """Pairs each sent digit with the first matching dtmf_digit webhook of the same call which arrived afterwards."""
+    events_by_call: Dict[str, List[tuple[float, str]]] = {}
+    for received_at, _, event in webhook_events:
+        if isinstance(event, dict) and event.get('event') == 'dtmf_digit':
+            events_by_call.setdefault(str(event.get('call_id')), []).append((received_at, str(event.get('digit'))))
+    latencies = []
+    for load_call in calls:
+        events = events_by_call.get(str(load_call.sip_call_id), [])
+        for digit, sent_at in load_call.dtmf_sent:
+            match = next((event for event in events if event[1] == digit and event[0] >= sent_at), None)
+            if match:
+                events.remove(match)
+                latencies.append(match[0] - sent_at)
+    return latencies
+
+
+def latency_summary(sorted_values: List[float]) -> Dict[str, Any]:
+    return {
+        'count': len(sorted_values),
+        'p50_ms': round((cdr.percentile(sorted_values, 50) or 0.0) * 1000, 3),
+        'p95_ms': round((cdr.percentile(sorted_values, 95) or 0.0) * 1000, 3),
+        'max_ms': round((sorted_values[-1] if sorted_values else 0.0) * 1000, 3),
+    }
+
+
+def main_load_generator(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='load_generator')
+    parser.add_argument('--target', required=True, help='SIP URI of the ha-sip instance, e.g. sip:ha-sip@127.0.0.1:5060')
+    parser.add_argument('--calls', type=int, default=20, help='Total number of calls to place (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of simultaneous calls (default: 4)')
+    parser.add_argument('--call-rate', type=float, default=2.0, help='New calls per second, 0 for no limit (default: 2)')
+    parser.add_argument('--digits', default='1', help='DTMF digits to send after the call was answered (default: 1)')
+    parser.add_argument('--dtmf-delay', type=float, default=2.0, help='Seconds between answer and the first digit (default: 2)')
+    parser.add_argument('--dtmf-interval', type=float, default=0.5, help='Seconds between two digits (default: 0.5)')
+    parser.add_argument('--hold-time', type=float, default=5.0, help='Seconds to hold the call after the last digit (default: 5)')
+    parser.add_argument('--port', type=int, default=5070, help='Local SIP port of the load generator (default: 5070)')
+    parser.add_argument('--ha-port', type=int, default=18123, help='Port of the fake home-assistant receiving webhooks (default: 18123)')
+    parser.add_argument('--ha-token', default='token', help='Access token ha-sip uses for the fake home-assistant (default: token)')
+    parser.add_argument('--ha-sip-pid', type=int, default=None, help='Process id of ha-sip to sample CPU and RSS of')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Maximum duration of the test in seconds (default: 600)')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    args = parser.parse_args(argv)
+    fake_ha = FakeHa(token=args.ha_token, port=args.ha_port).start()
+    generator = LoadGenerator(args)
+    generator.create_endpoint()
+    samplers = {'load_generator': ProcessSampler(os.getpid()).start()}
+    if args.ha_sip_pid:
+        samplers['ha_sip'] = ProcessSampler(args.ha_sip_pid).start()
+    duration = generator.run(args.timeout)
+    # give the last webhooks a moment to arrive
+    time.sleep(1)
+    results = generator.report(duration, fake_ha)
+    results['processes'] = {name: sampler.stop() for name, sampler in samplers.items()}
+    fake_ha.stop()
+    output = json.dumps({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if generator.end_point:
+        generator.end_point.libDestroy()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_load_generator(sys.argv[1:]))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Replays a trace recorded with --trace-file through CommandHandler and Call against a fake pjsua2 module and a fake
+home-assistant, in real time or as fast as possible, and reports how long handling each record took and whether the
+same events were sent as in the recording.
+
+Usage: replay.py trace.jsonl [--speed 0] [--incoming-call-file menu.yaml] [--compare baseline.json] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from benchmarks import fake_pjsua2  # noqa: E402
+
+fake_pjsua2.install()
+
+import account  # noqa: E402, F401
+import call  # noqa: E402
+import cdr  # noqa: E402
+import ha  # noqa: E402
+import main  # noqa: E402
+import trace_recorder  # noqa: E402
+from benchmarks import fixtures  # noqa: E402
+from benchmarks.fake_ha import FakeHa  # noqa: E402
+from command_handler import CommandHandler  # noqa: E402
+from event_sender import EventSender  # noqa: E402
+from log import LogLevel, configure_logging  # noqa: E402
+
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    sorted_latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'total_ms': round(sum(latencies) * 1000, 3),
+        'p50_ms': round((cdr.percentile(sorted_latencies, 50) or 0.0) * 1000, 3),
+        'p95_ms': round((cdr.percentile(sorted_latencies, 95) or 0.0) * 1000, 3),
+        'max_ms': round((sorted_latencies[-1] if sorted_latencies else 0.0) * 1000, 3),
+    }
+
+
+def event_name(event: Any) -> str:
+    return str(event.get('event')) if isinstance(event, dict) else type(event).__name__
+
+
+class Replay(object):
+    def __init__(self, command_handler: CommandHandler, incoming_call_file: Optional[str]):
+        self.command_handler = command_handler
+        self.incoming_call_file = incoming_call_file
+        self.command_client = fixtures.FakeCommandClient()
+        self.recorded_events: collections.Counter[str] = collections.Counter()
+        self.replayed_events: collections.Counter[str] = collections.Counter()
+        self.records: collections.Counter[str] = collections.Counter()
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.loop_latencies: List[float] = []
+        self.lag: List[float] = []
+        self.unknown_calls = 0
+        command_handler.event_sender.register_sender(lambda event, webhook_id: self.replayed_events.update([event_name(event)]))
+
+    def get_account(self, index: int, settings: Optional[Dict[str, Any]] = None) -> account.Account:
+        sip_account = self.command_handler.sip_accounts.get(index)
+        if sip_account:
+            return sip_account
+        settings = settings or {}
+        return fixtures.create_account(
+            self.command_handler,
+            index,
+            settle_time=float(settings.get('settle_time') or 0.0),
+            mode=call.CallHandling.get_or_else(settings.get('mode'), call.CallHandling.ACCEPT),
+            incoming_call_config=main.load_menu_from_file(self.incoming_call_file, index),
+        )
+
+    def get_call(self, record: Dict[str, Any]) -> Optional[call.Call]:
+        sip_call = self.command_handler.call_state.get_call(str(record.get('call')))
+        if not sip_call:
+            self.unknown_calls += 1
+        return sip_call
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        kind = record.get('k')
+        if kind == 'start':
+            for index, settings in (record.get('accounts') or {}).items():
+                self.get_account(int(index), settings)
+        elif kind == 'command':
+            self.command_handler.handle_command(record['command'], None)
+        elif kind == 'incoming_call':
+            self.get_account(int(record['account'])).simulate_incoming_call(
+                record['remote_uri'], record['local_uri'], record['sip_call_id'], record.get('message') or '',
+            )
+        elif kind == 'call_state':
+            sip_call = self.get_call(record)
+            if sip_call:
+                sip_call.fake_info.callIdString = record.get('sip_call_id') or sip_call.fake_info.callIdString
+                sip_call.simulate_state(int(record['state']), int(record.get('status_code') or 0))
+        elif kind == 'media_state':
+            sip_call = self.get_call(record)
+            if sip_call:
+                sip_call.simulate_media_state(record.get('status') or [])
+        elif kind == 'dtmf':
+            sip_call = self.get_call(record)
+            if sip_call:
+                sip_call.simulate_dtmf(record['digit'])
+        elif kind == 'playback_done':
+            sip_call = self.get_call(record)
+            if sip_call and sip_call.player:
+                sip_call.player.onEof2()
+        elif kind == 'event':
+            self.recorded_events.update([event_name(record.get('event'))])
+
+    def run_loop_iteration(self) -> None:
+        start = time.perf_counter()
+        main.run_loop_iteration(
+            self.command_handler.end_point, None, self.command_client, self.command_handler, self.command_handler.call_state, None,  # type: ignore[arg-type]
+        )
+        self.loop_latencies.append(time.perf_counter() - start)
+
+    def run(self, records: List[Dict[str, Any]], speed: float) -> None:
+        start = time.perf_counter()
+        for record in records:
+            kind = str(record.get('k'))
+            if speed:
+                due = start + float(record.get('t') or 0.0) / speed
+                while time.perf_counter() < due:
+                    self.run_loop_iteration()
+                    time.sleep(min(max(due - time.perf_counter(), 0.0), 0.01))
+                self.lag.append(time.perf_counter() - due)
+            self.records.update([kind])
+            if kind == 'event':
+                self.apply(record)
+                continue
+            record_start = time.perf_counter()
+            self.apply(record)
+            self.latencies[kind].append(time.perf_counter() - record_start)
+            # in ha-sip the callbacks and commands are always followed by handle_events of all calls
+            self.run_loop_iteration()
+
+    def report(self, duration: float, trace_duration: float) -> Dict[str, Any]:
+        event_names = sorted(set(self.recorded_events) | set(self.replayed_events))
+        return {
+            'duration_seconds': round(duration, 3),
+            'trace_duration_seconds': round(trace_duration, 3),
+            'records': dict(self.records),
+            'processing_seconds': round(sum(sum(latencies) for latencies in self.latencies.values()) + sum(self.loop_latencies), 6),
+            'processing': {kind: summarize(latencies) for kind, latencies in self.latencies.items()},
+            'loop_iteration': summarize(self.loop_latencies),
+            'lag': summarize(self.lag) if self.lag else None,
+            'unknown_calls': self.unknown_calls,
+            'events': {
+                'recorded': dict(self.recorded_events),
+                'replayed': dict(self.replayed_events),
+                'mismatches': [name for name in event_names if self.recorded_events[name] != self.replayed_events[name]],
+            },
+        }
+
+
+def compare(results: Dict[str, Any], baseline_file: str, max_regression: float) -> bool:
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+    ratio = results['processing_seconds'] / baseline['processing_seconds'] if baseline['processing_seconds'] else 1.0
+    results['baseline_processing_seconds'] = baseline['processing_seconds']
+    results['ratio'] = round(ratio, 3)
+    if ratio > max_regression:
+        print(f'Regression: {baseline["processing_seconds"]}s -> {results["processing_seconds"]}s ({ratio:.2f}x)', file=sys.stderr)
+        return False
+    return True
+
+
+def main_replay(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='replay')
+    parser.add_argument('trace_file', help='Trace recorded with the --trace-file option of ha-sip')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed relative to the recording, 0 for as fast as possible (default: 1)')
+    parser.add_argument('--incoming-call-file', default=None, help='Incoming call configuration used for all accounts (default: None)')
+    parser.add_argument('--drain', type=float, default=1.0, help='Seconds to keep running the main loop after the last record (default: 1)')
+    parser.add_argument('--strict', action='store_true', help='Fail if the replay sent other events than the recording')
+    parser.add_argument('--compare', default=None, help='JSON results of an earlier replay to compare the processing time with')
+    parser.add_argument('--max-regression', type=float, default=1.25, help='Fail when the processing time grew by this factor (default: 1.25)')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    args = parser.parse_args(argv)
+    configure_logging(LogLevel.ERROR, {}, False)
+    records = list(trace_recorder.read(args.trace_file))
+    fake_ha = FakeHa().start()
+    cache_dir = tempfile.mkdtemp(prefix='ha-sip-replay-')
+    try:
+        ha_config = ha.HaConfig(fake_ha.base_url, fake_ha.websocket_url, fake_ha.token, fixtures.TTS_CONFIG, 'replay', cache_dir)
+        replay = Replay(fixtures.create_command_handler(ha_config, EventSender()), args.incoming_call_file)
+        start = time.perf_counter()
+        replay.run(records, args.speed)
+        drain_until = time.perf_counter() + args.drain
+        while time.perf_counter() < drain_until:
+            replay.run_loop_iteration()
+            time.sleep(0.01)
+        results = replay.report(time.perf_counter() - start, float(records[-1].get('t') or 0.0) if records else 0.0)
+    finally:
+        fake_ha.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    ok = compare(results, args.compare, args.max_regression) if args.compare else True
+    if args.strict and results['events']['mismatches']:
+        print(f'Events differ from the recording: {", ".join(results["events"]["mismatches"])}', file=sys.stderr)
+        ok = False
+    output = json.dumps({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'trace_file': args.trace_file,
+        'speed': args.speed,
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_replay(sys.argv[1:]))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the Python hot paths of ha-sip, running against a fake pjsua2 module.
+
+Usage: run.py [--output results.json] [--compare baseline.json] [--filter name]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from benchmarks import fake_pjsua2  # noqa: E402
+
+fake_pjsua2.install()
+
+import account  # noqa: E402
+import call  # noqa: E402
+import main  # noqa: E402
+import state  # noqa: E402
+import webhook  # noqa: E402
+from benchmarks import fixtures  # noqa: E402
+from log import LogLevel, configure_logging  # noqa: E402
+from number_matcher import NumberMatcher  # noqa: E402
+from sip_headers import SipHeaders  # noqa: E402
+
+Benchmark = Callable[[], Any]
+
+MIN_MEASURE_TIME = 0.2
+REPEAT = 5
+
+
+def bench_normalize_menu() -> Benchmark:
+    sip_call = fixtures.create_call()
+    menu = fixtures.create_large_menu(depth=3, width=10)
+
+    def run():
+        normalized = sip_call.normalize_menu(menu)
+        call.Call.create_menu_map(normalized)
+    return run
+
+
+def bench_dtmf_pin_menu() -> Benchmark:
+    sip_call = fixtures.create_call()
+    pin_menu = sip_call.normalize_menu(fixtures.create_pin_menu(10000))
+    pin = fixtures.pin(9876)
+
+    def run():
+        sip_call.menu = pin_menu
+        sip_call.current_input = ''
+        for digit in pin:
+            sip_call.handle_dtmf_digit(digit)
+    return run
+
+
+def bench_number_in_blocklist() -> Benchmark:
+    block_list = fixtures.create_number_list(10000)
+
+    def run():
+        account.Account.is_number_in_list('+4930999999999', block_list)
+    return run
+
+
+def bench_number_matcher() -> Benchmark:
+    matcher = NumberMatcher(fixtures.create_number_list(10000))
+
+    def run():
+        matcher.matches('+4930999999999')
+    return run
+
+
+def bench_resolve_callback_id() -> Benchmark:
+    call_state = state.create()
+    for index in range(1000):
+        call_state.register_call(f'sip:caller{index}@fake.invalid', fixtures.FAKE_CALL, [f'caller{index}', f'fake-call-{index}'])
+
+    def run():
+        call_state.resolve_callback_id('fake-call-999')
+    return run
+
+
+def bench_parse_sip_headers() -> Benchmark:
+    message = fixtures.create_sip_message()
+
+    def run():
+        SipHeaders(message).extract(['X-Caller-Name', 'P-Asserted-Identity', 'User-Agent'])
+    return run
+
+
+def bench_trigger_webhook() -> Benchmark:
+    sip_call = fixtures.create_call()
+    call_info = sip_call.get_call_info()
+    event_sender = fixtures.create_event_sender()
+
+    def run():
+        webhook.trigger_webhook({'event': 'dtmf_digit', 'digit': '5'}, call_info, 1, sip_call.callback_id, event_sender)
+    return run
+
+
+def bench_main_loop_iteration() -> Benchmark:
+    command_handler = fixtures.create_command_handler()
+    for _ in range(50):
+        fixtures.create_call(command_handler, connected=True)
+    command_client = fixtures.FakeCommandClient()
+
+    def run():
+        main.run_loop_iteration(command_handler.end_point, None, command_client, command_handler, command_handler.call_state, None)  # type: ignore[arg-type]
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[], Benchmark]] = {
+    'normalize_menu_1110_entries': bench_normalize_menu,
+    'handle_dtmf_digit_10000_pins': bench_dtmf_pin_menu,
+    'is_number_in_list_10000_entries': bench_number_in_blocklist,
+    'number_matcher_10000_entries': bench_number_matcher,
+    'resolve_callback_id_1000_calls': bench_resolve_callback_id,
+    'parse_sip_headers': bench_parse_sip_headers,
+    'trigger_webhook': bench_trigger_webhook,
+    'main_loop_iteration_50_calls': bench_main_loop_iteration,
+}
+
+
+def measure(benchmark: Benchmark) -> Dict[str, Any]:
+    """Finds a number of iterations taking at least MIN_MEASURE_TIME, then measures REPEAT times."""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            benchmark()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_MEASURE_TIME:
+            break
+        iterations *= 10 if elapsed < MIN_MEASURE_TIME / 10 else 2
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            benchmark()
+        timings.append((time.perf_counter() - start) / iterations * 1e6)
+    return {
+        'iterations': iterations,
+        'repeat': REPEAT,
+        'min_us': round(min(timings), 3),
+        'median_us': round(statistics.median(timings), 3),
+        'max_us': round(max(timings), 3),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline_file: str, max_regression: float) -> bool:
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+    ok = True
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['min_us'] / baseline[name]['min_us'] if baseline[name]['min_us'] else 1.0
+        result['baseline_min_us'] = baseline[name]['min_us']
+        result['ratio'] = round(ratio, 3)
+        if ratio > max_regression:
+            print(f'Regression in {name}: {baseline[name]["min_us"]}us -> {result["min_us"]}us ({ratio:.2f}x)', file=sys.stderr)
+            ok = False
+    return ok
+
+
+def run(name_filter: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, create_benchmark in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(create_benchmark())
+        print(f'{name}: {results[name]["min_us"]}us', file=sys.stderr)
+    return results
+
+
+def main_benchmarks(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='benchmarks')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    parser.add_argument('--compare', default=None, help='JSON results of an earlier run to compare with')
+    parser.add_argument('--max-regression', type=float, default=1.25, help='Fail when a benchmark is slower by this factor (default: 1.25)')
+    parser.add_argument('--filter', default=None, help='Only run benchmarks containing this string')
+    args = parser.parse_args(argv)
+    configure_logging(LogLevel.ERROR, {}, False)
+    results = run(args.filter)
+    ok = compare(results, args.compare, args.max_regression) if args.compare else True
+    output = json.dumps({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmarks(sys.argv[1:]))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Soak test of the call lifecycle against a fake pjsua2 module: cycles many simulated calls through registration, menus,
+playback, recording, DTMF and disconnect, and fails if live Call objects, memory, file descriptors or temporary WAV
+files keep growing.
+
+Usage: soak.py [--calls 20000] [--concurrency 20] [--sample-every 1000] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from benchmarks import fake_pjsua2  # noqa: E402
+
+fake_pjsua2.install()
+
+import account  # noqa: E402, F401
+import audio_cache  # noqa: E402
+import call  # noqa: E402
+import cdr  # noqa: E402
+import ha  # noqa: E402
+import main  # noqa: E402
+import player  # noqa: E402
+import timeline  # noqa: E402
+from benchmarks import fixtures  # noqa: E402
+from benchmarks.fake_ha import FakeHa, create_wav  # noqa: E402
+from command_handler import CommandHandler  # noqa: E402
+from log import LogLevel, configure_logging  # noqa: E402
+
+CACHED_MESSAGES = ['Welcome', 'Your account balance is zero', 'Goodbye']
+
+
+def create_soak_menu(tts: bool) -> call.MenuFromStdin:
+    menu: Any = {
+        'id': 'main',
+        'message': CACHED_MESSAGES[0],
+        'cache_audio': True,
+        'choices': {
+            '1': {'id': 'balance', 'message': CACHED_MESSAGES[1], 'cache_audio': True, 'post_action': 'return'},
+            # not cached, goes through the fake home-assistant and ffmpeg, creating and deleting a temporary WAV
+            '2': {'id': 'tts', 'message': 'Generated prompt', 'cache_audio': False, 'post_action': 'return'} if tts else {'id': 'tts'},
+            '9': {'id': 'goodbye', 'message': CACHED_MESSAGES[2], 'cache_audio': True, 'post_action': 'hangup'},
+        },
+    }
+    return menu
+
+
+def finish_playback(sip_call: call.Call) -> None:
+    if sip_call.player:
+        sip_call.player.onEof2()
+
+
+def run_call_batch(command_handler: CommandHandler, menu: call.MenuFromStdin, count: int, recording_dir: str, tts: bool) -> None:
+    """Moves count concurrent calls through all stages of their lifecycle, one stage at a time."""
+    loop = lambda: main.run_loop_iteration(command_handler.end_point, None, fixtures.FakeCommandClient(), command_handler, command_handler.call_state, None)  # type: ignore[arg-type] # noqa: E731
+    calls = [fixtures.create_call(command_handler, menu) for _ in range(count)]
+    for sip_call in calls:
+        sip_call.accept(call.CallHandling.ACCEPT, 0)
+        sip_call.simulate_state(fake_pjsua2.PJSIP_INV_STATE_EARLY)
+    loop()
+    for index, sip_call in enumerate(calls):
+        sip_call.simulate_state(fake_pjsua2.PJSIP_INV_STATE_CONFIRMED)
+        sip_call.simulate_media_active()
+        sip_call.start_recording(os.path.join(recording_dir, f'recording-{index}.wav'))
+    loop()
+    for digits in ['1', '2' if tts else '', '9']:
+        for sip_call in calls:
+            finish_playback(sip_call)
+            for digit in digits:
+                sip_call.simulate_dtmf(digit)
+        loop()
+        loop()
+    for sip_call in calls:
+        finish_playback(sip_call)
+        sip_call.stop_recording()
+        sip_call.simulate_state(fake_pjsua2.PJSIP_INV_STATE_DISCONNECTED)
+
+
+def read_rss_kib() -> Optional[int]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def count_open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def take_sample(calls_done: int, command_handler: CommandHandler, cdr_store: Optional[cdr.CdrStore]) -> Dict[str, Any]:
+    if cdr_store:
+        cdr_store.writer.flush()
+    if timeline.timeline_writer:
+        timeline.timeline_writer.writer.flush()
+    gc.collect()
+    objects = gc.get_objects()
+    return {
+        'calls': calls_done,
+        'live_calls': sum(1 for o in objects if isinstance(o, call.Call)),
+        'live_players': sum(1 for o in objects if isinstance(o, player.Player)),
+        'registered_calls': len(command_handler.call_state.current_call_dict) + len(command_handler.call_state.alt_id_map),
+        'traced_memory_bytes': tracemalloc.get_traced_memory()[0],
+        'rss_kib': read_rss_kib(),
+        'open_fds': count_open_fds(),
+        'temp_wavs': len(glob.glob(os.path.join(tempfile.gettempdir(), '*.wav'))),
+    }
+
+
+def check_growth(samples: List[Dict[str, Any]], warmup: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """Compares the last sample with the one taken after the warm-up and returns the list of detected leaks."""
+    final = samples[-1]
+    calls_after_warmup = max(final['calls'] - warmup['calls'], 1)
+    problems = []
+    for key in ['live_calls', 'live_players', 'registered_calls']:
+        if final[key]:
+            problems.append(f'{final[key]} {key.replace("_", " ")} left after all calls were disconnected')
+    memory_per_call = (final['traced_memory_bytes'] - warmup['traced_memory_bytes']) / calls_after_warmup
+    if memory_per_call > args.max_bytes_per_call:
+        problems.append(f'Python memory grew by {memory_per_call:.1f} bytes per call (limit {args.max_bytes_per_call})')
+    if final['rss_kib'] is not None and warmup['rss_kib'] is not None:
+        rss_per_call = (final['rss_kib'] - warmup['rss_kib']) * 1024 / calls_after_warmup
+        if rss_per_call > args.max_rss_bytes_per_call:
+            problems.append(f'RSS grew by {rss_per_call:.1f} bytes per call (limit {args.max_rss_bytes_per_call})')
+    if final['open_fds'] is not None and warmup['open_fds'] is not None and final['open_fds'] > warmup['open_fds']:
+        problems.append(f'Open file descriptors grew from {warmup["open_fds"]} to {final["open_fds"]}')
+    if final['temp_wavs'] > warmup['temp_wavs']:
+        problems.append(f'Temporary WAV files grew from {warmup["temp_wavs"]} to {final["temp_wavs"]}')
+    return problems
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, previous: tracemalloc.Snapshot, limit: int = 10) -> List[str]:
+    return [str(stat) for stat in snapshot.compare_to(previous, 'lineno')[:limit]]
+
+
+def main_soak(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='soak')
+    parser.add_argument('--calls', type=int, default=20000, help='Total number of simulated calls (default: 20000)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Number of calls active at the same time (default: 20)')
+    parser.add_argument('--sample-every', type=int, default=1000, help='Calls between two samples (default: 1000)')
+    parser.add_argument('--warmup', type=int, default=2000, help='Calls before the reference sample is taken (default: 2000)')
+    parser.add_argument('--max-bytes-per-call', type=float, default=64, help='Allowed growth of Python memory per call (default: 64)')
+    parser.add_argument('--max-rss-bytes-per-call', type=float, default=512, help='Allowed growth of RSS per call (default: 512)')
+    parser.add_argument('--tts', action=argparse.BooleanOptionalAction, default=shutil.which('ffmpeg') is not None,
+                        help='Play one uncached TTS prompt per call through the fake home-assistant and ffmpeg (default: if ffmpeg is found)')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    args = parser.parse_args(argv)
+    configure_logging(LogLevel.ERROR, {}, False)
+    fake_ha = FakeHa().start()
+    work_dir = tempfile.mkdtemp(prefix='ha-sip-soak-')
+    try:
+        cache_dir = os.path.join(work_dir, 'cache')
+        os.mkdir(cache_dir)
+        wav_file = os.path.join(work_dir, 'prompt.wav')
+        with open(wav_file, 'wb') as f:
+            f.write(create_wav(1600))
+        for message in CACHED_MESSAGES:
+            audio_cache.cache_file(True, cache_dir, 'message', message, wav_file)
+        timeline.configure_writer(os.path.join(work_dir, 'timeline.jsonl'), None, 1024 * 1024, 1)
+        cdr_store = cdr.create_store(os.path.join(work_dir, 'cdr.sqlite'))
+        ha_config = ha.HaConfig(fake_ha.base_url, fake_ha.websocket_url, fake_ha.token, fixtures.TTS_CONFIG, 'soak', cache_dir)
+        command_handler = fixtures.create_command_handler(ha_config, cdr_store=cdr_store)
+        fixtures.create_account(command_handler)
+        menu = create_soak_menu(args.tts)
+        tracemalloc.start(10)
+        samples: List[Dict[str, Any]] = []
+        warmup: Optional[Dict[str, Any]] = None
+        warmup_snapshot: Optional[tracemalloc.Snapshot] = None
+        calls_done = 0
+        start = time.perf_counter()
+        while calls_done < args.calls:
+            batch = min(args.concurrency, args.calls - calls_done)
+            run_call_batch(command_handler, menu, batch, work_dir, args.tts)
+            calls_done += batch
+            if calls_done % args.sample_every < batch or calls_done == args.calls:
+                samples.append(take_sample(calls_done, command_handler, cdr_store))
+                print(', '.join(f'{key} {value}' for key, value in samples[-1].items()), file=sys.stderr)
+                if warmup is None and calls_done >= min(args.warmup, args.calls):
+                    warmup = samples[-1]
+                    warmup_snapshot = tracemalloc.take_snapshot()
+        duration = time.perf_counter() - start
+        assert warmup is not None and warmup_snapshot is not None
+        problems = check_growth(samples, warmup, args)
+        growth = top_allocations(tracemalloc.take_snapshot(), warmup_snapshot) if problems else []
+        tracemalloc.stop()
+    finally:
+        fake_ha.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for problem in problems:
+        print(f'Leak: {problem}', file=sys.stderr)
+    output = json.dumps({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': {
+            'duration_seconds': round(duration, 3),
+            'calls_per_second': round(calls_done / duration, 1) if duration else None,
+            'warmup': warmup,
+            'samples': samples,
+            'problems': problems,
+            'top_growth_since_warmup': growth,
+        },
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_soak(sys.argv[1:]))
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import collections
 import os
 import re
 import time
@@ -13,22 +14,41 @@ from typing_extensions import TypedDict, Literal
 import account
 import audio
 import audio_cache
+import cdr
+import early_media
 import ha
+import metrics
 import player
+import timeline
+import trace_recorder
 import utils
 import webhook
 from call_state_change import CallStateChange
+from choice_trie import ChoiceTrie
 from command_client import Command
 from command_handler import CommandHandler
-from constants import DEFAULT_RING_TIMEOUT, DEFAULT_DTMF_ON, DEFAULT_DTMF_OFF
-from log import log
+from constants import DEFAULT_RING_TIMEOUT, DEFAULT_DTMF_ON, DEFAULT_DTMF_OFF, DEFAULT_INTER_DIGIT_TIMEOUT, DEFAULT_COLLECT_DIGITS_TERMINATOR
+from log import log, debug, is_enabled, LogLevel, error
 from event_sender import EventSender
+from sip_headers import SipHeaders
 from post_action import PostAction, PostActionNoop, PostActionHangup, PostActionRepeatMessage, PostActionReturn, PostActionJump
 
 CallCallback = Callable[[CallStateChange, str, 'Call'], None]
 DtmfMethod = Union[Literal['in_band'], Literal['rfc2833'], Literal['sip_info']]
 
 
+class CollectDigitsFromStdin(TypedDict):
+    max_length: Optional[int]
+    inter_digit_timeout: Optional[float]
+    terminator: Optional[str]
+
+
+class CollectDigits(TypedDict):
+    max_length: int
+    inter_digit_timeout: float
+    terminator: Optional[str]
+
+
 class MenuFromStdin(TypedDict):
     id: Optional[str]
     message: Optional[str]
@@ -40,6 +60,7 @@ class MenuFromStdin(TypedDict):
     post_action: Optional[str]
     timeout: Optional[int]
     choices: Optional[dict[Any, MenuFromStdin]]
+    collect_digits: Optional[Union[bool, CollectDigitsFromStdin]]
     cache_audio: Optional[bool]
     wait_for_audio_to_finish: Optional[bool]
 
@@ -55,13 +76,22 @@ class Menu(TypedDict):
     post_action: PostAction
     timeout: float
     choices: Optional[dict[str, Menu]]
+    choice_trie: Optional[ChoiceTrie]
     default_choice: Optional[Menu]
     timeout_choice: Optional[Menu]
     parent_menu: Optional[Menu]
+    collect_digits: Optional[CollectDigits]
     cache_audio: bool
     wait_for_audio_to_finish: bool
 
 
+class MenuDumper(yaml.Dumper):
+    pass
+
+
+MenuDumper.add_representer(ChoiceTrie, lambda dumper, trie: dumper.represent_str(repr(trie)))
+
+
 class CallHandling(Enum):
     LISTEN = 'LISTEN'
     ACCEPT = 'ACCEPT'
@@ -103,6 +133,11 @@ class Call(pj.Call):
         self.ha_config = ha_config
         self.ring_timeout = ring_timeout
         self.settle_time = sip_account.config.settle_time
+        self.settle_mode = sip_account.config.global_options.settle_mode
+        self.settle_guard_time = sip_account.config.global_options.settle_guard_time
+        self.settle_reason = 'timer'
+        self.media_active_at: Optional[float] = None
+        self.audio_media_index: Optional[int] = None
         self.webhooks: Optional[webhook.WebhookToCall] = webhooks
         self.command_handler = command_handler
         self.event_sender = event_sender
@@ -110,19 +145,39 @@ class Call(pj.Call):
         self.playback_is_done = True
         self.wait_for_audio_to_finish = False
         self.last_seen = time.time()
+        self.created_at = self.last_seen
+        self.direction = 'outgoing' if uri_to_call else 'incoming'
+        self.timeline = timeline.CallTimeline()
+        self.timeline.mark('make_call' if uri_to_call else 'invite_received')
+        self.menu_path: List[str] = []
+        self.recording_files: List[str] = []
+        self.setup_observed = False
+        self.last_digit_at: Optional[float] = None
         self.call_settled_at: Optional[float] = None
         self.answer_at: Optional[float] = None
         self.tone_gen: Optional[pj.ToneGenerator] = None
+        self.early_media_config: Optional[early_media.EarlyMediaConfig] = None
+        self.early_media_file: Optional[str] = None
+        self.early_media_ringback = False
+        self.early_media_player: Optional[player.Player] = None
+        self.ringback_generator: Optional[pj.ToneGenerator] = None
         self.call_info: Optional[webhook.CallInfo] = None
-        self.pressed_digit_list: List[str] = []
+        self.pressed_digits: collections.deque[tuple[str, float]] = collections.deque()
         self.current_playback: Optional[ha.CurrentPlayback] = None
         self.sip_headers: Dict[str, Optional[str]] = sip_headers if sip_headers is not None else {}
+        self.state_listeners: List[Callable[[Call, int, int], None]] = []
+        # set for calls cancelled by a dial group, which must not send any more web-hook events
+        self.silent = False
         self.callback_id, other_ids = self.get_callback_ids()
         self.menu = self.normalize_menu(menu) if menu else self.get_standard_menu()
         self.menu_map = self.create_menu_map(self.menu)
         Call.pretty_print_menu(self.menu)
         log(self.account.config.index, f'Registering call with id {self.callback_id}')
         self.command_handler.register_call(self.callback_id, self, other_ids)
+        metrics.ACTIVE_CALLS.inc(account=self.account.config.index)
+
+    def add_state_listener(self, listener: Callable[[Call, int, int], None]) -> None:
+        self.state_listeners.append(listener)
 
     def handle_events(self) -> None:
         if not self.connected and time.time() - self.last_seen > self.ring_timeout:
@@ -136,9 +191,15 @@ class Call(pj.Call):
             call_prm = pj.CallOpParam()
             call_prm.statusCode = 200
             self.answer(call_prm)
+            self.timeline.mark('answer_sent', status_code=200)
             return
-        if not self.connected and self.call_settled_at and self.call_settled_at < time.time():
+        # RTP is only polled while the timer is the settle point, a settle point from the media callback already includes the guard time
+        if not self.connected and self.call_settled_at and self.settle_mode == 'adaptive' and self.settle_reason == 'timer' and self.rtp_received():
+            self.call_settled_at = time.time()
+            self.settle_reason = 'rtp'
+        if not self.connected and self.call_settled_at and self.call_settled_at <= time.time():
             self.call_settled_at = None
+            self.timeline.mark('settled', reason=self.settle_reason)
             self.handle_connected_state()
             return
         if not self.connected:
@@ -148,15 +209,38 @@ class Call(pj.Call):
             self.handle_menu(self.menu['timeout_choice'])
             self.trigger_webhook({'event': 'timeout', 'menu_id': self.menu['id']})
             return
+        collect_digits = self.menu['collect_digits']
+        if collect_digits and self.last_digit_at and time.time() - self.last_digit_at > collect_digits['inter_digit_timeout']:
+            self.finish_digit_collection('inter_digit_timeout')
+        self.handle_scheduled_post_action()
+        # drain all digits received since the last loop iteration, so digit bursts are not bound to the loop frequency
+        while self.pressed_digits:
+            digit, received_at = self.pressed_digits.popleft()
+            self.handle_dtmf_digit(digit)
+            metrics.DTMF_ACTION_SECONDS.observe(time.time() - received_at)
+            self.handle_scheduled_post_action()
+
+    def settle_on_media(self) -> None:
+        if self.settle_mode != 'adaptive' or not self.call_settled_at or not self.media_active_at:
+            return
+        settled_at = max(time.time(), self.media_active_at + self.settle_guard_time)
+        if settled_at < self.call_settled_at:
+            self.call_settled_at = settled_at
+            self.settle_reason = 'media'
+
+    def rtp_received(self) -> bool:
+        if self.audio_media_index is None:
+            return False
+        try:
+            return self.getStreamStat(self.audio_media_index).rtcp.rxStat.pkt > 0
+        except Exception:
+            return False
+
+    def handle_scheduled_post_action(self) -> None:
         if self.playback_is_done and self.scheduled_post_action:
             post_action = self.scheduled_post_action
             self.scheduled_post_action = None
             self.handle_post_action(post_action)
-            return
-        if len(self.pressed_digit_list) > 0:
-            next_digit = self.pressed_digit_list.pop(0)
-            self.handle_dtmf_digit(next_digit)
-            return
 
     def handle_post_action(self, post_action: PostAction):
         log(self.account.config.index, f'Scheduled post action: {post_action["action"]}')
@@ -183,6 +267,8 @@ class Call(pj.Call):
             self.handle_menu(self.menu, send_webhook_event=False, handle_action=False, reset_input=False)
 
     def trigger_webhook(self, event: ha.WebhookEvent):
+        if self.silent:
+            return
         webhook.trigger_webhook(
             event,
             self.call_info,
@@ -191,6 +277,7 @@ class Call(pj.Call):
             self.event_sender,
             self.webhooks,
         )
+        self.timeline.mark('webhook_sent', event=event['event'])
 
     def handle_connected_state(self):
         log(self.account.config.index, 'Call is established.')
@@ -198,24 +285,34 @@ class Call(pj.Call):
         self.reset_timeout()
         self.trigger_webhook({'event': 'call_established'})
         self.handle_menu(self.menu)
+        self.stop_early_media()
 
     def onCallState(self, prm) -> None:
-        if not self.call_info:
-            self.call_info = self.get_call_info()
         ci = self.getInfo()
+        self.refresh_call_info(ci)
+        trace_recorder.record('call_state', call=self.callback_id, state=ci.state, status_code=ci.lastStatusCode, sip_call_id=ci.callIdString)
         if ci.state == pj.PJSIP_INV_STATE_EARLY:
             log(self.account.config.index, 'Early')
+            self.timeline.mark('early')
+            if not self.setup_observed:
+                self.setup_observed = True
+                metrics.CALL_SETUP_SECONDS.observe(time.time() - self.created_at, account=self.account.config.index, direction=self.direction)
         elif ci.state == pj.PJSIP_INV_STATE_CALLING:
             log(self.account.config.index, 'Calling')
         elif ci.state == pj.PJSIP_INV_STATE_CONNECTING:
             log(self.account.config.index, 'Call connecting...')
         elif ci.state == pj.PJSIP_INV_STATE_CONFIRMED:
             log(self.account.config.index, 'Call connected')
+            self.timeline.mark('confirmed')
+            metrics.CALL_ANSWER_SECONDS.observe(time.time() - self.created_at, account=self.account.config.index, direction=self.direction)
             self.extract_headers_from_response(prm)
             self.call_settled_at = time.time() + self.settle_time
+            if self.media_active_at:
+                self.settle_on_media()
         elif ci.state == pj.PJSIP_INV_STATE_DISCONNECTED:
             log(self.account.config.index, 'Call disconnected')
             self.stop_recording()
+            self.stop_early_media()
             self.trigger_webhook({'event': 'call_disconnected'})
             self.connected = False
             self.current_input = ''
@@ -223,52 +320,98 @@ class Call(pj.Call):
             self.audio_media = None
             self.tone_gen = None
             self.command_handler.forget_call(self.callback_id)
+            metrics.ACTIVE_CALLS.dec(account=self.account.config.index)
+            self.timeline.mark('disconnected', status_code=ci.lastStatusCode)
+            self.write_timeline()
+            self.command_handler.add_call_detail_record(self.get_call_detail_record(ci.lastStatusCode))
         else:
             log(self.account.config.index, f'Unknown state: {ci.state}')
+        for listener in self.state_listeners:
+            listener(self, ci.state, ci.lastStatusCode)
 
     def onCallMediaState(self, prm) -> None:
         call_info = self.getInfo()
+        self.refresh_call_info(call_info)
         log(self.account.config.index, f'onCallMediaState call info state {call_info.state}')
+        trace_recorder.record('media_state', call=self.callback_id, status=[media.status for media in call_info.media if media.type == pj.PJMEDIA_TYPE_AUDIO])
         for media_index, media in enumerate(call_info.media):
             if media.type == pj.PJMEDIA_TYPE_AUDIO and (media.status == pj.PJSUA_CALL_MEDIA_ACTIVE or media.status == pj.PJSUA_CALL_MEDIA_REMOTE_HOLD):
                 log(self.account.config.index, f'Connected media {media.status}')
+                self.timeline.mark('media_active', status=media.status)
                 self.audio_media = self.getAudioMedia(media_index)
+                self.audio_media_index = media_index
+                if not self.connected and (self.early_media_file or self.early_media_ringback):
+                    self.start_early_media()
+                if not self.media_active_at:
+                    self.media_active_at = time.time()
+                    if self.call_settled_at:
+                        self.settle_on_media()
                 if self.requested_recording_filename and not self.recorder:
                     self.start_recording(self.requested_recording_filename)
 
     def onDtmfDigit(self, prm: pj.OnDtmfDigitParam) -> None:
+        trace_recorder.record('dtmf', call=self.callback_id, digit=prm.digit)
         if not self.playback_is_done and self.wait_for_audio_to_finish:
             self.reset_timeout()
             return
         self.stop_playback()
         self.reset_timeout()
-        self.pressed_digit_list.append(prm.digit)
+        self.pressed_digits.append((prm.digit, time.time()))
+        self.timeline.mark('dtmf', digit=prm.digit)
 
     def handle_dtmf_digit(self, pressed_digit: str) -> None:
-        log(self.account.config.index, f'onDtmfDigit: digit {pressed_digit}')
+        debug(self.account.config.index, 'onDtmfDigit: digit %s', pressed_digit)
+        if self.menu and self.menu['collect_digits']:
+            self.handle_collected_digit(pressed_digit, self.menu['collect_digits'])
+            return
         self.trigger_webhook({'event': 'dtmf_digit', 'digit': pressed_digit})
         if not self.menu:
             return
         self.current_input += pressed_digit
-        log(self.account.config.index, f'Current input: {self.current_input}')
+        debug(self.account.config.index, 'Current input: %s', self.current_input)
         choices = self.menu.get('choices')
-        if choices is not None:
+        choice_trie = self.menu.get('choice_trie')
+        if choices is not None and choice_trie is not None:
             if self.current_input in choices:
                 self.handle_menu(choices[self.current_input])
                 return
             if self.menu.get('choices_are_pin'):
                 # in PIN mode the error message will play if the input has same length than the longest PIN
-                max_choice_length = max(map(lambda choice: len(choice), choices))
-                if len(self.current_input) == max_choice_length:
+                if len(self.current_input) == choice_trie.max_length:
                     log(self.account.config.index, f'No PIN matched {self.current_input}')
                     self.handle_menu(self.menu['default_choice'])
             else:
                 # in normal mode the error will play as soon as the input does not match any choice
-                still_valid = any(map(lambda choice: choice.startswith(self.current_input), choices))
+                still_valid = choice_trie.is_prefix(self.current_input)
                 if not still_valid:
                     log(self.account.config.index, f'Invalid input {self.current_input}')
                     self.handle_menu(self.menu['default_choice'])
 
+    def handle_collected_digit(self, pressed_digit: str, collect_digits: CollectDigits) -> None:
+        if pressed_digit == collect_digits['terminator']:
+            # a terminator without any input is ignored, the menu timeout still applies
+            if self.current_input:
+                self.finish_digit_collection('terminator')
+            return
+        self.current_input += pressed_digit
+        self.last_digit_at = time.time()
+        if collect_digits['max_length'] and len(self.current_input) >= collect_digits['max_length']:
+            self.finish_digit_collection('max_length')
+
+    def finish_digit_collection(self, reason: ha.DigitsCollectedReason) -> None:
+        digits = self.current_input
+        self.current_input = ''
+        self.last_digit_at = None
+        log(self.account.config.index, f'Collected digits: {digits} ({reason})')
+        self.trigger_webhook({'event': 'digits_collected', 'digits': digits, 'menu_id': self.menu['id'], 'reason': reason})
+        choices = self.menu['choices']
+        if not choices:
+            return
+        if digits in choices:
+            self.handle_menu(choices[digits])
+        else:
+            self.handle_menu(self.menu['default_choice'])
+
     def onCallTransferRequest(self, prm):
         log(self.account.config.index, 'onCallTransferRequest')
 
@@ -301,9 +444,11 @@ class Call(pj.Call):
         self.menu = menu
         menu_id = menu['id']
         if menu_id and send_webhook_event:
+            self.menu_path.append(menu_id)
             self.trigger_webhook({'event': 'entered_menu', 'menu_id': menu_id})
         if reset_input:
             self.current_input = ''
+            self.last_digit_at = None
         message = menu['message']
         handle_as_template = menu['handle_as_template']
         audio_file = menu['audio_file']
@@ -330,26 +475,33 @@ class Call(pj.Call):
 
     def play_message(self, message: str, language: str, should_cache: bool, wait_for_audio_to_finish: bool) -> None:
         log(self.account.config.index, f'Playing message: {message}')
-        cached_file = audio_cache.get_cached_file(should_cache, self.ha_config.cache_dir, 'message', message)
+        if self.continue_early_media('message', message, wait_for_audio_to_finish):
+            return
+        cached_file = audio_cache.get_cached_file(should_cache or self.is_early_media_prompt('message', message), self.ha_config.cache_dir, 'message', message)
+        self.timeline.mark('prompt_requested', type='message', cached=cached_file is not None)
         if cached_file:
             self.set_current_playback({'type': 'message', 'message': message})
             self.play_wav_file(cached_file, False, wait_for_audio_to_finish)
             return
-        sound_file_name, must_be_deleted, was_successful = ha.create_and_get_tts(self.ha_config, message, language)
+        sound_file_name, must_be_deleted, was_successful = ha.create_and_get_tts(self.ha_config, message, language, self.timeline)
         self.set_current_playback({'type': 'message', 'message': message})
         audio_cache.cache_file(should_cache and was_successful, self.ha_config.cache_dir, 'message', message, sound_file_name)
         self.play_wav_file(sound_file_name, must_be_deleted, wait_for_audio_to_finish)
 
     def play_audio_file(self, audio_file: str, should_cache: bool, wait_for_audio_to_finish: bool) -> None:
         log(self.account.config.index, f'Playing audio file: {audio_file}')
-        cached_file = audio_cache.get_cached_file(should_cache, self.ha_config.cache_dir, 'audio_file', audio_file)
+        if self.continue_early_media('audio_file', audio_file, wait_for_audio_to_finish):
+            return
+        use_cache = should_cache or self.is_early_media_prompt('audio_file', audio_file)
+        cached_file = audio_cache.get_cached_file(use_cache, self.ha_config.cache_dir, 'audio_file', audio_file)
+        self.timeline.mark('prompt_requested', type='audio_file', cached=cached_file is not None)
         if cached_file:
             self.set_current_playback({'type': 'audio_file', 'audio_file': audio_file})
             self.play_wav_file(cached_file, False, wait_for_audio_to_finish)
             return
         file_format = audio.audio_format_from_filename(audio_file)
         if not file_format:
-            log(None, f'Error getting audio format from filename: {audio_file}')
+            error(None, 'Error getting audio format from filename: %s', audio_file)
             return
         with open(audio_file, 'rb') as f:
             audio_file_content = f.read()
@@ -357,6 +509,7 @@ class Call(pj.Call):
         if not sound_file_name:
             log(None, f'Could not convert to wav: {audio_file}')
             return
+        self.timeline.mark('transcoded', format=file_format.value)
         self.set_current_playback({'type': 'audio_file', 'audio_file': audio_file})
         audio_cache.cache_file(should_cache, self.ha_config.cache_dir, 'audio_file', audio_file, sound_file_name)
         self.play_wav_file(sound_file_name, True, wait_for_audio_to_finish)
@@ -367,6 +520,7 @@ class Call(pj.Call):
             self.wait_for_audio_to_finish = wait_for_audio_to_finish
             self.player = player.Player(self.on_playback_done)
             self.player.play_file(self.audio_media, sound_file_name)
+            self.timeline.mark('playback_started')
         else:
             log(self.account.config.index, 'Audio media not connected. Cannot play audio stream!')
         if must_be_deleted:
@@ -374,6 +528,7 @@ class Call(pj.Call):
 
     def on_playback_done(self) -> None:
         log(self.account.config.index, 'Playback done.')
+        trace_recorder.record('playback_done', call=self.callback_id)
         if self.current_playback and self.current_playback['type'] == 'audio_file':
             self.trigger_webhook({'event': 'playback_done', 'type': 'audio_file', 'audio_file': self.current_playback['audio_file']})
         elif self.current_playback and self.current_playback['type'] == 'message':
@@ -402,7 +557,7 @@ class Call(pj.Call):
             try:
                 self.audio_media.startTransmit(self.recorder)
             except Exception as e:
-                log(self.account.config.index, f'Error: Could not reattach recorder: {e}')
+                error(self.account.config.index, 'Error: Could not reattach recorder: %s', e)
             return
         if not self.audio_media:
             log(self.account.config.index, 'Audio media not connected yet. Recording will start once media is available')
@@ -412,17 +567,18 @@ class Call(pj.Call):
         target_file = record_filename
         target_dir = os.path.dirname(target_file)
         if not os.path.isdir(target_dir):
-            log(self.account.config.index, f'Error: Call recordings directory not found: {target_dir}')
+            error(self.account.config.index, 'Error: Call recordings directory not found: %s', target_dir)
             return
         self.recorder = pj.AudioMediaRecorder()
         try:
             self.recorder.createRecorder(target_file)
             self.audio_media.startTransmit(self.recorder)
         except Exception as e:
-            log(self.account.config.index, f'Error: Failed to start call recording: {e}')
+            error(self.account.config.index, 'Error: Failed to start call recording: %s', e)
             self.stop_recording()
             return
         self.recording_file = target_file
+        self.recording_files.append(target_file)
         log(self.account.config.index, f'Call recording started: {target_file}')
         assert self.call_info is not None
         self.trigger_webhook({'event': 'recording_started', 'recording_file': self.recording_file})
@@ -435,7 +591,7 @@ class Call(pj.Call):
             if self.audio_media:
                 self.audio_media.stopTransmit(self.recorder)
         except Exception as e:
-            log(self.account.config.index, f'Error: Failed to stop call recording: {e}')
+            error(self.account.config.index, 'Error: Failed to stop call recording: %s', e)
         if self.recording_file:
             log(self.account.config.index, f'Call recording stopped: {self.recording_file}')
             assert self.call_info is not None
@@ -443,13 +599,77 @@ class Call(pj.Call):
         self.recorder = None
         self.recording_file = None
 
-    def accept(self, answer_mode: CallHandling, answer_after: float) -> None:
+    def accept(
+        self,
+        answer_mode: CallHandling,
+        answer_after: float,
+        early_media_config: Optional[early_media.EarlyMediaConfig] = None,
+        early_media_file: Optional[str] = None,
+    ) -> None:
         call_prm = pj.CallOpParam()
-        call_prm.statusCode = 180
+        early_media_ringback = bool(early_media_config and early_media_config.get('ringback'))
+        if early_media_config and (early_media_file or early_media_ringback):
+            # 183 session progress with SDP, the prompt starts as soon as the media is active
+            self.early_media_config = early_media_config
+            self.early_media_file = early_media_file
+            self.early_media_ringback = early_media_ringback
+            call_prm.statusCode = 183
+        else:
+            call_prm.statusCode = 180
         self.answer(call_prm)
+        self.timeline.mark('ringing_sent', status_code=call_prm.statusCode)
         if answer_mode == CallHandling.ACCEPT:
             self.answer_at = time.time() + answer_after
 
+    def start_early_media(self) -> None:
+        if not self.audio_media or self.early_media_player or self.ringback_generator:
+            return
+        if self.early_media_file:
+            log(self.account.config.index, 'Playing early media prompt')
+            self.early_media_player = player.Player(self.on_early_media_done)
+            self.early_media_player.play_file(self.audio_media, self.early_media_file)
+            self.timeline.mark('early_media_started', type='prompt')
+        elif self.early_media_ringback:
+            log(self.account.config.index, 'Playing ringback tone as early media')
+            self.ringback_generator = early_media.create_ringback_generator(self.audio_media)
+            self.timeline.mark('early_media_started', type='ringback')
+
+    def on_early_media_done(self) -> None:
+        self.early_media_player = None
+        self.early_media_file = None
+        if not self.connected and self.early_media_ringback:
+            self.start_early_media()
+
+    def is_early_media_prompt(self, prompt_type: Literal['message', 'audio_file'], message_or_audio_file: str) -> bool:
+        return bool(self.early_media_config and self.early_media_config.get(prompt_type) == message_or_audio_file)
+
+    def continue_early_media(self, prompt_type: Literal['message', 'audio_file'], message_or_audio_file: str, wait_for_audio_to_finish: bool) -> bool:
+        """Hands the early media prompt still playing over to the menu, if the menu starts with the same prompt."""
+        if not self.early_media_player or not self.is_early_media_prompt(prompt_type, message_or_audio_file):
+            return False
+        log(self.account.config.index, 'Continuing early media prompt')
+        self.timeline.mark('prompt_requested', type=prompt_type, cached=True, early_media=True)
+        if prompt_type == 'message':
+            self.set_current_playback({'type': 'message', 'message': message_or_audio_file})
+        else:
+            self.set_current_playback({'type': 'audio_file', 'audio_file': message_or_audio_file})
+        self.player = self.early_media_player
+        self.player.playback_done_callback = self.on_playback_done
+        self.early_media_player = None
+        self.playback_is_done = False
+        self.wait_for_audio_to_finish = wait_for_audio_to_finish
+        return True
+
+    def stop_early_media(self) -> None:
+        if self.early_media_player and self.audio_media:
+            self.early_media_player.stopTransmit(self.audio_media)
+        if self.ringback_generator and self.audio_media:
+            self.ringback_generator.stopTransmit(self.audio_media)
+        self.early_media_player = None
+        self.ringback_generator = None
+        self.early_media_file = None
+        self.early_media_ringback = False
+
     def hangup_call(self) -> None:
         log(self.account.config.index, 'Hang-up.')
         call_prm = pj.CallOpParam(True)
@@ -514,17 +734,31 @@ class Call(pj.Call):
         return call_info['remote_uri'], [x for x in [call_info['parsed_caller'], call_info['call_id']] if x is not None]
 
     def get_call_info(self) -> webhook.CallInfo:
-        ci = self.getInfo()
-        parsed_caller = self.parse_caller(ci.remoteUri)
-        parsed_called = self.parse_caller(ci.localUri)
-        return {
+        """
+        Returns the snapshot, and takes it first if there is none yet. A snapshot of an outgoing call taken before
+        makeCall is replaced by the first callback, as the remote URI changes then.
+        """
+        return self.call_info or self.refresh_call_info(self.getInfo())
+
+    def refresh_call_info(self, ci: pj.CallInfo) -> webhook.CallInfo:
+        """
+        Updates the call info snapshot from the CallInfo a pjsua2 callback already fetched. The caller and called are
+        only parsed again when the URIs changed. Web-hooks, the timeline and call detail records read the snapshot,
+        so they don't need to go through pjsua2 at all.
+        """
+        snapshot = self.call_info
+        if snapshot and snapshot['remote_uri'] == ci.remoteUri and snapshot['local_uri'] == ci.localUri:
+            snapshot['call_id'] = ci.callIdString
+            return snapshot
+        self.call_info = {
             'remote_uri': ci.remoteUri,
             'local_uri': ci.localUri,
-            'parsed_caller': parsed_caller,
-            'parsed_called': parsed_called,
+            'parsed_caller': self.parse_caller(ci.remoteUri),
+            'parsed_called': self.parse_caller(ci.localUri),
             'call_id': ci.callIdString,
             'headers': self.sip_headers,
         }
+        return self.call_info
 
     def extract_headers_from_response(self, prm) -> None:
         extract_headers = self.account.config.options.extract_headers
@@ -534,16 +768,42 @@ class Call(pj.Call):
         if self.sip_headers:
             return
         try:
-            whole_msg = prm.e.body.tsx_state.src.rdata.wholeMsg
+            parsed_headers = SipHeaders(prm.e.body.tsx_state.src.rdata.wholeMsg)
             if debug_headers:
-                account.Account.log_all_sip_headers(self.account.config.index, whole_msg)
+                parsed_headers.log_all(self.account.config.index)
             if extract_headers:
-                self.sip_headers = account.Account.parse_sip_headers(whole_msg, extract_headers)
+                self.sip_headers = parsed_headers.extract(extract_headers)
                 if self.call_info:
                     self.call_info['headers'] = self.sip_headers
         except (AttributeError, TypeError):
             pass
 
+    def write_timeline(self) -> None:
+        call_info = self.call_info
+        timeline.write(self.timeline, {
+            'internal_id': self.callback_id,
+            'sip_account': self.account.config.index,
+            'direction': self.direction,
+            'call_id': call_info['call_id'] if call_info else None,
+            'parsed_caller': call_info['parsed_caller'] if call_info else None,
+            'parsed_called': call_info['parsed_called'] if call_info else None,
+        })
+
+    def get_call_detail_record(self, status_code: Optional[int]) -> cdr.CallDetailRecord:
+        call_info = self.call_info
+        return cdr.create_record(
+            self.timeline,
+            self.account.config.index,
+            self.direction,
+            self.callback_id,
+            call_info['call_id'] if call_info else None,
+            call_info['parsed_caller'] if call_info else None,
+            call_info['parsed_called'] if call_info else None,
+            status_code,
+            self.menu_path,
+            self.recording_files,
+        )
+
     def reset_timeout(self):
         self.last_seen = time.time()
 
@@ -567,12 +827,23 @@ class Call(pj.Call):
                 _, *params = action.split(None)
                 jump_to = utils.safe_list_get(params, 0, '')
                 if not jump_to:
-                    log(self.account.config.index, 'Error: jump action requires a menu id as parameter')
+                    error(self.account.config.index, 'Error: jump action requires a menu id as parameter')
                 return PostActionJump(action='jump', menu_id=jump_to.strip())
             else:
                 log(self.account.config.index, f'Unknown post_action: {action}')
                 return PostActionNoop(action='noop')
 
+        def parse_collect_digits(collect_digits: Optional[Union[bool, CollectDigitsFromStdin]]) -> Optional[CollectDigits]:
+            if not collect_digits:
+                return None
+            options: Any = collect_digits if isinstance(collect_digits, dict) else {}
+            terminator = options.get('terminator', DEFAULT_COLLECT_DIGITS_TERMINATOR)
+            return {
+                'max_length': utils.convert_to_int(options.get('max_length'), 0),
+                'inter_digit_timeout': utils.convert_to_float(options.get('inter_digit_timeout'), DEFAULT_INTER_DIGIT_TIMEOUT),
+                'terminator': str(terminator) if terminator is not None else None,
+            }
+
         def normalize_choice(item: tuple[Any, MenuFromStdin], parent_menu_for_choice: Menu) -> tuple[str, Menu]:
             choice, sub_menu = item
             normalized_choice = str(choice).lower()
@@ -600,11 +871,13 @@ class Call(pj.Call):
             'action': menu.get('action'),
             'choices_are_pin': menu.get('choices_are_pin') or False,
             'choices': None,
+            'choice_trie': None,
             'default_choice': None,
             'timeout_choice': None,
             'timeout': utils.convert_to_float(menu.get('timeout'), DEFAULT_RING_TIMEOUT),
             'post_action': parse_post_action(menu.get('post_action')),
             'parent_menu': parent_menu,
+            'collect_digits': parse_collect_digits(menu.get('collect_digits')),
             'cache_audio': menu.get('cache_audio') or False,
             'wait_for_audio_to_finish': menu.get('wait_for_audio_to_finish') or False,
         }
@@ -613,6 +886,7 @@ class Call(pj.Call):
         default_choice = get_default_or_timeout_choice('default', normalized_menu)
         timeout_choice = get_default_or_timeout_choice('timeout', normalized_menu)
         normalized_menu['choices'] = normalized_choices
+        normalized_menu['choice_trie'] = ChoiceTrie(normalized_choices.keys())
         normalized_menu['default_choice'] = default_choice
         normalized_menu['timeout_choice'] = timeout_choice
         return normalized_menu
@@ -649,11 +923,13 @@ class Call(pj.Call):
             'action': None,
             'choices_are_pin': False,
             'choices': None,
+            'choice_trie': None,
             'default_choice': None,
             'timeout_choice': None,
             'post_action': PostActionReturn(action="return", level=1),
             'timeout': DEFAULT_RING_TIMEOUT,
             'parent_menu': parent_menu,
+            'collect_digits': None,
             'cache_audio': False,
             'wait_for_audio_to_finish': False
         }
@@ -669,11 +945,13 @@ class Call(pj.Call):
             'action': None,
             'choices_are_pin': False,
             'choices': None,
+            'choice_trie': None,
             'default_choice': None,
             'timeout_choice': None,
             'post_action': PostActionHangup(action="hangup"),
             'timeout': DEFAULT_RING_TIMEOUT,
             'parent_menu': parent_menu,
+            'collect_digits': None,
             'cache_audio': False,
             'wait_for_audio_to_finish': False
         }
@@ -689,11 +967,13 @@ class Call(pj.Call):
             'action': None,
             'choices_are_pin': False,
             'choices': dict(),
+            'choice_trie': ChoiceTrie(),
             'default_choice': None,
             'timeout_choice': None,
             'post_action': PostActionNoop(action="noop"),
             'timeout': DEFAULT_RING_TIMEOUT,
             'parent_menu': None,
+            'collect_digits': None,
             'cache_audio': False,
             'wait_for_audio_to_finish': False
         }
@@ -703,9 +983,11 @@ class Call(pj.Call):
 
     @staticmethod
     def pretty_print_menu(menu: Menu) -> None:
-        lines = yaml.dump(menu, sort_keys=False).split('\n')
+        if not is_enabled(LogLevel.DEBUG, __name__):
+            return
+        lines = yaml.dump(menu, Dumper=MenuDumper, sort_keys=False).split('\n')
         lines_with_pipe = map(lambda line: '| ' + line, lines)
-        print('\n'.join(lines_with_pipe))
+        debug(None, 'Menu:\n%s', '\n'.join(lines_with_pipe))
 
 
 def make_call(
@@ -721,7 +1003,13 @@ def make_call(
 ) -> Call:
     new_call = Call(ep, acc, pj.PJSUA_INVALID_ID, uri_to_call, menu, command_handler, event_sender, ha_config, ring_timeout, webhooks, {})
     call_param = pj.CallOpParam(True)
-    new_call.makeCall(uri_to_call, call_param)
+    try:
+        new_call.makeCall(uri_to_call, call_param)
+    except Exception:
+        # no state callback will follow, so the call must not stay registered
+        new_call.command_handler.forget_call(new_call.callback_id)
+        metrics.ACTIVE_CALLS.dec(account=acc.config.index)
+        raise
     return new_call
 
 
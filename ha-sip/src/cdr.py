@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import atexit
+import json
+import math
+import queue
+import sqlite3
+import time
+from typing import Dict, List, Optional, Union
+
+from typing_extensions import TypedDict, Literal
+
+from background_writer import BackgroundWriter
+from log import log, error, warning
+from timeline import CallTimeline
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cdr (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    sip_account INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    internal_id TEXT,
+    call_id TEXT,
+    parsed_caller TEXT,
+    parsed_called TEXT,
+    status_code INTEGER,
+    answered INTEGER NOT NULL,
+    setup_time REAL,
+    ring_duration REAL,
+    talk_duration REAL,
+    menu_path TEXT NOT NULL,
+    digits TEXT NOT NULL,
+    recording_files TEXT NOT NULL,
+    latencies TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cdr_started_at ON cdr (started_at);
+'''
+
+COLUMNS = (
+    'started_at', 'ended_at', 'sip_account', 'direction', 'internal_id', 'call_id', 'parsed_caller', 'parsed_called', 'status_code',
+    'answered', 'setup_time', 'ring_duration', 'talk_duration', 'menu_path', 'digits', 'recording_files', 'latencies',
+)
+
+INSERT_STATEMENT = f'INSERT INTO cdr ({", ".join(COLUMNS)}) VALUES ({", ".join("?" for _ in COLUMNS)})'
+
+
+class CallDetailRecord(TypedDict):
+    started_at: float
+    ended_at: float
+    sip_account: int
+    direction: str
+    internal_id: str
+    call_id: Optional[str]
+    parsed_caller: Optional[str]
+    parsed_called: Optional[str]
+    status_code: Optional[int]
+    answered: bool
+    setup_time: Optional[float]
+    ring_duration: float
+    talk_duration: float
+    menu_path: List[str]
+    digits: str
+    recording_files: List[str]
+    latencies: Dict[str, float]
+
+
+class CdrStatsEvent(TypedDict):
+    event: Literal['cdr_stats']
+    hours: float
+    calls: int
+    answered: int
+    calls_per_hour: float
+    setup_time_p50: Optional[float]
+    setup_time_p95: Optional[float]
+    talk_duration_total: float
+    calls_by_hour: Dict[str, int]
+
+
+class StatsRequest(object):
+    def __init__(self, hours: float):
+        self.hours = hours
+
+
+CdrWriterItem = Union[CallDetailRecord, StatsRequest]
+
+
+def create_record(
+    call_timeline: CallTimeline,
+    sip_account: int,
+    direction: str,
+    internal_id: str,
+    call_id: Optional[str],
+    parsed_caller: Optional[str],
+    parsed_called: Optional[str],
+    status_code: Optional[int],
+    menu_path: List[str],
+    recording_files: List[str],
+) -> CallDetailRecord:
+    started_at = call_timeline.started_at()
+    ended_at = call_timeline.milestones[-1][0] if call_timeline.milestones else started_at
+    confirmed_at = call_timeline.first('confirmed')
+    # setup time ends with the first sign of ringing, for calls which were answered right away with the confirmation
+    ringing_at = min(
+        (time_stamp for time_stamp in (call_timeline.first('early'), call_timeline.first('ringing_sent'), confirmed_at) if time_stamp is not None),
+        default=None,
+    )
+    return {
+        'started_at': started_at,
+        'ended_at': ended_at,
+        'sip_account': sip_account,
+        'direction': direction,
+        'internal_id': internal_id,
+        'call_id': call_id,
+        'parsed_caller': parsed_caller,
+        'parsed_called': parsed_called,
+        'status_code': status_code,
+        'answered': confirmed_at is not None,
+        'setup_time': ringing_at - started_at if ringing_at is not None else None,
+        'ring_duration': (confirmed_at if confirmed_at is not None else ended_at) - started_at,
+        'talk_duration': ended_at - confirmed_at if confirmed_at is not None else 0.0,
+        'menu_path': menu_path,
+        'digits': ''.join(str(attributes.get('digit', '')) for _, name, attributes in call_timeline.milestones if name == 'dtmf'),
+        'recording_files': recording_files,
+        'latencies': call_timeline.offsets(),
+    }
+
+
+def to_row(record: CallDetailRecord) -> tuple:
+    return (
+        record['started_at'],
+        record['ended_at'],
+        record['sip_account'],
+        record['direction'],
+        record['internal_id'],
+        record['call_id'],
+        record['parsed_caller'],
+        record['parsed_called'],
+        record['status_code'],
+        record['answered'],
+        record['setup_time'],
+        record['ring_duration'],
+        record['talk_duration'],
+        json.dumps(record['menu_path']),
+        record['digits'],
+        json.dumps(record['recording_files']),
+        json.dumps(record['latencies']),
+    )
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class CdrStore(object):
+    """
+    Append-only store of call detail records in SQLite. Records are inserted in batches by a background thread.
+    Stats are queried by the same thread after all records queued before the request are written, the results are
+    picked up by the main loop with pop_stats, so neither the query nor waiting for the writer blocks the calls.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.write_connection: Optional[sqlite3.Connection] = None
+        connection = self.connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        self.writer: BackgroundWriter[CdrWriterItem] = BackgroundWriter('cdr-writer', self.write_batch, max_size=1000)
+        self.stats_results: queue.Queue[CdrStatsEvent] = queue.Queue()
+        atexit.register(self.writer.flush)
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.file_name, timeout=5.0)
+
+    def add(self, record: CallDetailRecord) -> None:
+        if not self.writer.put(record):
+            warning(None, 'Warning: CDR buffer is full, dropping call detail record')
+
+    def request_stats(self, hours: float) -> bool:
+        return self.writer.put(StatsRequest(hours))
+
+    def pop_stats(self) -> List[CdrStatsEvent]:
+        """Returns the stats queried by the writer thread since the last call."""
+        results: List[CdrStatsEvent] = []
+        while True:
+            try:
+                results.append(self.stats_results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def write_batch(self, items: List[CdrWriterItem]) -> None:
+        # the connection is only used by the writer thread
+        if not self.write_connection:
+            self.write_connection = self.connect()
+        records = [to_row(item) for item in items if not isinstance(item, StatsRequest)]
+        if records:
+            with self.write_connection:
+                self.write_connection.executemany(INSERT_STATEMENT, records)
+        for item in items:
+            if isinstance(item, StatsRequest):
+                self.stats_results.put(self.query_stats(self.write_connection, item.hours))
+
+    @staticmethod
+    def query_stats(connection: sqlite3.Connection, hours: float) -> CdrStatsEvent:
+        since = time.time() - hours * 3600
+        rows = connection.execute('SELECT answered, setup_time, talk_duration FROM cdr WHERE started_at >= ?', (since,)).fetchall()
+        calls_by_hour = connection.execute(
+            "SELECT strftime('%Y-%m-%d %H:00', started_at, 'unixepoch', 'localtime') AS hour, COUNT(*) FROM cdr "
+            'WHERE started_at >= ? GROUP BY hour ORDER BY hour',
+            (since,),
+        ).fetchall()
+        setup_times = sorted(setup_time for _, setup_time, _ in rows if setup_time is not None)
+        return {
+            'event': 'cdr_stats',
+            'hours': hours,
+            'calls': len(rows),
+            'answered': sum(1 for answered, _, _ in rows if answered),
+            'calls_per_hour': round(len(rows) / hours, 3) if hours else 0.0,
+            'setup_time_p50': percentile(setup_times, 50),
+            'setup_time_p95': percentile(setup_times, 95),
+            'talk_duration_total': sum(talk_duration or 0.0 for _, _, talk_duration in rows),
+            'calls_by_hour': {hour: count for hour, count in calls_by_hour},
+        }
+
+
+def create_store(file_name: Optional[str]) -> Optional[CdrStore]:
+    if not file_name:
+        return None
+    try:
+        cdr_store = CdrStore(file_name)
+    except sqlite3.Error as e:
+        error(None, 'Error: Could not open CDR database %s: %s', file_name, e)
+        return None
+    log(None, f'Writing call detail records to {file_name}')
+    return cdr_store
+
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional
+
+
+class ChoiceTrieNode(object):
+    __slots__ = ('children', 'is_choice')
+
+    def __init__(self):
+        self.children: Dict[str, ChoiceTrieNode] = {}
+        self.is_choice = False
+
+
+class ChoiceTrie(object):
+    """
+    Prefix tree over the DTMF choices of a menu. Lookups cost O(len(input)) instead of O(number of choices),
+    which keeps large PIN or extension directories cheap on every key press.
+    """
+    def __init__(self, choices: Iterable[str] = ()):
+        self.root = ChoiceTrieNode()
+        self.max_length = 0
+        self.size = 0
+        for choice in choices:
+            self.add(choice)
+
+    def add(self, choice: str) -> None:
+        node = self.root
+        for digit in choice:
+            child = node.children.get(digit)
+            if child is None:
+                child = ChoiceTrieNode()
+                node.children[digit] = child
+            node = child
+        if not node.is_choice:
+            node.is_choice = True
+            self.size += 1
+        self.max_length = max(self.max_length, len(choice))
+
+    def find_node(self, prefix: str) -> Optional[ChoiceTrieNode]:
+        node: Optional[ChoiceTrieNode] = self.root
+        for digit in prefix:
+            node = node.children.get(digit) if node else None
+            if node is None:
+                return None
+        return node
+
+    def is_prefix(self, prefix: str) -> bool:
+        return self.find_node(prefix) is not None
+
+    def __contains__(self, choice: object) -> bool:
+        if not isinstance(choice, str):
+            return False
+        node = self.find_node(choice)
+        return node is not None and node.is_choice
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        return f'ChoiceTrie(choices={self.size}, max_length={self.max_length})'
@@ -4,12 +4,13 @@ import fcntl
 import json
 import os
 import sys
-from typing import List, Union, Literal, Optional, Dict, Any
+from typing import Callable, List, Union, Literal, Optional, Dict, Any
 from typing import TYPE_CHECKING
 
 from typing_extensions import TypedDict
 
 import webhook
+from log import error
 from post_action import PostActionHangup
 
 if TYPE_CHECKING:
@@ -34,6 +35,35 @@ class CommandDial(TypedDict):
     webhook_to_call: Optional[webhook.WebhookToCall]
 
 
+class DialManyNumber(TypedDict):
+    number: str
+    menu: Optional[call.MenuFromStdin]
+
+
+class CommandDialMany(TypedDict):
+    command: Literal['dial_many']
+    numbers: List[Union[str, DialManyNumber]]
+    id: Optional[str]
+    menu: Optional[call.MenuFromStdin]
+    ring_timeout: Optional[str]
+    sip_account: Optional[str]
+    webhook_to_call: Optional[webhook.WebhookToCall]
+    max_concurrent: Optional[int]
+    calls_per_second: Optional[float]
+    retries: Optional[int]
+    retry_delay: Optional[float]
+
+
+class CommandDialGroup(TypedDict):
+    command: Literal['dial_group']
+    numbers: List[Union[str, DialManyNumber]]
+    id: Optional[str]
+    menu: Optional[call.MenuFromStdin]
+    ring_timeout: Optional[str]
+    sip_account: Optional[str]
+    webhook_to_call: Optional[webhook.WebhookToCall]
+
+
 class CommandHangup(TypedDict):
     command: Literal['hangup']
     number: str
@@ -105,13 +135,47 @@ class CommandState(TypedDict):
     command: Literal['state']
 
 
+class CommandCdrStats(TypedDict):
+    command: Literal['cdr_stats']
+    hours: Optional[float]
+
+
+class CommandProfileStart(TypedDict):
+    command: Literal['profile_start']
+
+
+class CommandProfileStop(TypedDict):
+    command: Literal['profile_stop']
+    sort_by: Optional[str]
+
+
+class CommandMemorySnapshot(TypedDict):
+    command: Literal['memory_snapshot']
+    stop: Optional[bool]
+
+
+class CommandSetLogLevel(TypedDict):
+    command: Literal['set_log_level']
+    level: str
+    module: Optional[str]
+
+
 class CommandQuit(TypedDict):
     command: Literal['quit']
 
 
+class CommandBatch(TypedDict):
+    command: Literal['batch']
+    commands: List[Any]
+    id: Optional[str]
+    atomic: Optional[bool]
+
+
 Command = Union[
     CommandCallService,
     CommandDial,
+    CommandDialMany,
+    CommandDialGroup,
     CommandHangup,
     CommandAnswer,
     CommandTransfer,
@@ -123,9 +187,53 @@ Command = Union[
     CommandPlayMessage,
     CommandPlayAudioFile,
     CommandState,
+    CommandCdrStats,
+    CommandProfileStart,
+    CommandProfileStop,
+    CommandMemorySnapshot,
+    CommandSetLogLevel,
     CommandQuit,
+    CommandBatch,
 ]
 
+# required parameters of each command, checked before an atomic batch is executed
+REQUIRED_PARAMETERS: Dict[Optional[str], tuple[str, ...]] = {
+    None: ('domain', 'service'),
+    'call_service': ('domain', 'service'),
+    'dial': ('number',),
+    'dial_many': ('numbers',),
+    'dial_group': ('numbers',),
+    'hangup': ('number',),
+    'answer': ('number',),
+    'transfer': ('number', 'transfer_to'),
+    'bridge_audio': ('number', 'bridge_to'),
+    'send_dtmf': ('number', 'digits'),
+    'play_audio_file': ('number', 'audio_file'),
+    'play_message': ('number', 'message'),
+    'stop_playback': ('number',),
+    'start_recording': ('number', 'recording_file'),
+    'stop_recording': ('number',),
+    'state': (),
+    'cdr_stats': (),
+    'profile_start': (),
+    'profile_stop': (),
+    'memory_snapshot': (),
+    'set_log_level': ('level',),
+    'quit': (),
+}
+
+# commands which need the call given in "number" to be in progress
+CALL_COMMANDS = {
+    'hangup', 'answer', 'transfer', 'send_dtmf', 'play_audio_file', 'play_message', 'stop_playback', 'start_recording', 'stop_recording',
+}
+
+
+class CommandResult(TypedDict):
+    command: Optional[str]
+    ok: bool
+    error: Optional[str]
+    call_id: Optional[str]
+
 
 class CommandClient(object):
     def __init__(self):
@@ -136,7 +244,7 @@ class CommandClient(object):
 
     def get_command_list(self) -> List[Command]:
         try:
-            data = os.read(self.stdin_fd, 64)
+            data = os.read(self.stdin_fd, 65536)
         except BlockingIOError:
             data = b''
         self.buffer += data.decode('utf-8', 'ignore')
@@ -153,7 +261,48 @@ class CommandClient(object):
                 continue
             try:
                 from_json = json.loads(entry)
-                result.append(from_json)
+                result.append(unwrap_envelope(from_json))
             except json.JSONDecodeError:
-                print('Could not deserialize JSON:', entry)
+                error(None, 'Error: Could not deserialize JSON: %s', entry)
         return result
+
+
+def unwrap_envelope(payload: Any) -> Any:
+    """Turns a JSON array or a {"batch": [...]} envelope into a batch command, other payloads are returned as they are."""
+    if isinstance(payload, list):
+        return {'command': 'batch', 'commands': payload, 'id': None, 'atomic': False}
+    if isinstance(payload, dict) and 'batch' in payload and 'command' not in payload:
+        return {'command': 'batch', 'commands': payload['batch'], 'id': payload.get('id'), 'atomic': payload.get('atomic')}
+    return payload
+
+
+def validate_batch(commands: List[Any], is_active: Callable[[str], bool]) -> List[Optional[str]]:
+    """Returns the error of each command of the batch, or None if it can be executed. Calls dialed earlier in the batch count as active."""
+    dialed = set()
+    errors: List[Optional[str]] = []
+    for command in commands:
+        if not isinstance(command, dict):
+            errors.append('Not an object')
+            continue
+        verb = command.get('command')
+        if verb == 'batch':
+            errors.append('Nested batches are not supported')
+            continue
+        if verb not in REQUIRED_PARAMETERS:
+            errors.append(f'Unknown command: {verb}')
+            continue
+        missing = [parameter for parameter in REQUIRED_PARAMETERS[verb] if not command.get(parameter)]
+        if missing:
+            errors.append(f'Missing {", ".join(missing)} for command "{verb or "call_service"}"')
+            continue
+        number = str(command['number']) if command.get('number') is not None else None
+        if verb in CALL_COMMANDS and number and number not in dialed and not is_active(number):
+            errors.append(f'call not in progress: {number}')
+            continue
+        if verb == 'dial' and number:
+            if number in dialed or is_active(number):
+                errors.append(f'call already in progress: {number}')
+                continue
+            dialed.add(number)
+        errors.append(None)
+    return errors
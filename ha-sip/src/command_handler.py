@@ -3,19 +3,26 @@ from __future__ import annotations
 import collections.abc
 import sys
 import os
-from typing import Optional, List
+from typing import Any, Literal, Optional, List, cast
 
 import pjsua2 as pj
 
 import account
+import admission
 import call
+import cdr
 import command_client
+import command_queue
+import dial_campaign
+import dial_group
 import ha
+import profiling
 import state
 import utils
 from constants import DEFAULT_RING_TIMEOUT
 from event_sender import EventSender
-from log import log
+from log import log, LogLevel, set_log_level, error, warning
+from loop_watchdog import LoopWatchdog
 from post_action import PostActionHangup
 
 
@@ -27,12 +34,21 @@ class CommandHandler(object):
         call_state: state.State,
         ha_config: ha.HaConfig,
         event_sender: EventSender,
+        loop_watchdog: Optional[LoopWatchdog] = None,
+        cdr_store: Optional[cdr.CdrStore] = None,
+        profiler: Optional[profiling.Profiler] = None,
     ):
         self.end_point = end_point
         self.sip_accounts = sip_accounts
         self.ha_config = ha_config
         self.event_sender = event_sender
         self.call_state = call_state
+        self.loop_watchdog = loop_watchdog
+        self.cdr_store = cdr_store
+        self.profiler = profiler or profiling.Profiler(None)
+        self.command_queue = command_queue.CommandQueue()
+        self.dial_campaigns: dict[str, dial_campaign.DialCampaign] = {}
+        self.campaign_counter = 0
 
     def get_call_from_state(self, caller_id: str) -> Optional[call.Call]:
         return self.call_state.get_call(caller_id)
@@ -49,10 +65,30 @@ class CommandHandler(object):
     def forget_call(self, callback_id: str) -> None:
         self.call_state.forget_call(callback_id)
 
-    def handle_command(self, command: command_client.Command, from_call: Optional[call.Call]) -> None:
-        if not isinstance(command, collections.abc.Mapping):
-            log(None, f'Error: Not an object: {command}')
+    def add_call_detail_record(self, record: cdr.CallDetailRecord) -> None:
+        if self.cdr_store:
+            self.cdr_store.add(record)
+
+    def handle_cdr_stats(self) -> None:
+        if not self.cdr_store:
             return
+        for stats in self.cdr_store.pop_stats():
+            log(
+                None,
+                f"CDR stats for the last {stats['hours']}h: {stats['calls']} calls ({stats['answered']} answered, {stats['calls_per_hour']} per hour), "
+                f"setup time p50 {stats['setup_time_p50']}s p95 {stats['setup_time_p95']}s",
+            )
+            self.event_sender.send_event(stats)
+
+    def enqueue_command(self, command: command_client.Command, source: str, on_result: Optional[command_queue.ResultCallback] = None) -> None:
+        self.command_queue.put(command, source, on_result)
+
+    def run_queued_commands(self) -> None:
+        self.command_queue.run(lambda command: self.handle_command(command, None))
+
+    def handle_command(self, command: command_client.Command, from_call: Optional[call.Call]) -> command_client.CommandResult:
+        if not isinstance(command, collections.abc.Mapping):
+            return self.command_error(None, f'Not an object: {command}')
         verb = command.get('command')
         number_unknown_type = command.get('number')
         number = str(number_unknown_type) if number_unknown_type is not None else None
@@ -63,109 +99,130 @@ class CommandHandler(object):
                 entity_id = command.get('entity_id')
                 service_data = command.get('service_data')
                 if (not domain) or (not service):
-                    log(None, 'Error: one of domain or service was not provided')
-                    return
+                    return self.command_error(verb, 'one of domain or service was not provided')
                 log(None, f'Calling home assistant service on domain {domain} service {service} with entity {entity_id}')
                 try:
                     ha.call_service(self.ha_config, domain, service, entity_id, service_data)
                 except Exception as e:
-                    log(None, f'Error calling home-assistant service: {e}')
+                    error(None, 'Error calling home-assistant service: %s', e)
+                    return self.command_result(verb, False, f'calling home-assistant service failed: {e}')
             case 'dial':
                 if not number:
-                    log(None, 'Error: Missing number for command "dial"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "dial"')
                 log(None, f'Got "dial" command for {number}')
                 if self.is_active(number):
-                    log(None, f'Warning: call already in progress: {number}')
-                    return
+                    warning(None, 'Warning: call already in progress: %s', number)
+                    return self.command_result(verb, False, 'call already in progress', self.call_state.resolve_callback_id(number))
+                sip_account_number = utils.convert_to_int(command.get('sip_account'), -1)
+                sip_account = self.sip_accounts.get(sip_account_number, next(iter(self.sip_accounts.values())))
+                dial_command = cast(command_client.CommandDial, command)
+                rejection = sip_account.admission.admit(self.active_calls_on_account(sip_account))
+                if rejection:
+                    if self.queue_or_reject_dial(dial_command, sip_account, rejection):
+                        return self.command_result(verb, True)
+                    return self.command_result(verb, False, f'call rejected: {rejection}')
+                self.dial(dial_command, sip_account)
+            case 'dial_many':
                 menu = command.get('menu')
-                ring_timeout = utils.convert_to_float(command.get('ring_timeout'), DEFAULT_RING_TIMEOUT)
+                targets = dial_campaign.parse_targets(command.get('numbers'), menu)
+                if not targets:
+                    return self.command_error(verb, 'numbers of dial_many must be a non-empty list of numbers or objects with number and menu')
+                self.campaign_counter += 1
+                campaign_id = str(command.get('id') or f'campaign-{self.campaign_counter}')
+                if campaign_id in self.dial_campaigns:
+                    return self.command_error(verb, f'Dial campaign {campaign_id} is already running')
                 sip_account_number = utils.convert_to_int(command.get('sip_account'), -1)
-                webhooks = command.get('webhook_to_call')
                 sip_account = self.sip_accounts.get(sip_account_number, next(iter(self.sip_accounts.values())))
-                call.make_call(self.end_point, sip_account, number, menu, self, self.event_sender, self.ha_config, ring_timeout, webhooks)
+                log(None, f'Got "dial_many" command {campaign_id} for {len(targets)} numbers')
+                self.dial_campaigns[campaign_id] = dial_campaign.DialCampaign(
+                    campaign_id,
+                    targets,
+                    sip_account,
+                    self,
+                    utils.convert_to_float(command.get('ring_timeout'), DEFAULT_RING_TIMEOUT),
+                    command.get('webhook_to_call'),
+                    utils.convert_to_int(command.get('max_concurrent'), sip_account.config.global_options.max_calls),
+                    utils.convert_to_float(command.get('calls_per_second'), dial_campaign.DEFAULT_CALLS_PER_SECOND),
+                    utils.convert_to_int(command.get('retries'), dial_campaign.DEFAULT_RETRIES),
+                    utils.convert_to_float(command.get('retry_delay'), dial_campaign.DEFAULT_RETRY_DELAY),
+                )
+            case 'dial_group':
+                targets = dial_campaign.parse_targets(command.get('numbers'), command.get('menu'))
+                if not targets:
+                    return self.command_error(verb, 'numbers of dial_group must be a non-empty list of numbers or objects with number and menu')
+                self.campaign_counter += 1
+                group_id = str(command.get('id') or f'group-{self.campaign_counter}')
+                sip_account_number = utils.convert_to_int(command.get('sip_account'), -1)
+                sip_account = self.sip_accounts.get(sip_account_number, next(iter(self.sip_accounts.values())))
+                log(None, f'Got "dial_group" command {group_id} for {len(targets)} numbers')
+                group = dial_group.DialGroup(group_id, sip_account, self)
+                ring_timeout = utils.convert_to_float(command.get('ring_timeout'), DEFAULT_RING_TIMEOUT)
+                if not group.dial(targets, ring_timeout, command.get('webhook_to_call')):
+                    return self.command_error(verb, f'No call of dial group {group_id} could be started')
             case 'hangup':
                 if not number:
-                    log(None, 'Error: Missing number for command "hangup"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "hangup"')
                 log(None, f'Got "hangup" command for {number}')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.hangup_call()
             case 'answer':
                 if not number:
-                    log(None, 'Error: Missing number for command "answer"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "answer"')
                 log(None, f'Got "answer" command for {number}')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 menu = command.get('menu')
                 webhooks = command.get('webhook_to_call')
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.answer_call(menu, webhooks)
             case 'transfer':
                 if not number:
-                    log(None, 'Error: Missing number for command "transfer"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "transfer"')
                 transfer_to = command.get('transfer_to')
                 if not transfer_to:
-                    log(None, 'Error: Missing transfer_to for command "transfer_to"')
-                    return
+                    return self.command_error(verb, 'Missing transfer_to for command "transfer_to"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.transfer(transfer_to)
             case 'bridge_audio':
                 if not number:
-                    log(None, 'Error: Missing number for command "bridge_audio"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "bridge_audio"')
                 bridge_to = command.get('bridge_to')
                 if not bridge_to:
-                    log(None, 'Error: Missing bridge_to for command "bridge_audio"')
-                    return
+                    return self.command_error(verb, 'Missing bridge_to for command "bridge_audio"')
                 call_one = from_call if number == 'self' else self.get_call_from_state(number)
                 call_two = from_call if bridge_to == 'self' else self.get_call_from_state(bridge_to)
                 if not call_one:
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 if not call_two:
-                    self.call_not_in_progress_error(bridge_to)
-                    return
+                    return self.call_not_in_progress_error(verb, bridge_to)
                 call_one.bridge_audio(call_two)
             case 'send_dtmf':
                 if not number:
-                    log(None, 'Error: Missing number for command "send_dtmf"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "send_dtmf"')
                 digits = command.get('digits')
                 method = command.get('method', 'in_band')
                 if method not in ('in_band', 'rfc2833', 'sip_info'):
-                    log(None, 'Error: method must be one of in_band, rfc2833, sip_info')
-                    return
+                    return self.command_error(verb, 'method must be one of in_band, rfc2833, sip_info')
                 if not digits:
-                    log(None, 'Error: Missing digits for command "send_dtmf"')
-                    return
+                    return self.command_error(verb, 'Missing digits for command "send_dtmf"')
                 log(None, f'Got "send_dtmf" command for {number}')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.send_dtmf(digits, method)
             case 'play_audio_file':
                 if not number:
-                    log(None, 'Error: Missing number for command "play_audio_file"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "play_audio_file"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 audio_file = command.get('audio_file')
                 if not audio_file:
-                    log(None, 'Error: Missing parameter "audio_file" for command "play_audio_file"')
-                    return
+                    return self.command_error(verb, 'Missing parameter "audio_file" for command "play_audio_file"')
                 cache_audio = command.get('cache_audio') or False
                 wait_for_audio_to_finish = command.get('wait_for_audio_to_finish') or False
                 match command.get('post_action'):
@@ -178,16 +235,13 @@ class CommandHandler(object):
                 current_call.play_audio_file(audio_file, cache_audio, wait_for_audio_to_finish)
             case 'play_message':
                 if not number:
-                    log(None, 'Error: Missing number for command "play_message"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "play_message"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 message = command.get('message')
                 if not message:
-                    log(None, 'Error: Missing parameter "message" for command "play_message"')
-                    return
+                    return self.command_error(verb, 'Missing parameter "message" for command "play_message"')
                 handle_as_template = command.get('handle_as_template')
                 if handle_as_template:
                     message = ha.render_template(current_call.ha_config, message)
@@ -204,44 +258,193 @@ class CommandHandler(object):
                 current_call.play_message(message, tts_language, cache_audio, wait_for_audio_to_finish)
             case 'stop_playback':
                 if not number:
-                    log(None, 'Error: Missing number for command "stop_playback"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "stop_playback"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.stop_playback()
             case 'start_recording':
                 if not number:
-                    log(None, 'Error: Missing number for command "start_recording"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "start_recording"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 recording_file = command.get('recording_file')
                 if not recording_file or not os.path.isabs(recording_file):
-                    log(None, 'Error: Missing recording_file or path not absolute for command "start_recording"')
-                    return
+                    return self.command_error(verb, 'Missing recording_file or path not absolute for command "start_recording"')
                 current_call.start_recording(recording_file)
             case 'stop_recording':
                 if not number:
-                    log(None, 'Error: Missing number for command "stop_recording"')
-                    return
+                    return self.command_error(verb, 'Missing number for command "stop_recording"')
                 if not self.is_active(number):
-                    self.call_not_in_progress_error(number)
-                    return
+                    return self.call_not_in_progress_error(verb, number)
                 current_call = self.get_call_from_state_unsafe(number)
                 current_call.stop_recording()
             case 'state':
                 self.call_state.output()
+                if self.loop_watchdog:
+                    self.loop_watchdog.output()
+            case 'cdr_stats':
+                if not self.cdr_store:
+                    return self.command_error(verb, 'No CDR database configured. Use --cdr-file in global options.')
+                hours = utils.convert_to_float(command.get('hours'), 24.0)
+                if not self.cdr_store.request_stats(hours):
+                    return self.command_error(verb, 'CDR writer is busy, try again later')
+            case 'profile_start':
+                profile_error = self.profiler.start_profile()
+                if profile_error:
+                    return self.command_error(verb, profile_error)
+            case 'profile_stop':
+                _, profile_error = self.profiler.stop_profile(command.get('sort_by') or 'cumulative')
+                if profile_error:
+                    return self.command_error(verb, profile_error)
+            case 'memory_snapshot':
+                _, profile_error = self.profiler.memory_snapshot(command.get('stop') or False)
+                if profile_error:
+                    return self.command_error(verb, profile_error)
+            case 'set_log_level':
+                level_name = command.get('level')
+                level = LogLevel.get_or_else(level_name, LogLevel.INFO)
+                if not level_name or level.name != str(level_name).strip().upper():
+                    return self.command_error(verb, 'level must be one of debug, info, warning, error')
+                module = command.get('module')
+                log(None, f'Set log level to {level.name}' + (f' for module {module}' if module else ''))
+                set_log_level(level, module)
+            case 'batch':
+                commands = command.get('commands')
+                if not isinstance(commands, list):
+                    return self.command_error(verb, 'commands of a batch must be a list')
+                return self.handle_batch(commands, command.get('id'), bool(command.get('atomic')), from_call)
             case 'quit':
                 log(None, 'Quit.')
                 self.end_point.libDestroy()
                 sys.exit(0)
             case _:
-                log(None, f'Error: Unknown command: {verb}')
+                return self.command_error(verb, f'Unknown command: {verb}')
+        return self.command_result(verb, True, None, self.call_state.resolve_callback_id(number) if number else None)
+
+    def active_calls_on_account(self, sip_account: account.Account) -> int:
+        return sum(1 for c in self.call_state.current_call_dict.values() if c.account is sip_account)
 
-    def call_not_in_progress_error(self, number: str):
-        log(None, f'Warning: call not in progress: {number}')
+    def dial(self, command: command_client.CommandDial, sip_account: account.Account) -> call.Call:
+        menu = command.get('menu')
+        ring_timeout = utils.convert_to_float(command.get('ring_timeout'), DEFAULT_RING_TIMEOUT)
+        webhooks = command.get('webhook_to_call')
+        return call.make_call(self.end_point, sip_account, command['number'], menu, self, self.event_sender, self.ha_config, ring_timeout, webhooks)
+
+    def queue_or_reject_dial(
+        self,
+        command: command_client.CommandDial,
+        sip_account: account.Account,
+        rejection: admission.RejectionReason,
+        group: Optional[dial_group.DialGroup] = None,
+    ) -> bool:
+        """Queues a dial exceeding the limits of the account if its policy is "queue", or rejects it. Returns if the dial was queued."""
+        if sip_account.admission.policy == 'queue' and sip_account.admission.enqueue(command, group):
+            log(sip_account.config.index, f'Limit {rejection} reached, dial to {command["number"]} is queued')
+            return True
+        self.send_call_rejected(sip_account, 'outgoing', command['number'], 'queue_full' if sip_account.admission.policy == 'queue' else rejection)
+        return False
+
+    def handle_early_media_retries(self) -> None:
+        for sip_account in self.sip_accounts.values():
+            sip_account.handle_early_media_retry()
+
+    def handle_queued_dials(self) -> None:
+        for sip_account in self.sip_accounts.values():
+            admission = sip_account.admission
+            for expired in admission.expire():
+                self.send_call_rejected(sip_account, 'outgoing', expired.command['number'], 'queue_timeout')
+                if expired.group:
+                    expired.group.leave(expired.command['number'])
+            while admission.queue and not admission.admit(self.active_calls_on_account(sip_account)):
+                queued = admission.queue.popleft()
+                command = queued.command
+                if self.is_active(command['number']):
+                    warning(sip_account.config.index, 'Warning: call already in progress, dropping queued dial to %s', command['number'])
+                    if queued.group:
+                        queued.group.leave(command['number'])
+                    continue
+                log(sip_account.config.index, f'Dialing queued call to {command["number"]}')
+                try:
+                    new_call = self.dial(command, sip_account)
+                except Exception as e:
+                    error(sip_account.config.index, 'Error: Could not dial %s: %s', command['number'], e)
+                    if queued.group:
+                        queued.group.leave(command['number'])
+                    continue
+                if queued.group:
+                    queued.group.join(command['number'], new_call)
+
+    def send_call_rejected(
+        self,
+        sip_account: account.Account,
+        direction: Literal['incoming', 'outgoing'],
+        number: Optional[str],
+        reason: admission.RejectionReason,
+    ) -> None:
+        warning(sip_account.config.index, 'Warning: %s call %s %s rejected: %s', direction, 'to' if direction == 'outgoing' else 'from', number, reason)
+        event: admission.CallRejectedEvent = {
+            'event': 'call_rejected',
+            'sip_account': sip_account.config.index,
+            'direction': direction,
+            'number': number,
+            'reason': reason,
+        }
+        self.event_sender.send_event(event)
+
+    def handle_dial_campaigns(self) -> None:
+        for campaign_id, campaign in list(self.dial_campaigns.items()):
+            if campaign.handle_events():
+                campaign.send_summary()
+                del self.dial_campaigns[campaign_id]
+
+    def handle_batch(self, commands: List[Any], batch_id: Optional[str], atomic: bool, from_call: Optional[call.Call]) -> command_client.CommandResult:
+        """Executes all commands in this main loop iteration and sends one batch_completed event with the result of each command."""
+        log(None, f'Got batch of {len(commands)} commands' + (f' with id {batch_id}' if batch_id else ''))
+        if atomic:
+            errors = command_client.validate_batch(commands, self.is_active)
+            if any(errors):
+                results = [
+                    self.command_result(c.get('command') if isinstance(c, dict) else None, False, error or 'not executed, batch is invalid')
+                    for c, error in zip(commands, errors)
+                ]
+                error(None, 'Error: Batch not executed: %s', '; '.join(error for error in errors if error))
+                self.send_batch_event(batch_id, results)
+                return self.command_result('batch', False, 'batch is invalid, no command was executed')
+        results = []
+        for nested_command in commands:
+            if not isinstance(nested_command, dict):
+                results.append(self.command_error(None, 'Command in batch is not an object'))
+                continue
+            if nested_command.get('command') == 'batch':
+                results.append(self.command_error('batch', 'Nested batches are not supported'))
+                continue
+            results.append(self.handle_command(cast(command_client.Command, nested_command), from_call))
+        self.send_batch_event(batch_id, results)
+        failed = sum(1 for result in results if not result['ok'])
+        return self.command_result('batch', not failed, f'{failed} of {len(results)} commands failed' if failed else None)
+
+    def send_batch_event(self, batch_id: Optional[str], results: List[command_client.CommandResult]) -> None:
+        failed = sum(1 for result in results if not result['ok'])
+        self.event_sender.send_event({
+            'event': 'batch_completed',
+            'batch_id': batch_id,
+            'ok': not failed,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'results': results,
+        })
+
+    def call_not_in_progress_error(self, verb: Optional[str], number: str) -> command_client.CommandResult:
+        warning(None, 'Warning: call not in progress: %s', number)
         self.call_state.output()
+        return self.command_result(verb, False, f'call not in progress: {number}')
+
+    def command_error(self, verb: Optional[str], message: str) -> command_client.CommandResult:
+        error(None, 'Error: %s', message)
+        return self.command_result(verb, False, message)
+
+    @staticmethod
+    def command_result(verb: Optional[str], ok: bool, error: Optional[str] = None, call_id: Optional[str] = None) -> command_client.CommandResult:
+        return {'command': verb, 'ok': ok, 'error': error, 'call_id': call_id}
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import time
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+import metrics
+import trace_recorder
+from command_client import Command, CommandResult
+from log import error
+
+ResultCallback = Callable[[CommandResult], None]
+
+PRIORITY_CONTROL = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_MEDIA = 2
+
+CONTROL_COMMANDS = {'hangup', 'stop_playback', 'answer', 'transfer'}
+MEDIA_COMMANDS = {'play_message', 'play_audio_file', 'call_service', 'dial', 'dial_many', 'dial_group'}
+DIAL_COMMANDS = {'dial', 'dial_many', 'dial_group'}
+
+# after this time, the remaining commands which are not call control are left for the next main loop iteration
+DEFAULT_TIME_BUDGET = 0.05
+
+
+def get_priority(command: Any) -> int:
+    if not isinstance(command, dict):
+        return PRIORITY_DEFAULT
+    verb = command.get('command') or 'call_service'
+    if verb == 'batch':
+        nested = command.get('commands')
+        return max((get_priority(c) for c in nested), default=PRIORITY_DEFAULT) if isinstance(nested, list) else PRIORITY_DEFAULT
+    if verb in CONTROL_COMMANDS:
+        return PRIORITY_CONTROL
+    if verb in MEDIA_COMMANDS:
+        return PRIORITY_MEDIA
+    return PRIORITY_DEFAULT
+
+
+def get_verb(command: Any) -> str:
+    return str(command.get('command') or 'call_service') if isinstance(command, dict) else 'invalid'
+
+
+def get_number(command: Any) -> Optional[str]:
+    number = command.get('number') if isinstance(command, dict) else None
+    return str(number) if number is not None else None
+
+
+def get_dialed_numbers(command: Any) -> Set[str]:
+    """Returns the numbers a dial, dial_many or dial_group command will call."""
+    verb = get_verb(command)
+    if verb not in DIAL_COMMANDS:
+        return set()
+    if verb == 'dial':
+        number = get_number(command)
+        return {number} if number is not None else set()
+    numbers = command.get('numbers')
+    if not isinstance(numbers, list):
+        return set()
+    return {str(entry.get('number') if isinstance(entry, dict) else entry) for entry in numbers}
+
+
+def get_call_numbers(command: Any) -> Set[str]:
+    """Returns the numbers of all calls a command acts on, including the commands of a batch."""
+    if get_verb(command) == 'batch':
+        nested = command.get('commands')
+        return set().union(*(get_call_numbers(c) for c in nested)) if isinstance(nested, list) else set()
+    number = get_number(command)
+    return get_dialed_numbers(command) | ({number} if number is not None else set())
+
+
+class QueuedCommand(object):
+    def __init__(self, command: Command, source: str, priority: int, on_result: Optional[ResultCallback]):
+        self.command = command
+        self.source = source
+        self.priority = priority
+        self.on_result = on_result
+        self.verb = get_verb(command)
+        self.call_numbers = get_call_numbers(command)
+        self.queued_at = time.monotonic()
+
+
+class CommandQueue(object):
+    """
+    Commands from stdin and MQTT are queued here and executed by the main loop by priority: call control (e.g. hangup)
+    before everything else, commands which may block on home-assistant or set up new calls (e.g. play_message, dial)
+    last. Commands with the same priority keep their order, and a command is never moved ahead of an earlier queued
+    command for the same number, so e.g. a hangup right after a dial still hangs up the new call, and a stop_playback
+    right after a play_message stops that message.
+
+    Commands of the command socket and HTTP API are queued with a callback, which gets the result of each command so
+    the server thread can answer the request. An exception of such a command is turned into an error result.
+
+    When the time budget of one iteration is used up, only call control commands are executed and the rest is left
+    for the next iteration, so a hangup queued behind slow commands is handled in the next tick.
+    """
+    def __init__(self, time_budget: float = DEFAULT_TIME_BUDGET):
+        self.time_budget = time_budget
+        self.heap: List[Tuple[int, int, QueuedCommand]] = []
+        self.sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def put(self, command: Command, source: str, on_result: Optional[ResultCallback] = None) -> None:
+        trace_recorder.record('command', source=source, command=command)
+        priority = get_priority(command)
+        call_numbers = get_call_numbers(command)
+        if call_numbers:
+            for _, _, queued in self.heap:
+                if queued.priority > priority and not call_numbers.isdisjoint(queued.call_numbers):
+                    priority = queued.priority
+        heapq.heappush(self.heap, (priority, next(self.sequence), QueuedCommand(command, source, priority, on_result)))
+        metrics.COMMAND_QUEUE_LENGTH.set(len(self.heap))
+
+    def run(self, handle_command: Callable[[Command], CommandResult]) -> None:
+        start = time.monotonic()
+        while self.heap:
+            if self.heap[0][0] != PRIORITY_CONTROL and time.monotonic() - start > self.time_budget:
+                break
+            _, _, queued = heapq.heappop(self.heap)
+            metrics.COMMAND_QUEUE_SECONDS.observe(time.monotonic() - queued.queued_at, command=queued.verb)
+            if not queued.on_result:
+                handle_command(queued.command)
+                continue
+            result: CommandResult
+            try:
+                result = handle_command(queued.command)
+            except Exception as e:
+                error(None, 'Error: Command failed: %s', e)
+                result = {'command': queued.verb, 'ok': False, 'error': str(e), 'call_id': None}
+            queued.on_result(result)
+        metrics.COMMAND_QUEUE_LENGTH.set(len(self.heap))
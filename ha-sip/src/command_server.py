@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, List, Optional, Union, cast
+
+import metrics
+from command_client import Command, CommandResult, unwrap_envelope
+from command_queue import ResultCallback
+from log import log, error
+
+EnqueueCommand = Callable[[Command, str, ResultCallback], None]
+
+MAX_PENDING_REQUESTS = 1000
+
+
+class PendingRequest(object):
+    def __init__(self, commands: List[Command], transport: str):
+        self.commands = commands
+        self.transport = transport
+        self.received_at = time.monotonic()
+        self.results: List[Optional[CommandResult]] = [None] * len(commands)
+        self.pending = len(commands)
+        self.done = threading.Event()
+
+    def create_result_callback(self, index: int) -> ResultCallback:
+        def on_result(result: CommandResult) -> None:
+            self.results[index] = result
+            self.pending -= 1
+            if not self.pending:
+                metrics.COMMAND_API_SECONDS.observe(time.monotonic() - self.received_at, transport=self.transport)
+                self.done.set()
+        return on_result
+
+
+class CommandServer(object):
+    """
+    Accepts commands on a Unix domain socket and optionally via HTTP on localhost. The server threads only queue the
+    requests: handle_pending moves their commands to the command queue of the main loop, as PJSIP must only be used
+    from the main thread, so they are prioritized like commands from stdin and MQTT. The server thread waits until
+    the results of all commands of the request are reported back to answer it.
+    """
+    def __init__(self, socket_path: Optional[str], http_port: int, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.http_port = http_port
+        self.timeout = timeout
+        self.queue: queue.Queue[PendingRequest] = queue.Queue(MAX_PENDING_REQUESTS)
+        self.servers: List[socketserver.BaseServer] = []
+
+    def start(self) -> None:
+        if self.socket_path:
+            try:
+                if os.path.exists(self.socket_path):
+                    os.remove(self.socket_path)
+                unix_server = CommandUnixServer(self.socket_path, self)
+                self.start_thread(unix_server, 'command-socket')
+                log(None, f'Command socket listening on {self.socket_path}')
+            except OSError as e:
+                error(None, 'Error: Could not start command socket on %s: %s', self.socket_path, e)
+        if self.http_port:
+            try:
+                http_server = CommandHttpServer(('127.0.0.1', self.http_port), self)
+                self.start_thread(http_server, 'command-http')
+                log(None, f'Command API listening on http://127.0.0.1:{self.http_port}/command')
+            except OSError as e:
+                error(None, 'Error: Could not start command API on port %s: %s', self.http_port, e)
+
+    def start_thread(self, server: socketserver.BaseServer, name: str) -> None:
+        self.servers.append(server)
+        thread = threading.Thread(target=server.serve_forever, name=name, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def submit(self, payload: Any, transport: str) -> Union[CommandResult, List[CommandResult]]:
+        """Called from the server threads, waits until the main loop executed the commands."""
+        if isinstance(payload, dict):
+            payload = unwrap_envelope(payload)
+        commands = payload if isinstance(payload, list) else [payload]
+        request = PendingRequest(commands, transport)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            results = [error_result(command, 'too many pending requests') for command in commands]
+        else:
+            if request.done.wait(self.timeout):
+                results = [cast(CommandResult, result) for result in request.results]
+            else:
+                results = [error_result(command, 'timeout waiting for the main loop') for command in commands]
+        return results if isinstance(payload, list) else results[0]
+
+    def handle_pending(self, enqueue_command: EnqueueCommand) -> None:
+        """Queues the commands of all pending requests, must be called from the main loop."""
+        while True:
+            try:
+                request = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if not request.commands:
+                request.done.set()
+            for index, command in enumerate(request.commands):
+                enqueue_command(command, request.transport, request.create_result_callback(index))
+
+
+def error_result(command: Any, error: str) -> CommandResult:
+    verb = command.get('command') if isinstance(command, dict) else None
+    return {'command': verb, 'ok': False, 'error': error, 'call_id': None}
+
+
+class CommandUnixRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON command or array of commands per line, answered with one line. The connection stays open."""
+    def handle(self) -> None:
+        command_server = cast(CommandUnixServer, self.server).command_server
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+                response: Any = command_server.submit(payload, 'socket')
+            except json.JSONDecodeError as e:
+                response = error_result(None, f'invalid JSON: {e}')
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class CommandUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, command_server: CommandServer):
+        self.command_server = command_server
+        super().__init__(socket_path, CommandUnixRequestHandler)
+
+
+class CommandHttpRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0] not in ('/command', '/'):
+            self.send_json(404, error_result(None, 'not found'))
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'null')
+        except json.JSONDecodeError as e:
+            self.send_json(400, error_result(None, f'invalid JSON: {e}'))
+            return
+        self.send_json(200, cast(CommandHttpServer, self.server).command_server.submit(payload, 'http'))
+
+    def send_json(self, status: int, content: Any) -> None:
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CommandHttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], command_server: CommandServer):
+        self.command_server = command_server
+        super().__init__(address, CommandHttpRequestHandler)
+
+
+def create_and_start(socket_path: Optional[str], http_port: int) -> Optional[CommandServer]:
+    if not socket_path and not http_port:
+        return None
+    command_server = CommandServer(socket_path, http_port)
+    command_server.start()
+    return command_server
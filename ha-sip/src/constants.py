@@ -6,3 +6,5 @@ ROOT_PATH = os.path.dirname(os.path.realpath(__file__))
 DEFAULT_RING_TIMEOUT = 300.0
 DEFAULT_DTMF_ON = 180
 DEFAULT_DTMF_OFF = 220
+DEFAULT_INTER_DIGIT_TIMEOUT = 5.0
+DEFAULT_COLLECT_DIGITS_TERMINATOR = '#'
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import collections
+import time
+from typing import TYPE_CHECKING, Any, Deque, List, Literal, Optional
+
+import pjsua2 as pj
+from typing_extensions import TypedDict
+
+import account
+import call
+import webhook
+from log import log, LogLevel
+
+if TYPE_CHECKING:
+    from command_handler import CommandHandler
+
+# busy here and service unavailable, which are retried with backoff
+RETRY_STATUS_CODES = {486, 503}
+BUSY_STATUS_CODES = {486, 600}
+
+DEFAULT_CALLS_PER_SECOND = 2.0
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 5.0
+
+DialResultStatus = Literal['answered', 'busy', 'failed', 'skipped']
+
+
+class DialTarget(TypedDict):
+    number: str
+    menu: Optional[call.MenuFromStdin]
+
+
+class DialResult(TypedDict):
+    number: str
+    result: DialResultStatus
+    status_code: Optional[int]
+    attempts: int
+
+
+class DialResultEvent(TypedDict):
+    event: Literal['dial_result']
+    campaign_id: str
+    number: str
+    result: DialResultStatus
+    status_code: Optional[int]
+    attempts: int
+
+
+class DialManyCompletedEvent(TypedDict):
+    event: Literal['dial_many_completed']
+    campaign_id: str
+    total: int
+    answered: int
+    busy: int
+    failed: int
+    skipped: int
+    duration: float
+    results: List[DialResult]
+
+
+def parse_targets(numbers: Any, default_menu: Optional[call.MenuFromStdin]) -> Optional[List[DialTarget]]:
+    """Accepts a list of numbers or of objects with number and menu, returns None if an entry is invalid."""
+    if not isinstance(numbers, list) or not numbers:
+        return None
+    targets: List[DialTarget] = []
+    for entry in numbers:
+        if isinstance(entry, (str, int)) and str(entry):
+            targets.append({'number': str(entry), 'menu': default_menu})
+        elif isinstance(entry, dict) and entry.get('number'):
+            targets.append({'number': str(entry['number']), 'menu': entry.get('menu') or default_menu})
+        else:
+            return None
+    return targets
+
+
+class DialAttempt(object):
+    def __init__(self, target: DialTarget):
+        self.number = target['number']
+        self.menu = target['menu']
+        self.attempts = 0
+        self.next_attempt_at = 0.0
+        self.answered = False
+        self.result: Optional[DialResult] = None
+
+
+class DialCampaign(object):
+    """
+    Dials a list of numbers from one account, with at most max_concurrent calls active on the account and at most
+    calls_per_second new calls. Calls rejected with busy or service unavailable are retried with exponential backoff.
+    handle_events has to be called from the main loop, it returns True when all numbers have a result.
+    """
+    def __init__(
+        self,
+        campaign_id: str,
+        targets: List[DialTarget],
+        sip_account: account.Account,
+        command_handler: CommandHandler,
+        ring_timeout: float,
+        webhooks: Optional[webhook.WebhookToCall],
+        max_concurrent: int,
+        calls_per_second: float,
+        retries: int,
+        retry_delay: float,
+    ):
+        self.campaign_id = campaign_id
+        self.sip_account = sip_account
+        self.command_handler = command_handler
+        self.ring_timeout = ring_timeout
+        self.webhooks = webhooks
+        self.max_concurrent = max(max_concurrent, 1)
+        self.start_interval = 1.0 / calls_per_second if calls_per_second > 0 else 0.0
+        self.retries = max(retries, 0)
+        self.retry_delay = retry_delay
+        self.attempts = [DialAttempt(target) for target in targets]
+        self.waiting: Deque[DialAttempt] = collections.deque(self.attempts)
+        self.next_start_at = 0.0
+        self.started_at = time.time()
+
+    def log(self, message: str, level: LogLevel = LogLevel.INFO) -> None:
+        log(self.sip_account.config.index, 'Dial campaign %s: %s', self.campaign_id, message, level=level)
+
+    def handle_events(self) -> bool:
+        now = time.time()
+        for _ in range(len(self.waiting)):
+            active_calls = self.command_handler.active_calls_on_account(self.sip_account)
+            if now < self.next_start_at or active_calls >= self.max_concurrent:
+                break
+            attempt = self.waiting.popleft()
+            if attempt.next_attempt_at > now:
+                self.waiting.append(attempt)
+                continue
+            if self.command_handler.is_active(attempt.number):
+                self.log(f'call already in progress: {attempt.number}')
+                self.finish(attempt, 'skipped', None)
+                continue
+            if self.sip_account.admission.admit(active_calls):
+                # the limits of the account are reached, try again in the next iteration
+                self.waiting.appendleft(attempt)
+                break
+            self.start(attempt, now)
+        return all(attempt.result for attempt in self.attempts)
+
+    def start(self, attempt: DialAttempt, now: float) -> None:
+        attempt.attempts += 1
+        self.next_start_at = now + self.start_interval
+        self.log(f'Dialing {attempt.number} (attempt {attempt.attempts})')
+        try:
+            new_call = call.make_call(
+                self.command_handler.end_point,
+                self.sip_account,
+                attempt.number,
+                attempt.menu,
+                self.command_handler,
+                self.command_handler.event_sender,
+                self.command_handler.ha_config,
+                self.ring_timeout,
+                self.webhooks,
+            )
+        except Exception as e:
+            self.log(f'Error: Could not dial {attempt.number}: {e}', LogLevel.ERROR)
+            self.retry_or_finish(attempt, 'failed', None)
+            return
+        new_call.add_state_listener(lambda c, state, status_code: self.on_call_state(attempt, state, status_code))
+
+    def on_call_state(self, attempt: DialAttempt, state: int, status_code: int) -> None:
+        if state == pj.PJSIP_INV_STATE_CONFIRMED:
+            attempt.answered = True
+        elif state == pj.PJSIP_INV_STATE_DISCONNECTED:
+            if attempt.answered:
+                self.finish(attempt, 'answered', status_code)
+            else:
+                self.retry_or_finish(attempt, 'busy' if status_code in BUSY_STATUS_CODES else 'failed', status_code)
+
+    def retry_or_finish(self, attempt: DialAttempt, result: DialResultStatus, status_code: Optional[int]) -> None:
+        if attempt.attempts <= self.retries and (status_code is None or status_code in RETRY_STATUS_CODES):
+            delay = self.retry_delay * 2 ** (attempt.attempts - 1)
+            self.log(f'{attempt.number} returned {status_code or "an error"}, retrying in {delay}s')
+            attempt.next_attempt_at = time.time() + delay
+            self.waiting.append(attempt)
+            return
+        self.finish(attempt, result, status_code)
+
+    def finish(self, attempt: DialAttempt, result: DialResultStatus, status_code: Optional[int]) -> None:
+        attempt.result = {'number': attempt.number, 'result': result, 'status_code': status_code, 'attempts': attempt.attempts}
+        self.log(f'{attempt.number} {result}' + (f' ({status_code})' if status_code else ''))
+        event: DialResultEvent = {
+            'event': 'dial_result',
+            'campaign_id': self.campaign_id,
+            'number': attempt.number,
+            'result': result,
+            'status_code': status_code,
+            'attempts': attempt.attempts,
+        }
+        self.command_handler.event_sender.send_event(event)
+
+    def send_summary(self) -> None:
+        results = [attempt.result for attempt in self.attempts if attempt.result]
+        counts = collections.Counter(result['result'] for result in results)
+        summary: DialManyCompletedEvent = {
+            'event': 'dial_many_completed',
+            'campaign_id': self.campaign_id,
+            'total': len(results),
+            'answered': counts['answered'],
+            'busy': counts['busy'],
+            'failed': counts['failed'],
+            'skipped': counts['skipped'],
+            'duration': round(time.time() - self.started_at, 3),
+            'results': results,
+        }
+        self.log(f"finished: {summary['answered']} of {summary['total']} answered, {summary['busy']} busy, {summary['failed']} failed")
+        self.command_handler.event_sender.send_event(summary)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, List, Literal, Optional, Set
+
+import pjsua2 as pj
+from typing_extensions import TypedDict
+
+import account
+import call
+import command_client
+import webhook
+from dial_campaign import DialTarget
+from log import log, LogLevel
+
+if TYPE_CHECKING:
+    from command_handler import CommandHandler
+
+
+class DialGroupCompletedEvent(TypedDict):
+    event: Literal['dial_group_completed']
+    group_id: str
+    answered_by: Optional[str]
+    numbers: List[str]
+    duration: float
+
+
+class DialGroup(object):
+    """
+    Rings several numbers at the same time. The first call to be confirmed wins and gets its menu, all other calls
+    are cancelled right away and don't send any web-hook events after that, so call_established is only sent once.
+
+    Numbers exceeding the limits of the account are queued like a dial command and join the group when the main
+    loop dials them, queued numbers which were not dialed yet are dropped when the group is finished.
+    """
+    def __init__(self, group_id: str, sip_account: account.Account, command_handler: CommandHandler):
+        self.group_id = group_id
+        self.sip_account = sip_account
+        self.command_handler = command_handler
+        self.numbers: List[str] = []
+        self.ringing: List[call.Call] = []
+        self.queued: Set[str] = set()
+        self.winner: Optional[call.Call] = None
+        self.finished = False
+        self.started_at = time.time()
+
+    def log(self, message: str, level: LogLevel = LogLevel.INFO) -> None:
+        log(self.sip_account.config.index, 'Dial group %s: %s', self.group_id, message, level=level)
+
+    def dial(self, targets: List[DialTarget], ring_timeout: float, webhooks: Optional[webhook.WebhookToCall]) -> int:
+        for target in targets:
+            number = target['number']
+            if self.command_handler.is_active(number):
+                self.log(f'call already in progress: {number}')
+                continue
+            dial_command: command_client.CommandDial = {
+                'command': 'dial',
+                'number': number,
+                'menu': target['menu'],
+                'ring_timeout': str(ring_timeout),
+                'sip_account': None,
+                'webhook_to_call_after_call_was_established': None,
+                'webhook_to_call': webhooks,
+            }
+            rejection = self.sip_account.admission.admit(self.command_handler.active_calls_on_account(self.sip_account))
+            if rejection:
+                if self.command_handler.queue_or_reject_dial(dial_command, self.sip_account, rejection, self):
+                    self.queued.add(number)
+                continue
+            try:
+                new_call = self.command_handler.dial(dial_command, self.sip_account)
+            except Exception as e:
+                self.log(f'Error: Could not dial {number}: {e}', LogLevel.ERROR)
+                continue
+            self.join(number, new_call)
+        self.log(f'Ringing {", ".join(self.numbers)}' + (f', queued {", ".join(sorted(self.queued))}' if self.queued else ''))
+        return len(self.ringing) + len(self.queued)
+
+    def join(self, number: str, new_call: call.Call) -> None:
+        self.queued.discard(number)
+        new_call.add_state_listener(self.on_call_state)
+        self.numbers.append(number)
+        self.ringing.append(new_call)
+
+    def leave(self, number: str) -> None:
+        """Called for a queued number which could not be dialed."""
+        self.queued.discard(number)
+        self.check_nobody_answered()
+
+    def on_call_state(self, member: call.Call, state: int, status_code: int) -> None:
+        if state == pj.PJSIP_INV_STATE_CONFIRMED:
+            if self.winner is None:
+                self.winner = member
+                self.log(f'{member.callback_id} answered, cancelling the other calls')
+                for other in list(self.ringing):
+                    if other is not member:
+                        self.cancel(other)
+                self.send_result()
+            elif member is not self.winner:
+                self.cancel(member)
+        elif state == pj.PJSIP_INV_STATE_DISCONNECTED:
+            if member in self.ringing:
+                self.ringing.remove(member)
+            self.check_nobody_answered()
+
+    def check_nobody_answered(self) -> None:
+        if not self.ringing and not self.queued and not self.winner and not self.finished:
+            self.log('Nobody answered')
+            self.send_result()
+
+    def cancel(self, member: call.Call) -> None:
+        member.call_settled_at = None
+        member.silent = True
+        try:
+            member.hangup_call()
+        except Exception as e:
+            self.log(f'Error: Could not cancel {member.callback_id}: {e}', LogLevel.ERROR)
+
+    def send_result(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        if self.queued:
+            self.sip_account.admission.drop_group(self)
+            self.queued.clear()
+        event: DialGroupCompletedEvent = {
+            'event': 'dial_group_completed',
+            'group_id': self.group_id,
+            'answered_by': self.winner.callback_id if self.winner else None,
+            'numbers': self.numbers,
+            'duration': round(time.time() - self.started_at, 3),
+        }
+        self.command_handler.event_sender.send_event(event)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import pjsua2 as pj
+from typing_extensions import NotRequired, TypedDict
+
+import audio
+import audio_cache
+import ha
+from log import log, error, warning
+
+# north american ringback tone, 440 Hz + 480 Hz, 2 seconds on and 4 seconds off
+RINGBACK_TONE = (440, 480, 2000, 4000)
+
+# backoff for preparing a prompt again after e.g. home-assistant or TTS was not available
+PREPARE_RETRY_DELAY = 5.0
+MAX_PREPARE_RETRY_DELAY = 300.0
+
+
+class EarlyMediaConfig(TypedDict):
+    message: NotRequired[Optional[str]]
+    audio_file: NotRequired[Optional[str]]
+    language: NotRequired[Optional[str]]
+    ringback: NotRequired[Optional[bool]]
+
+
+def prepare_prompt(ha_config: ha.HaConfig, config: EarlyMediaConfig) -> Optional[str]:
+    """
+    Returns the wav file of the early media prompt from the audio cache, and creates it first if needed, so incoming
+    calls never have to wait for TTS or ffmpeg. The menu of the call finds the same cache file when it plays the
+    same message or audio file after the call was answered.
+    """
+    message = config.get('message')
+    audio_file = config.get('audio_file')
+    if (message or audio_file) and not ha_config.cache_dir:
+        warning(None, 'Warning: Early media prompts need a cache directory.')
+        return None
+    if message:
+        return prepare_message(ha_config, message, config.get('language') or ha_config.tts_config['language'])
+    if audio_file:
+        return prepare_audio_file(ha_config, audio_file)
+    return None
+
+
+def prepare_message(ha_config: ha.HaConfig, message: str, language: str) -> Optional[str]:
+    cached_file = audio_cache.get_cached_file(True, ha_config.cache_dir, 'message', message)
+    if cached_file:
+        return cached_file
+    sound_file_name, must_be_deleted, was_successful = ha.create_and_get_tts(ha_config, message, language)
+    audio_cache.cache_file(was_successful, ha_config.cache_dir, 'message', message, sound_file_name)
+    if must_be_deleted:
+        os.remove(sound_file_name)
+    return audio_cache.get_cached_file(was_successful, ha_config.cache_dir, 'message', message)
+
+
+def prepare_audio_file(ha_config: ha.HaConfig, audio_file: str) -> Optional[str]:
+    cached_file = audio_cache.get_cached_file(True, ha_config.cache_dir, 'audio_file', audio_file)
+    if cached_file:
+        return cached_file
+    file_format = audio.audio_format_from_filename(audio_file)
+    if not file_format:
+        error(None, 'Error getting audio format from filename: %s', audio_file)
+        return None
+    try:
+        with open(audio_file, 'rb') as f:
+            sound_file_name = audio.convert_audio_stream_to_wav_file(f.read(), file_format)
+    except OSError as e:
+        error(None, 'Error reading early media audio file: %s', e)
+        return None
+    if not sound_file_name:
+        log(None, f'Could not convert to wav: {audio_file}')
+        return None
+    audio_cache.cache_file(True, ha_config.cache_dir, 'audio_file', audio_file, sound_file_name)
+    os.remove(sound_file_name)
+    return audio_cache.get_cached_file(True, ha_config.cache_dir, 'audio_file', audio_file)
+
+
+def create_ringback_generator(audio_media: pj.AudioMedia) -> pj.ToneGenerator:
+    freq1, freq2, on_msec, off_msec = RINGBACK_TONE
+    tone = pj.ToneDesc()
+    tone.freq1 = freq1
+    tone.freq2 = freq2
+    tone.on_msec = on_msec
+    tone.off_msec = off_msec
+    tones = pj.ToneDescVector()
+    tones.append(tone)
+    tone_generator = pj.ToneGenerator()
+    tone_generator.createToneGenerator()
+    tone_generator.play(tones, True)
+    tone_generator.startTransmit(audio_media)
+    return tone_generator
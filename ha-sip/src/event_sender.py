@@ -1,5 +1,7 @@
 from typing import Optional, Callable, List, Any
 
+import trace_recorder
+
 
 class EventSender(object):
     def __init__(self):
@@ -9,5 +11,6 @@ class EventSender(object):
         self.callbacks.append(callback)
 
     def send_event(self, event: Any, webhook_id: Optional[str] = None):
+        trace_recorder.record('event', event=event, webhook_id=webhook_id)
         for callback in self.callbacks:
             callback(event, webhook_id)
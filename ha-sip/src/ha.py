@@ -10,8 +10,10 @@ import websockets
 
 import constants
 import audio
+import metrics
 import utils
-from log import log
+from log import log, debug, error, warning
+from timeline import CallTimeline
 
 
 class WebhookBaseFields(TypedDict):
@@ -47,6 +49,16 @@ class DtmfDigitEvent(TypedDict):
     digit: str
 
 
+DigitsCollectedReason = Literal['terminator', 'max_length', 'inter_digit_timeout']
+
+
+class DigitsCollectedEvent(TypedDict):
+    event: Literal['digits_collected']
+    digits: str
+    menu_id: Optional[str]
+    reason: DigitsCollectedReason
+
+
 class Timeout(TypedDict):
     event: Literal['timeout']
     menu_id: Optional[str]
@@ -84,6 +96,7 @@ WebhookEvent = Union[
     CallDisconnectedEvent,
     EnteredMenuEvent,
     DtmfDigitEvent,
+    DigitsCollectedEvent,
     Timeout,
     RingTimeout,
     PlaybackDoneAudioFile,
@@ -135,9 +148,9 @@ class HaConfig(object):
             'debug_print': (tts_config['debug_print'] or '').lower() == 'true',
         }
         if not self.tts_config['engine_id'] and not self.tts_config['platform']:
-            log(None, 'Warning: No TTS engine defined. Must be either specify engine_id or platform.')
+            warning(None, 'Warning: No TTS engine defined. Must be either specify engine_id or platform.')
         if self.tts_config['engine_id'] and self.tts_config['platform']:
-            log(None, 'Warning: Both engine_id and platform defined. Using engine_id.')
+            warning(None, 'Warning: Both engine_id and platform defined. Using engine_id.')
         if self.tts_config['engine_id']:
             log(None, f"TTS: Using engine {self.tts_config['engine_id']} with language {self.tts_config['language']} with voice {self.tts_config['voice']}")
         elif self.tts_config['platform']:
@@ -164,12 +177,13 @@ class HaConfig(object):
         return self.base_url + '/webhook/' + webhook_id
 
 
-def create_and_get_tts(ha_config: HaConfig, message: str, language: str) -> tuple[str, bool, bool]:
+def create_and_get_tts(ha_config: HaConfig, message: str, language: str, call_timeline: Optional[CallTimeline] = None) -> tuple[str, bool, bool]:
     """
     Generates a .wav file for a given message
     :param ha_config: home assistant config
     :param message: the message passed to the TTS engine
     :param language: language the message is in
+    :param call_timeline: timeline of the call the message is played on, gets the tts_returned and transcoded milestones
     :return: the file name of the .wav-file, if it must be deleted afterwards, and if it was successful
     """
     error_file_name = os.path.join(constants.ROOT_PATH, 'sound/error.wav')
@@ -180,35 +194,49 @@ def create_and_get_tts(ha_config: HaConfig, message: str, language: str) -> tupl
     payload = options | message_and_language | engine_or_platform
     if ha_config.tts_config['debug_print']:
         log(None, f'TTS payload: {payload!r}')
-    create_response = requests.post(ha_config.get_tts_url(), json=payload, headers=headers)
+    try:
+        with metrics.TTS_SECONDS.time(stage='tts_get_url'):
+            create_response = requests.post(ha_config.get_tts_url(), json=payload, headers=headers)
+    except Exception as e:
+        error(None, 'Error getting tts file: %s', e)
+        metrics.TTS_FAILURES.inc(stage='tts_get_url')
+        return error_file_name, False, False
     if create_response.status_code != 200:
-        log(None, f'Error getting tts file {create_response.status_code!r} {create_response.content!r}')
+        error(None, 'Error getting tts file %r %r', create_response.status_code, create_response.content)
+        metrics.TTS_FAILURES.inc(stage='tts_get_url')
         error_file_name = os.path.join(constants.ROOT_PATH, 'sound/error.wav')
         return error_file_name, False, False
     response_deserialized = create_response.json()
     tts_url = response_deserialized['url']
     log(None, f'Getting audio from "{tts_url}"')
     try:
-        tts_response = requests.get(tts_url, headers=headers)
+        with metrics.TTS_SECONDS.time(stage='download'):
+            tts_response = requests.get(tts_url, headers=headers)
     except Exception as e:
-        log(None, f'Error getting tts audio: {e}')
+        error(None, 'Error getting tts audio: %s', e)
+        metrics.TTS_FAILURES.inc(stage='download')
         return error_file_name, False, False
+    if call_timeline:
+        call_timeline.mark('tts_returned', status_code=tts_response.status_code, size=len(tts_response.content))
     file_format = audio.audio_format_from_filename(tts_url)
     if not file_format:
-        log(None, f'Error getting audio format from filename: {tts_url}')
+        error(None, 'Error getting audio format from filename: %s', tts_url)
         return error_file_name, False, False
     wav_file_name = audio.convert_audio_stream_to_wav_file(tts_response.content, file_format)
     if not wav_file_name:
-        log(None, f'Error converting to wav: {wav_file_name}')
+        error(None, 'Error converting to wav: %s', wav_file_name)
         return error_file_name, False, False
+    if call_timeline:
+        call_timeline.mark('transcoded', format=file_format.value)
     return wav_file_name, True, True
 
 
 def render_template(ha_config: HaConfig, text: str) -> str:
-    log(None, f'Rendering template: {text}')
+    debug(None, 'Rendering template: %s', text)
     headers = ha_config.create_headers()
     template_response = requests.post(ha_config.get_template_url(), json={'template': text}, headers=headers)
-    log(None, f'Template response {template_response.status_code!r} {template_response.content!r}')
+    log(None, f'Template response {template_response.status_code!r}')
+    debug(None, 'Template response content %r', template_response.content)
     return template_response.text if template_response.ok else text
 
 
@@ -220,18 +248,29 @@ def call_service(ha_config: HaConfig, domain: str, service: str, entity_id: Opti
     if service_data:
         payload.update(service_data)
     service_response = requests.post(ha_config.get_service_url(domain, service), json=payload, headers=headers)
-    log(None, f'Service response {service_response.status_code!r} {service_response.content!r}')
+    log(None, f'Service response {service_response.status_code!r}')
+    debug(None, 'Service response content %r', service_response.content)
 
 
 def trigger_webhook(ha_config: HaConfig, event: Any, overwrite_webhook_id: Optional[str] = None) -> None:
     webhook_id = overwrite_webhook_id or ha_config.webhook_id
     if not webhook_id:
-        log(None, 'Warning: No webhook defined.')
+        warning(None, 'Warning: No webhook defined.')
         return
-    log(None, f'Calling webhook {webhook_id} with data {event}')
+    debug(None, 'Calling webhook %s with data %s', webhook_id, event)
     headers = ha_config.create_headers()
-    service_response = requests.post(ha_config.get_webhook_url(webhook_id), json=event, headers=headers)
-    log(None, f'Webhook response {service_response.status_code!r} {service_response.content!r}')
+    try:
+        with metrics.EVENT_SEND_SECONDS.time(transport='webhook'):
+            service_response = requests.post(ha_config.get_webhook_url(webhook_id), json=event, headers=headers)
+    except Exception:
+        metrics.EVENT_SEND_FAILURES.inc(transport='webhook')
+        raise
+    if service_response.ok:
+        debug(None, 'Webhook response %r %r', service_response.status_code, service_response.content)
+    else:
+        metrics.EVENT_SEND_FAILURES.inc(transport='webhook')
+        warning(None, 'Warning: Webhook %s response %r', webhook_id, service_response.status_code)
+        debug(None, 'Webhook response content %r', service_response.content)
 
 
 async def print_tts_providers(ha_config: HaConfig) -> None:
@@ -1,9 +1,11 @@
-from typing import Optional
+from typing import Optional, Any
 
-from typing_extensions import TypedDict
+from typing_extensions import TypedDict, NotRequired
 
 import call
+import early_media
 import webhook
+from number_matcher import NumberMatcher
 
 
 class IncomingCallConfig(TypedDict):
@@ -12,3 +14,14 @@ class IncomingCallConfig(TypedDict):
     answer_after: Optional[int]
     webhook_to_call: Optional[webhook.WebhookToCall]
     menu: call.MenuFromStdin
+    early_media: NotRequired[Optional[early_media.EarlyMediaConfig]]
+    allowed_numbers_matcher: NotRequired[NumberMatcher]
+    blocked_numbers_matcher: NotRequired[NumberMatcher]
+
+
+def compile_number_lists(content: Any) -> Any:
+    if not isinstance(content, dict):
+        return content
+    content['allowed_numbers_matcher'] = NumberMatcher(content.get('allowed_numbers'))
+    content['blocked_numbers_matcher'] = NumberMatcher(content.get('blocked_numbers'))
+    return content
@@ -1,9 +1,133 @@
+from __future__ import annotations
+
+import atexit
+import json
+import sys
+import time
 from datetime import datetime
-from typing import Optional
+from enum import IntEnum
+from typing import Optional, Any, Dict, List, Tuple
+
+from background_writer import BackgroundWriter
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+    @staticmethod
+    def get_or_else(name: Optional[str], default: LogLevel) -> LogLevel:
+        try:
+            return LogLevel[(name or '').strip().upper()]
+        except KeyError:
+            return default
+
+
+# time stamp, level, module, account number, message, arguments for lazy formatting
+LogRecord = Tuple[float, LogLevel, Optional[str], Optional[int], str, Tuple[Any, ...]]
+
+
+class LogConfig(object):
+    def __init__(self):
+        self.level = LogLevel.INFO
+        self.module_levels: Dict[str, LogLevel] = {}
+        self.json_format = False
 
 
-def log(account_number: Optional[int], message: str) -> None:
-    time_stamp = datetime.now()
-    time_stamp_str = time_stamp.strftime('%H:%M:%S.%f')
+log_config = LogConfig()
+
+
+def format_record(record: LogRecord) -> str:
+    time_stamp, level, module, account_number, message, args = record
+    if args:
+        try:
+            message = message % args
+        except (TypeError, ValueError):
+            message = f'{message} {args!r}'
+    if log_config.json_format:
+        return json.dumps({
+            'time': datetime.fromtimestamp(time_stamp).isoformat(timespec='microseconds'),
+            'level': level.name.lower(),
+            'module': module,
+            'account': account_number,
+            'message': message,
+        })
+    time_stamp_str = datetime.fromtimestamp(time_stamp).strftime('%H:%M:%S.%f')
     account_number_str = ' ' if account_number is None else account_number
-    print('| %s [%s] %s' % (time_stamp_str, account_number_str, message))
+    return '| %s [%s] %s' % (time_stamp_str, account_number_str, message)
+
+
+def write_records(records: List[LogRecord]) -> None:
+    lines = [format_record(record) for record in records]
+    dropped = writer.pop_dropped()
+    if dropped:
+        lines.append(format_record((time.time(), LogLevel.WARNING, __name__, None, 'Warning: %s log messages were dropped', (dropped,))))
+    sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stdout.flush()
+
+
+writer: BackgroundWriter[LogRecord] = BackgroundWriter('log-writer', write_records)
+atexit.register(writer.flush)
+
+
+def configure_logging(level: LogLevel, module_levels: Dict[str, LogLevel], json_format: bool) -> None:
+    log_config.level = level
+    log_config.module_levels = module_levels
+    log_config.json_format = json_format
+
+
+def set_log_level(level: LogLevel, module: Optional[str] = None) -> None:
+    if module:
+        log_config.module_levels[module] = level
+    else:
+        log_config.level = level
+
+
+def parse_module_levels(raw: Optional[str]) -> Dict[str, LogLevel]:
+    """Parses a comma-separated list of module=level pairs, e.g. "ha=debug,mqtt=warning"."""
+    result: Dict[str, LogLevel] = {}
+    for entry in (raw or '').split(','):
+        if '=' not in entry:
+            continue
+        module, level_name = entry.split('=', 1)
+        level = LogLevel.get_or_else(level_name, LogLevel.INFO)
+        result[module.strip()] = level
+    return result
+
+
+def get_calling_module(depth: int) -> Optional[str]:
+    try:
+        return sys._getframe(depth + 1).f_globals.get('__name__')
+    except ValueError:
+        return None
+
+
+def is_enabled(level: LogLevel, module: Optional[str]) -> bool:
+    if module and module in log_config.module_levels:
+        return level >= log_config.module_levels[module]
+    return level >= log_config.level
+
+
+def emit(level: LogLevel, account_number: Optional[int], message: str, args: Tuple[Any, ...]) -> None:
+    module = get_calling_module(2) if (log_config.module_levels or log_config.json_format) else None
+    if not is_enabled(level, module):
+        return
+    writer.put((time.time(), level, module, account_number, message, args))
+
+
+def log(account_number: Optional[int], message: str, *args: Any, level: LogLevel = LogLevel.INFO) -> None:
+    emit(level, account_number, message, args)
+
+
+def debug(account_number: Optional[int], message: str, *args: Any) -> None:
+    emit(LogLevel.DEBUG, account_number, message, args)
+
+
+def warning(account_number: Optional[int], message: str, *args: Any) -> None:
+    emit(LogLevel.WARNING, account_number, message, args)
+
+
+def error(account_number: Optional[int], message: str, *args: Any) -> None:
+    emit(LogLevel.ERROR, account_number, message, args)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import faulthandler
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+import constants
+import metrics
+from log import log, warning
+
+# share of the dump timeout after which faulthandler is armed again
+REARM_FRACTION = 0.1
+
+
+class LoopWatchdog(object):
+    """
+    Watches the heartbeat of the main loop from a separate thread. When one iteration takes longer than the
+    threshold, the stack of the main thread is captured and the stall is counted by its call site.
+
+    Additionally, faulthandler is armed to dump all thread stacks when the main loop does not come back at all, e.g.
+    because a C extension is holding the GIL. Re-arming restarts the faulthandler thread, so it is only done when a
+    tenth of the dump timeout has passed since the last time, which lets the dump happen after 90 to 100% of the timeout.
+    """
+    def __init__(self, threshold: float, dump_timeout: float):
+        self.threshold = threshold
+        self.dump_timeout = dump_timeout
+        self.main_thread_id = threading.get_ident()
+        self.check_interval = max(threshold / 4, 0.01)
+        self.iteration = 0
+        self.iteration_started_at: Optional[float] = None
+        self.dump_armed_at: Optional[float] = None
+        self.reported_iteration = -1
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stall_counts: Dict[str, int] = {}
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        log(None, f'Main loop watchdog enabled with threshold {self.threshold}s')
+        self.thread = threading.Thread(target=self.run, name='loop-watchdog', daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.check_interval)
+            self.check()
+
+    def begin_iteration(self) -> None:
+        self.iteration += 1
+        self.iteration_started_at = time.monotonic()
+        if self.dump_timeout and (self.dump_armed_at is None or self.iteration_started_at - self.dump_armed_at > self.dump_timeout * REARM_FRACTION):
+            faulthandler.dump_traceback_later(self.dump_timeout, repeat=False)
+            self.dump_armed_at = self.iteration_started_at
+
+    def end_iteration(self) -> None:
+        if self.iteration_started_at is None:
+            return
+        lag = time.monotonic() - self.iteration_started_at
+        self.iteration_started_at = None
+        self.total_lag += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+            metrics.MAIN_LOOP_MAX_LAG.set(lag)
+
+    def check(self) -> None:
+        iteration = self.iteration
+        started_at = self.iteration_started_at
+        if started_at is None or self.reported_iteration == iteration:
+            return
+        lag = time.monotonic() - started_at
+        if lag < self.threshold:
+            return
+        self.reported_iteration = iteration
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        call_site = LoopWatchdog.get_call_site(stack)
+        self.stall_counts[call_site] = self.stall_counts.get(call_site, 0) + 1
+        metrics.MAIN_LOOP_STALLS.inc(call_site=call_site)
+        warning(None, 'Warning: main loop blocked for more than %.3fs in %s:\n%s', lag, call_site, ''.join(traceback.format_list(stack)).rstrip())
+
+    def output(self) -> None:
+        average_lag = self.total_lag / self.iteration if self.iteration else 0.0
+        log(None, f'Main loop: {self.iteration} iterations, average lag {average_lag * 1000:.1f}ms, max lag {self.max_lag * 1000:.1f}ms')
+        for call_site, count in sorted(self.stall_counts.items(), key=lambda item: item[1], reverse=True):
+            log(None, f'    {count} stalls in {call_site}')
+
+    @staticmethod
+    def get_call_site(stack: List[traceback.FrameSummary]) -> str:
+        """Returns the innermost frame inside ha-sip, which is more telling than e.g. a socket call in a library."""
+        for frame_summary in reversed(stack):
+            if frame_summary.filename.startswith(constants.ROOT_PATH + os.sep):
+                return f'{os.path.basename(frame_summary.filename)}:{frame_summary.lineno} {frame_summary.name}'
+        if stack:
+            return f'{os.path.basename(stack[-1].filename)}:{stack[-1].lineno} {stack[-1].name}'
+        return 'unknown'
+
+
+def create_watchdog(threshold: float, dump_timeout: float) -> Optional[LoopWatchdog]:
+    if not threshold:
+        return None
+    loop_watchdog = LoopWatchdog(threshold, dump_timeout)
+    loop_watchdog.start()
+    return loop_watchdog
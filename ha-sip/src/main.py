@@ -3,32 +3,71 @@ import asyncio
 import faulthandler
 import os
 import sys
+import time
 from typing import Optional, Any
 
+import pjsua2 as pj
 import yaml
 
 import account
 import call
+import cdr
+import command_server
 import config
 import ha
 import incoming_call
+import metrics
 import mqtt
 import options_global
 import options_sip
+import profiling
 import sip
 import state
+import timeline
+import trace_recorder
 import utils
 from command_client import CommandClient
 from command_handler import CommandHandler
 from event_sender import EventSender
 from ha import TtsConfigFromEnv
-from log import log
+from log import log, configure_logging, error
+from loop_watchdog import LoopWatchdog, create_watchdog
 
 
-def handle_command_list(command_client: CommandClient, command_handler: CommandHandler) -> None:
+def enqueue_command_list(command_client: CommandClient, command_handler: CommandHandler) -> None:
     command_list = command_client.get_command_list()
     for command in command_list:
-        command_handler.handle_command(command, None)
+        command_handler.enqueue_command(command, 'stdin')
+
+
+def run_loop_iteration(
+    end_point: pj.Endpoint,
+    mqtt_client: Optional[mqtt.MqttClient],
+    command_client: CommandClient,
+    command_handler: CommandHandler,
+    call_state: state.State,
+    loop_watchdog: Optional[LoopWatchdog],
+    api_server: Optional[command_server.CommandServer] = None,
+) -> None:
+    iteration_start = time.monotonic()
+    if loop_watchdog:
+        loop_watchdog.begin_iteration()
+    if mqtt_client:
+        mqtt_client.handle()
+    end_point.libHandleEvents(10)
+    enqueue_command_list(command_client, command_handler)
+    if api_server:
+        api_server.handle_pending(command_handler.enqueue_command)
+    command_handler.run_queued_commands()
+    command_handler.handle_queued_dials()
+    command_handler.handle_early_media_retries()
+    command_handler.handle_dial_campaigns()
+    command_handler.handle_cdr_stats()
+    for c in list(call_state.current_call_dict.values()):
+        c.handle_events()
+    metrics.MAIN_LOOP_SECONDS.observe(time.monotonic() - iteration_start)
+    if loop_watchdog:
+        loop_watchdog.end_iteration()
 
 
 def load_menu_from_file(file_name: Optional[str], sip_account_index: int) -> Optional[incoming_call.IncomingCallConfig]:
@@ -39,9 +78,9 @@ def load_menu_from_file(file_name: Optional[str], sip_account_index: int) -> Opt
         with open(file_name) as stream:
             content = yaml.safe_load(stream)
             log(sip_account_index, f'Loaded menu for incoming call from "{file_name}".')
-            return content
+            return incoming_call.compile_number_lists(content)
     except BaseException as e:
-        log(sip_account_index, f'Error loading menu for incoming call: {e}')
+        error(sip_account_index, 'Error loading menu for incoming call: %s', e)
         return None
 
 
@@ -58,7 +97,7 @@ def get_cache_dir(raw_cache_dir: str) -> Optional[str]:
         log(None, 'No cache directory configured.')
         return None
     if not os.path.isdir(raw_cache_dir):
-        log(None, 'Error: Cache directory not found.')
+        error(None, 'Error: Cache directory not found.')
         return None
     log(None, f"Found cache directory '{raw_cache_dir}'")
     return raw_cache_dir
@@ -66,6 +105,14 @@ def get_cache_dir(raw_cache_dir: str) -> Optional[str]:
 
 def main():
     global_options = options_global.parse_global_options(config.GLOBAL_OPTIONS)
+    configure_logging(global_options.log_level, global_options.log_module_levels, global_options.log_json)
+    metrics.start_server(global_options.metrics_host, global_options.metrics_port)
+    timeline.configure_writer(
+        global_options.timeline_file,
+        global_options.timeline_otel_file,
+        global_options.timeline_max_bytes,
+        global_options.timeline_backup_count,
+    )
     name_server = get_name_server(config.NAME_SERVER)
     cache_dir = get_cache_dir(config.CACHE_DIR)
     endpoint_config = sip.MyEndpointConfig(
@@ -134,11 +181,18 @@ def main():
     is_first_enabled_account = True
     event_sender = EventSender()
     command_client = CommandClient()
-    command_handler = CommandHandler(end_point, sip_accounts, call_state, ha_config, event_sender)
+    loop_watchdog = create_watchdog(global_options.watchdog_threshold, global_options.watchdog_dump_timeout)
+    cdr_store = cdr.create_store(global_options.cdr_file)
+    profiler = profiling.Profiler(global_options.profile_dir)
+    command_handler = CommandHandler(end_point, sip_accounts, call_state, ha_config, event_sender, loop_watchdog, cdr_store, profiler)
     for key, account_config in account_configs.items():
         if account_config.enabled:
             sip_accounts[key] = account.create_account(end_point, account_config, command_handler, event_sender, ha_config, is_first_enabled_account)
+            sip_accounts[key].prepare_early_media()
             is_first_enabled_account = False
+    trace_recorder.configure(global_options.trace_file, {
+        index: {'mode': sip_account.config.mode.name, 'settle_time': sip_account.config.settle_time} for index, sip_account in sip_accounts.items()
+    })
     mqtt_mode = config.COMMAND_SOURCE.lower().strip() == 'mqtt'
     mqtt_client = mqtt.create_client_and_connect(command_handler) if mqtt_mode else None
     def trigger_webhook(event: Any, webhook_id: Optional[str] = None):
@@ -148,13 +202,9 @@ def main():
             mqtt_client.send_event(event)
     event_sender.register_sender(trigger_webhook)
     event_sender.register_sender(send_mqtt_event)
+    api_server = command_server.create_and_start(global_options.command_socket, global_options.command_http_port)
     while True:
-        if mqtt_client:
-            mqtt_client.handle()
-        end_point.libHandleEvents(10)
-        handle_command_list(command_client, command_handler)
-        for c in list(call_state.current_call_dict.values()):
-            c.handle_events()
+        run_loop_iteration(end_point, mqtt_client, command_client, command_handler, call_state, loop_watchdog, api_server)
 
 
 if __name__ == '__main__':
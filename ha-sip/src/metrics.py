@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from log import log, error
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(label_names: Tuple[str, ...], label_values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(object):
+    metric_type = 'untyped'
+
+    def __init__(self, registry: Registry, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        registry.register(self)
+
+    def label_values(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}'] + self.render_samples()
+
+    def render_samples(self) -> List[str]:
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def __init__(self, registry: Registry, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.values: Dict[LabelValues, float] = {}
+        super().__init__(registry, name, documentation, label_names)
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self.label_values(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels: object) -> float:
+        return self.values.get(self.label_values(labels), 0.0)
+
+    def render_samples(self) -> List[str]:
+        return [f'{self.name}{format_labels(self.label_names, key)} {format_value(value)}' for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self.label_values(labels)
+        with self.registry.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(
+        self,
+        registry: Registry,
+        name: str,
+        documentation: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.bucket_counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+        super().__init__(registry, name, documentation, label_names)
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self.label_values(labels)
+        with self.registry.lock:
+            counts = self.bucket_counts.get(key)
+            if counts is None:
+                counts = [0] * len(self.buckets)
+                self.bucket_counts[key] = counts
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[index] += 1
+                    break
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def get_count(self, **labels: object) -> int:
+        return sum(self.bucket_counts.get(self.label_values(labels), []))
+
+    def render_samples(self) -> List[str]:
+        lines = []
+        for key, counts in self.bucket_counts.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = format_labels(self.label_names, key, f'le="{format_value(upper_bound)}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, key)} {format_value(self.sums[key])}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+ACTIVE_CALLS = Gauge(REGISTRY, 'hasip_active_calls', 'Number of currently active calls', ('account',))
+CALL_SETUP_SECONDS = Histogram(
+    REGISTRY, 'hasip_call_setup_seconds', 'Time from call creation until the call is ringing (early state)', ('account', 'direction'),
+)
+CALL_ANSWER_SECONDS = Histogram(
+    REGISTRY, 'hasip_call_answer_seconds', 'Time from call creation until the call is confirmed', ('account', 'direction'),
+)
+TTS_SECONDS = Histogram(REGISTRY, 'hasip_tts_seconds', 'Latency of TTS requests to home-assistant', ('stage',))
+TTS_FAILURES = Counter(REGISTRY, 'hasip_tts_failures_total', 'Number of failed TTS requests', ('stage',))
+FFMPEG_SECONDS = Histogram(REGISTRY, 'hasip_ffmpeg_conversion_seconds', 'Time spent converting audio with ffmpeg')
+FFMPEG_FAILURES = Counter(REGISTRY, 'hasip_ffmpeg_failures_total', 'Number of failed ffmpeg conversions')
+AUDIO_CACHE_REQUESTS = Counter(REGISTRY, 'hasip_audio_cache_requests_total', 'Lookups in the audio cache', ('result',))
+EVENT_SEND_SECONDS = Histogram(REGISTRY, 'hasip_event_send_seconds', 'Latency of sending events', ('transport',))
+EVENT_SEND_FAILURES = Counter(REGISTRY, 'hasip_event_send_failures_total', 'Number of events which could not be sent', ('transport',))
+DTMF_ACTION_SECONDS = Histogram(REGISTRY, 'hasip_dtmf_action_seconds', 'Time from receiving a DTMF digit until it was handled')
+MAIN_LOOP_SECONDS = Histogram(
+    REGISTRY, 'hasip_main_loop_iteration_seconds', 'Duration of one main loop iteration',
+    buckets=(0.005, 0.01, 0.015, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+COMMAND_API_SECONDS = Histogram(
+    REGISTRY, 'hasip_command_api_seconds', 'Time from receiving a command on the command socket or HTTP API until it was handled', ('transport',),
+)
+COMMAND_QUEUE_SECONDS = Histogram(
+    REGISTRY, 'hasip_command_queue_seconds', 'Time commands from stdin and MQTT waited in the command queue', ('command',),
+)
+COMMAND_QUEUE_LENGTH = Gauge(REGISTRY, 'hasip_command_queue_length', 'Number of commands waiting in the command queue')
+MAIN_LOOP_MAX_LAG = Gauge(REGISTRY, 'hasip_main_loop_max_lag_seconds', 'Longest main loop iteration since start')
+MAIN_LOOP_STALLS = Counter(REGISTRY, 'hasip_main_loop_stalls_total', 'Main loop iterations exceeding the watchdog threshold', ('call_site',))
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        error(None, 'Error: Could not start metrics server on %s:%s: %s', host, port, e)
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    log(None, f'Metrics available on http://{host}:{port}/metrics')
+    return server
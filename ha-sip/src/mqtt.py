@@ -6,10 +6,11 @@ import paho.mqtt.client as paho_mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 
 import config
+import metrics
 import utils
 from command_client import CommandClient
 from command_handler import CommandHandler
-from log import log
+from log import log, debug
 
 
 class MqttClient:
@@ -50,10 +51,10 @@ class MqttClient:
         log(None, f'Lost connection to mqtt broker with reason code {reason_code}')
 
     def on_message(self, client, userdata, msg):
-        log(None, f'Received mqtt payload: {msg.payload} on topic: {msg.topic}')
+        debug(None, 'Received mqtt payload: %s on topic: %s', msg.payload, msg.topic)
         command_list = CommandClient.list_to_json([msg.payload])
         for command in command_list:
-            self.command_handler.handle_command(command, None)
+            self.command_handler.enqueue_command(command, 'mqtt')
 
     def connect(self):
         self.client.connect(self.broker_address, self.port, 60)
@@ -72,9 +73,13 @@ class MqttClient:
             return
         if not self.client.is_connected():
             log(None, 'Cannot send message, mqtt client is not connected')
+            metrics.EVENT_SEND_FAILURES.inc(transport='mqtt')
             return
-        log(None, f'Sending mqtt message: {event} to topic: {self.topic}')
-        self.client.publish(self.topic_state, json.dumps(event))
+        debug(None, 'Sending mqtt message: %s to topic: %s', event, self.topic_state)
+        with metrics.EVENT_SEND_SECONDS.time(transport='mqtt'):
+            message_info = self.client.publish(self.topic_state, json.dumps(event))
+        if message_info.rc != paho_mqtt.MQTT_ERR_SUCCESS:
+            metrics.EVENT_SEND_FAILURES.inc(transport='mqtt')
 
 def create_client_and_connect(command_handler: CommandHandler) -> MqttClient:
     broker_address = config.BROKER_ADDRESS
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Iterable, Optional, Pattern, Set
+
+WILDCARD_SPLIT_REGEX = re.compile(r'(\{\*}|\{\?})')
+
+
+class NumberMatcher(object):
+    """
+    Pre-compiled version of an allowed/blocked number list.
+
+    Exact numbers are kept in a set, patterns of the form "<prefix>{*}" in a set of prefixes and all remaining
+    wildcard patterns are combined into one regular expression.
+    """
+    def __init__(self, number_list: Optional[Iterable[Any]]):
+        self.exact_numbers: Set[str] = set()
+        self.prefixes: Set[str] = set()
+        self.prefix_lengths: list[int] = []
+        self.pattern_regex: Optional[Pattern[str]] = None
+        self.size = 0
+        patterns: list[str] = []
+        for entry in number_list or []:
+            number = str(entry)
+            self.size += 1
+            parts = WILDCARD_SPLIT_REGEX.split(number)
+            if len(parts) == 1:
+                self.exact_numbers.add(number)
+            elif len(parts) == 3 and parts[1] == '{*}' and parts[2] == '':
+                self.prefixes.add(parts[0])
+            else:
+                patterns.append(''.join(map(NumberMatcher.map_to_regex, parts)))
+        self.prefix_lengths = sorted({len(p) for p in self.prefixes})
+        if patterns:
+            self.pattern_regex = re.compile('(?:' + '|'.join(patterns) + ')')
+
+    def matches(self, number: Optional[str]) -> bool:
+        if not number:
+            return False
+        if number in self.exact_numbers:
+            return True
+        for prefix_length in self.prefix_lengths:
+            if prefix_length > len(number):
+                break
+            if number[:prefix_length] in self.prefixes:
+                return True
+        if self.pattern_regex and self.pattern_regex.fullmatch(number):
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    @staticmethod
+    def map_to_regex(st: str) -> str:
+        if st == '{*}':
+            return '.*'
+        if st == '{?}':
+            return '.'
+        return re.escape(st)
@@ -1,30 +1,104 @@
 import argparse
-from typing import Optional
+from typing import Optional, Dict
 
-from log import log
+from typing_extensions import Literal
+
+from log import log, LogLevel, parse_module_levels
 from options import ALL_BOOL_VALUES, is_true
 
 
+SettleMode = Literal['fixed', 'adaptive']
+
+
 class GlobalOptions:
     stun_server: Optional[str] = None
     enable_udp: bool = True
     enable_tcp: bool = True
     enable_tls: bool = False
     tls_port: int = 5061
+    max_calls: int = 4
     debug_headers: bool = False
+    log_level: LogLevel = LogLevel.INFO
+    log_module_levels: Dict[str, LogLevel] = {}
+    log_json: bool = False
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 0
+    watchdog_threshold: float = 1.0
+    watchdog_dump_timeout: float = 60.0
+    timeline_file: Optional[str] = None
+    timeline_otel_file: Optional[str] = None
+    timeline_max_bytes: int = 10 * 1024 * 1024
+    timeline_backup_count: int = 3
+    cdr_file: Optional[str] = None
+    profile_dir: Optional[str] = None
+    trace_file: Optional[str] = None
+    command_socket: Optional[str] = None
+    command_http_port: int = 0
+    settle_mode: SettleMode = 'fixed'
+    settle_guard_time: float = 0.2
 
-    def __init__(self, stun_server: Optional[str], enable_udp: bool, enable_tcp: bool, enable_tls: bool, tls_port: int, debug_headers: bool):
+    def __init__(
+        self,
+        stun_server: Optional[str],
+        enable_udp: bool,
+        enable_tcp: bool,
+        enable_tls: bool,
+        tls_port: int,
+        max_calls: int,
+        debug_headers: bool,
+        log_level: LogLevel,
+        log_module_levels: Dict[str, LogLevel],
+        log_json: bool,
+        metrics_host: str,
+        metrics_port: int,
+        watchdog_threshold: float,
+        watchdog_dump_timeout: float,
+        timeline_file: Optional[str],
+        timeline_otel_file: Optional[str],
+        timeline_max_bytes: int,
+        timeline_backup_count: int,
+        cdr_file: Optional[str],
+        profile_dir: Optional[str],
+        trace_file: Optional[str],
+        command_socket: Optional[str],
+        command_http_port: int,
+        settle_mode: SettleMode = 'fixed',
+        settle_guard_time: float = 0.2,
+    ):
         self.stun_server = stun_server
         self.enable_udp = enable_udp
         self.enable_tcp = enable_tcp
         self.enable_tls = enable_tls
         self.tls_port = tls_port
+        self.max_calls = max_calls
         self.debug_headers = debug_headers
+        self.log_level = log_level
+        self.log_module_levels = log_module_levels
+        self.log_json = log_json
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.watchdog_threshold = watchdog_threshold
+        self.watchdog_dump_timeout = watchdog_dump_timeout
+        self.timeline_file = timeline_file
+        self.timeline_otel_file = timeline_otel_file
+        self.timeline_max_bytes = timeline_max_bytes
+        self.timeline_backup_count = timeline_backup_count
+        self.cdr_file = cdr_file
+        self.profile_dir = profile_dir
+        self.trace_file = trace_file
+        self.command_socket = command_socket
+        self.command_http_port = command_http_port
+        self.settle_mode = settle_mode
+        self.settle_guard_time = settle_guard_time
         log(None, f'STUN Server: {self.stun_server}')
         log(None, f'UDP Enabled: {self.enable_udp}')
         log(None, f'TCP Enabled: {self.enable_tcp}')
         log(None, f'TLS Enabled: {self.enable_tls}')
         log(None, f'TLS Port: {self.tls_port}')
+        log(None, f'PJSIP max calls: {self.max_calls}')
+        log(None, f'Log level: {self.log_level.name}')
+        if self.settle_mode == 'adaptive':
+            log(None, f'Adaptive settle time with guard time of {self.settle_guard_time}s')
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -58,12 +132,118 @@ def create_parser() -> argparse.ArgumentParser:
         default=5061,
         help='Port to use for TLS transport (default: 5061)'
     )
+    parser.add_argument(
+        '--pjsip-max-calls',
+        type=int,
+        default=4,
+        help='Maximum number of simultaneous calls handled by PJSIP, at most 32 (default: 4)'
+    )
     parser.add_argument(
         '--debug-headers',
         choices=ALL_BOOL_VALUES,
         default='disabled',
         help='Enable debug printing of extracted SIP headers (default: disabled)'
     )
+    parser.add_argument(
+        '--log-level',
+        choices=['debug', 'info', 'warning', 'error'],
+        default='info',
+        help='Minimum level of ha-sip log messages (default: info)'
+    )
+    parser.add_argument(
+        '--log-module-levels',
+        default=None,
+        help='Comma-separated list of per-module log levels, e.g. "ha=debug,mqtt=warning" (default: None)'
+    )
+    parser.add_argument(
+        '--log-format',
+        choices=['text', 'json'],
+        default='text',
+        help='Output format of ha-sip log messages (default: text)'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=0,
+        help='Port of the HTTP endpoint serving metrics in Prometheus text format, 0 to disable (default: 0)'
+    )
+    parser.add_argument(
+        '--metrics-host',
+        default='127.0.0.1',
+        help='Address the metrics endpoint is bound to (default: 127.0.0.1)'
+    )
+    parser.add_argument(
+        '--watchdog-threshold',
+        type=float,
+        default=1.0,
+        help='Log the stack of the main loop when one iteration takes longer than this many seconds, 0 to disable (default: 1.0)'
+    )
+    parser.add_argument(
+        '--watchdog-dump-timeout',
+        type=float,
+        default=60.0,
+        help='Dump the stacks of all threads when the main loop is stuck for this many seconds, 0 to disable (default: 60)'
+    )
+    parser.add_argument(
+        '--timeline-file',
+        default=None,
+        help='File to write one JSON line with the milestones of each finished call to (default: None)'
+    )
+    parser.add_argument(
+        '--timeline-otel-file',
+        default=None,
+        help='File to write the call timelines to as OpenTelemetry spans in OTLP/JSON format (default: None)'
+    )
+    parser.add_argument(
+        '--timeline-max-bytes',
+        type=int,
+        default=10 * 1024 * 1024,
+        help='Size in bytes after which the timeline files are rotated, 0 to disable rotation (default: 10485760)'
+    )
+    parser.add_argument(
+        '--timeline-backup-count',
+        type=int,
+        default=3,
+        help='Number of rotated timeline files to keep (default: 3)'
+    )
+    parser.add_argument(
+        '--cdr-file',
+        default=None,
+        help='SQLite database to store a call detail record of each finished call in (default: None)'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        default=None,
+        help='Directory the CPU profiles and memory reports of the profiling commands are written to (default: None)'
+    )
+    parser.add_argument(
+        '--trace-file',
+        default=None,
+        help='File to record all commands, PJSIP callbacks and events to, for replaying them later (default: None)'
+    )
+    parser.add_argument(
+        '--command-socket',
+        default=None,
+        help='Unix domain socket to accept commands on, answered with the result of each command (default: None)'
+    )
+    parser.add_argument(
+        '--command-http-port',
+        type=int,
+        default=0,
+        help='Port of the HTTP command API on 127.0.0.1, 0 to disable (default: 0)'
+    )
+    parser.add_argument(
+        '--settle-mode',
+        default='fixed',
+        choices=['fixed', 'adaptive'],
+        help='Wait the settle time after a call was answered, or only until media is flowing with the settle time as maximum (default: fixed)'
+    )
+    parser.add_argument(
+        '--settle-guard-time',
+        type=float,
+        default=0.2,
+        help='Seconds to wait after media became active in adaptive settle mode (default: 0.2)'
+    )
     return parser
 
 def parse_global_options(raw: Optional[str]) -> GlobalOptions:
@@ -76,5 +256,24 @@ def parse_global_options(raw: Optional[str]) -> GlobalOptions:
         enable_tcp=is_true(args.tcp),
         enable_tls=is_true(args.tls),
         tls_port=args.tls_port,
+        max_calls=args.pjsip_max_calls,
         debug_headers=is_true(args.debug_headers),
+        log_level=LogLevel.get_or_else(args.log_level, LogLevel.INFO),
+        log_module_levels=parse_module_levels(args.log_module_levels),
+        log_json=args.log_format == 'json',
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
+        watchdog_threshold=args.watchdog_threshold,
+        watchdog_dump_timeout=args.watchdog_dump_timeout,
+        timeline_file=args.timeline_file,
+        timeline_otel_file=args.timeline_otel_file,
+        timeline_max_bytes=args.timeline_max_bytes,
+        timeline_backup_count=args.timeline_backup_count,
+        cdr_file=args.cdr_file,
+        profile_dir=args.profile_dir,
+        trace_file=args.trace_file,
+        command_socket=args.command_socket,
+        command_http_port=args.command_http_port,
+        settle_mode=args.settle_mode,
+        settle_guard_time=args.settle_guard_time,
     )
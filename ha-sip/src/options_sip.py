@@ -5,7 +5,8 @@ from pjsua2 import PJ_TURN_TP_TCP, PJ_TURN_TP_UDP, PJ_TURN_TP_TLS
 from typing import List
 from typing_extensions import Literal, Optional, Any
 
-from log import log
+from admission import OverloadPolicy
+from log import log, error
 from options import ALL_BOOL_VALUES, is_true
 
 
@@ -60,6 +61,9 @@ class SipOptions:
     sdp_nat_rewrite_use: bool
     sip_outbound_use: bool
     extract_headers: List[str]
+    max_concurrent_calls: int
+    max_call_rate: float
+    overload_policy: OverloadPolicy
 
     def __init__(
         self,
@@ -74,6 +78,9 @@ class SipOptions:
         turn_server: Optional[TurnServer],
         extract_headers: List[str],
         account_index: int,
+        max_concurrent_calls: int = 0,
+        max_call_rate: float = 0.0,
+        overload_policy: OverloadPolicy = 'queue',
     ):
         self.proxy = proxy
         self.enable_ice = enable_ice
@@ -85,11 +92,20 @@ class SipOptions:
         self.sdp_nat_rewrite_use = sdp_nat_rewrite_use
         self.sip_outbound_use = sip_outbound_use
         self.extract_headers = extract_headers
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_call_rate = max_call_rate
+        self.overload_policy = overload_policy
         log(account_index, f'Proxy set to: {self.proxy}')
         log(account_index, f'ICE is enabled: {self.enable_ice}')
         log(account_index, f'TURN server is enabled: {self.turn_server is not None}')
         if self.extract_headers:
             log(account_index, f'Extract headers: {self.extract_headers}')
+        if self.max_concurrent_calls or self.max_call_rate:
+            log(
+                account_index,
+                f'Max concurrent calls: {self.max_concurrent_calls or "unlimited"}, max call rate: {self.max_call_rate or "unlimited"}/s, '
+                f'overload policy: {self.overload_policy}',
+            )
 
 
 def create_parser() -> ArgumentParser:
@@ -167,6 +183,24 @@ def create_parser() -> ArgumentParser:
         default=None,
         help='Comma-separated list of SIP headers to extract (default: None)'
     )
+    parser.add_argument(
+        '--max-concurrent-calls',
+        type=int,
+        default=0,
+        help='Maximum number of active incoming and outgoing calls, 0 for no limit (default: 0)'
+    )
+    parser.add_argument(
+        '--max-call-rate',
+        type=float,
+        default=0.0,
+        help='Maximum number of new calls per second, 0 for no limit (default: 0)'
+    )
+    parser.add_argument(
+        '--overload-policy',
+        default='queue',
+        choices=['queue', 'reject'],
+        help='Queue or reject dial commands exceeding the limits, incoming calls are always rejected (default: queue)'
+    )
     return parser
 
 
@@ -179,7 +213,7 @@ def parse_sip_options(raw: str, account_index: int = 0) -> SipOptions:
         not args.turn_user and
         not args.turn_password
     ):
-        log(account_index, 'Error: TURN server requires user and password. Disabling TURN server.')
+        error(account_index, 'Error: TURN server requires user and password. Disabling TURN server.')
     turn_server = TurnServer(args.turn_server, args.turn_connection_type, args.turn_user, args.turn_password) if args.turn_server else None
     extract_headers = [h.strip() for h in args.extract_headers.split(',')] if args.extract_headers else []
     return SipOptions(
@@ -193,5 +227,8 @@ def parse_sip_options(raw: str, account_index: int = 0) -> SipOptions:
         sip_outbound_use=is_true(args.use_sip_outbound),
         turn_server=turn_server,
         extract_headers=extract_headers,
-        account_index=account_index
+        account_index=account_index,
+        max_concurrent_calls=args.max_concurrent_calls,
+        max_call_rate=args.max_call_rate,
+        overload_policy=args.overload_policy,
     )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Optional, Tuple
+
+from log import log, warning
+
+TRACEMALLOC_FRAMES = 25
+REPORT_LIMIT = 50
+
+# file name of the written report, error message
+ReportResult = Tuple[Optional[str], Optional[str]]
+
+
+class Profiler(object):
+    """
+    Runs cProfile and tracemalloc on demand. Commands are handled on the main thread, so the CPU profile covers
+    the main loop including all pjsua2 callbacks.
+    """
+    def __init__(self, profile_dir: Optional[str]):
+        self.profile_dir = profile_dir
+        self.profile: Optional[cProfile.Profile] = None
+        self.profile_started_at = 0.0
+        self.last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def get_file_name(self, prefix: str, suffix: str) -> str:
+        return os.path.join(self.profile_dir or '', f'{prefix}-{time.strftime("%Y%m%d-%H%M%S")}{suffix}')
+
+    def check_profile_dir(self) -> Optional[str]:
+        """Creates the profile directory if needed and returns an error message when reports can't be written to it."""
+        if not self.profile_dir:
+            return 'No profile directory configured. Use --profile-dir in global options.'
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        except OSError as e:
+            return f'Could not create profile directory {self.profile_dir}: {e}'
+        if not os.access(self.profile_dir, os.W_OK | os.X_OK):
+            return f'Profile directory is not writable: {self.profile_dir}'
+        return None
+
+    def start_profile(self) -> Optional[str]:
+        """Returns an error message if the profile can't be started, so a capture is never lost when it is stopped."""
+        if self.profile:
+            warning(None, 'Warning: CPU profile already running')
+            return None
+        profile_dir_error = self.check_profile_dir()
+        if profile_dir_error:
+            return profile_dir_error
+        self.profile = cProfile.Profile()
+        self.profile_started_at = time.monotonic()
+        self.profile.enable()
+        log(None, 'CPU profile started')
+        return None
+
+    def stop_profile(self, sort_by: str = 'cumulative') -> ReportResult:
+        if not self.profile:
+            return None, 'No CPU profile running'
+        profile = self.profile
+        profile.disable()
+        self.profile = None
+        duration = time.monotonic() - self.profile_started_at
+        profile_dir_error = self.check_profile_dir()
+        if profile_dir_error:
+            return None, profile_dir_error
+        file_name = self.get_file_name('ha-sip-cpu', '.prof')
+        profile.dump_stats(file_name)
+        report = io.StringIO()
+        stats = pstats.Stats(profile, stream=report)
+        try:
+            stats.sort_stats(sort_by)
+        except KeyError:
+            warning(None, 'Warning: Unknown sort key %s, sorting by cumulative time', sort_by)
+            stats.sort_stats('cumulative')
+        stats.print_stats(REPORT_LIMIT)
+        with open(file_name[:-len('.prof')] + '.txt', 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        log(None, f'CPU profile of {duration:.1f}s written to {file_name}')
+        return file_name, None
+
+    def memory_snapshot(self, stop: bool = False) -> ReportResult:
+        """Starts memory tracing on the first call, later calls write a report. Returns no file name when tracing was just started."""
+        if stop and not tracemalloc.is_tracing():
+            return None, 'Memory tracing is not running'
+        profile_dir_error = self.check_profile_dir()
+        if profile_dir_error:
+            return None, profile_dir_error
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.last_snapshot = None
+            log(None, 'Memory tracing started. Send memory_snapshot again to write a report.')
+            return None, None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        if stop:
+            tracemalloc.stop()
+        file_name = self.get_file_name('ha-sip-memory', '.txt')
+        lines = [f'Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB', '', f'Top {REPORT_LIMIT} allocations:']
+        lines += [str(statistic) for statistic in snapshot.statistics('lineno')[:REPORT_LIMIT]]
+        if self.last_snapshot:
+            lines += ['', f'Top {REPORT_LIMIT} differences to the previous snapshot:']
+            lines += [str(statistic) for statistic in snapshot.compare_to(self.last_snapshot, 'lineno')[:REPORT_LIMIT]]
+        self.last_snapshot = None if stop else snapshot
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        log(None, f'Memory report written to {file_name}' + (' (memory tracing stopped)' if stop else ''))
+        return file_name, None
@@ -17,6 +17,7 @@ def create_endpoint(ep_config: MyEndpointConfig) -> pj.Endpoint:
     ep_cfg.logConfig.level = ep_config.log_level
     ep_cfg.uaConfig.threadCnt = 0
     ep_cfg.uaConfig.mainThreadOnly = True
+    ep_cfg.uaConfig.maxCalls = ep_config.global_options.max_calls
     if ep_config.name_server:
         nameserver = pj.StringVector()
         for ns in ep_config.name_server:
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+from log import log
+
+# RFC 3261 section 7.3.3 and later extensions
+COMPACT_HEADER_NAMES = {
+    'a': 'accept-contact',
+    'b': 'referred-by',
+    'c': 'content-type',
+    'd': 'request-disposition',
+    'e': 'content-encoding',
+    'f': 'from',
+    'i': 'call-id',
+    'j': 'reject-contact',
+    'k': 'supported',
+    'l': 'content-length',
+    'm': 'contact',
+    'n': 'identity-info',
+    'o': 'event',
+    'r': 'refer-to',
+    's': 'subject',
+    't': 'to',
+    'u': 'allow-events',
+    'v': 'via',
+    'x': 'session-expires',
+    'y': 'identity',
+}
+
+
+def normalize_header_name(name: str) -> str:
+    lower_name = name.strip().lower()
+    return COMPACT_HEADER_NAMES.get(lower_name, lower_name)
+
+
+class SipHeaders(object):
+    """
+    Case-insensitive multi-map of the header block of a SIP message.
+
+    The header block is parsed lazily in a single pass on first access, so one instance can be shared between
+    debug logging and header extraction without parsing the message twice.
+    """
+    def __init__(self, whole_msg: str):
+        self.whole_msg = whole_msg
+        self._headers: Optional[List[Tuple[str, str]]] = None
+        self._header_map: Optional[Dict[str, List[str]]] = None
+
+    def _parse(self) -> None:
+        headers: List[Tuple[str, str]] = []
+        header_map: Dict[str, List[str]] = {}
+        header_end = self.whole_msg.find('\n\n')
+        crlf_header_end = self.whole_msg.find('\r\n\r\n')
+        if crlf_header_end != -1 and (header_end == -1 or crlf_header_end < header_end):
+            header_end = crlf_header_end
+        header_block = self.whole_msg if header_end == -1 else self.whole_msg[:header_end]
+        lines = header_block.splitlines()
+        if lines and SipHeaders.is_start_line(lines[0]):
+            lines = lines[1:]
+        for line in lines:
+            if line[:1] in (' ', '\t') and headers:
+                # folded header: continuation of the previous header value
+                name, value = headers[-1]
+                folded_value = (value + ' ' + line.strip()).strip()
+                headers[-1] = (name, folded_value)
+                header_map[normalize_header_name(name)][-1] = folded_value
+                continue
+            if ':' not in line:
+                continue
+            name, value = line.split(':', 1)
+            name = name.strip()
+            value = value.strip()
+            headers.append((name, value))
+            header_map.setdefault(normalize_header_name(name), []).append(value)
+        self._headers = headers
+        self._header_map = header_map
+
+    def items(self) -> List[Tuple[str, str]]:
+        if self._headers is None:
+            self._parse()
+        assert self._headers is not None
+        return self._headers
+
+    def get_all(self, name: str) -> List[str]:
+        if self._header_map is None:
+            self._parse()
+        assert self._header_map is not None
+        return self._header_map.get(normalize_header_name(name), [])
+
+    def get(self, name: str) -> Optional[str]:
+        values = self.get_all(name)
+        # if a header is present multiple times, the last occurrence wins
+        return values[-1] if values else None
+
+    def extract(self, header_names: List[str]) -> Dict[str, Optional[str]]:
+        return {name: self.get(name) for name in header_names}
+
+    def log_all(self, account_index: int) -> None:
+        log(account_index, 'Available SIP headers:')
+        for name, value in self.items():
+            log(account_index, f'  {name}: {value}')
+
+    @staticmethod
+    def is_start_line(line: str) -> bool:
+        return line.startswith('SIP/2.0 ') or line.rstrip().endswith(' SIP/2.0')
@@ -0,0 +1,44 @@
+"""
+Imports ha-sip modules against benchmarks/fake_pjsua2, for tests which drive calls without PJSIP.
+
+The modules imported inside fake_pjsua2_modules() are private copies bound to the fake: when the block ends, the fake
+and these copies are removed from sys.modules again and the previous modules are restored. So other test modules
+still get the real pjsua2, independent of the order in which the tests are discovered.
+"""
+from __future__ import annotations
+
+import contextlib
+import os
+import sys
+from types import ModuleType
+from typing import Dict, Iterator
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def is_bound_to_pjsua2(name: str) -> bool:
+    if name == 'pjsua2':
+        return True
+    if name == 'tests' or name.startswith('tests.'):
+        return False
+    file_name = getattr(sys.modules[name], '__file__', None)
+    return bool(file_name) and os.path.realpath(file_name).startswith(SOURCE_DIR + os.sep)
+
+
+def remove_modules() -> Dict[str, ModuleType]:
+    return {name: sys.modules.pop(name) for name in list(sys.modules) if is_bound_to_pjsua2(name)}
+
+
+@contextlib.contextmanager
+def fake_pjsua2_modules() -> Iterator[None]:
+    previous_modules = remove_modules()
+    try:
+        from benchmarks import fake_pjsua2
+        fake_pjsua2.install()
+        from log import LogLevel, configure_logging
+        # the log module is a private copy as well, so this doesn't change the log level of other tests
+        configure_logging(LogLevel.ERROR, {}, False)
+        yield
+    finally:
+        remove_modules()
+        sys.modules.update(previous_modules)
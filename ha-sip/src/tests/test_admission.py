@@ -0,0 +1,42 @@
+import time
+import unittest
+from typing import Any
+
+from admission import AdmissionControl
+
+
+def dial(number: str) -> Any:
+    return {'command': 'dial', 'number': number}
+
+
+class AdmissionControlTest(unittest.TestCase):
+    def test_unlimited(self):
+        admission = AdmissionControl(0, 0.0, 'queue')
+        self.assertFalse(admission.is_limited())
+        self.assertEqual([admission.admit(100) for _ in range(10)], [None] * 10)
+
+    def test_max_concurrent_calls(self):
+        admission = AdmissionControl(2, 0.0, 'queue')
+        self.assertIsNone(admission.admit(1))
+        self.assertEqual(admission.admit(2), 'max_concurrent_calls')
+
+    def test_max_call_rate(self):
+        admission = AdmissionControl(0, 2.0, 'reject')
+        self.assertEqual([admission.admit(0) for _ in range(3)], [None, None, 'max_call_rate'])
+        admission.tokens_updated_at -= 0.5
+        self.assertIsNone(admission.admit(0))
+        self.assertEqual(admission.admit(0), 'max_call_rate')
+
+    def test_rejected_by_concurrency_does_not_take_a_token(self):
+        admission = AdmissionControl(1, 1.0, 'queue')
+        self.assertEqual(admission.admit(1), 'max_concurrent_calls')
+        self.assertIsNone(admission.admit(0))
+
+    def test_queue_expires_in_order(self):
+        admission = AdmissionControl(1, 0.0, 'queue', queue_timeout=0.01)
+        self.assertTrue(admission.enqueue(dial('1')))
+        time.sleep(0.02)
+        self.assertTrue(admission.enqueue(dial('2')))
+        expired = admission.expire()
+        self.assertEqual([queued.command['number'] for queued in expired], ['1'])
+        self.assertEqual([queued.command['number'] for queued in admission.queue], ['2'])
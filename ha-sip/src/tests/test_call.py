@@ -0,0 +1,183 @@
+import time
+import unittest
+from typing import Any, List, Optional
+from unittest import mock
+
+from tests.fake_sip import fake_pjsua2_modules
+
+with fake_pjsua2_modules():
+    from benchmarks import fake_pjsua2, fixtures
+    import call
+    import pjsua2 as pj
+
+
+class CallTestCase(unittest.TestCase):
+    def setUp(self):
+        self.events: List[Any] = []
+
+    def create_call(self, menu: Any) -> call.Call:
+        return fixtures.create_call(fixtures.create_command_handler(events=self.events), menu, connected=True)
+
+
+class DigitCollectionTest(CallTestCase):
+
+    def collected(self) -> List[Any]:
+        return [(e['digits'], e['reason']) for e in self.events if e['event'] == 'digits_collected']
+
+    def press(self, new_call: Any, digits: str) -> None:
+        for digit in digits:
+            new_call.simulate_dtmf(digit)
+        new_call.handle_events()
+
+    def test_max_length(self):
+        new_call = self.create_call({'id': 'account', 'collect_digits': {'max_length': 3}})
+        self.press(new_call, '12345')
+        self.assertEqual(self.collected(), [('123', 'max_length')])
+        self.assertEqual(new_call.current_input, '45')
+        self.assertEqual([e for e in self.events if e['event'] == 'dtmf_digit'], [])
+
+    def test_terminator(self):
+        new_call = self.create_call({'id': 'account', 'collect_digits': True})
+        self.press(new_call, '4711#')
+        self.assertEqual(self.collected(), [('4711', 'terminator')])
+        self.assertEqual(new_call.current_input, '')
+
+    def test_terminator_without_digits_is_ignored(self):
+        new_call = self.create_call({'id': 'account', 'collect_digits': True})
+        self.press(new_call, '#')
+        self.assertEqual(self.collected(), [])
+        self.press(new_call, '1#')
+        self.assertEqual(self.collected(), [('1', 'terminator')])
+
+    def test_inter_digit_timeout(self):
+        new_call = self.create_call({'id': 'account', 'collect_digits': {'inter_digit_timeout': 2}})
+        self.press(new_call, '12')
+        self.assertEqual(self.collected(), [])
+        new_call.last_digit_at = time.time() - 3
+        new_call.handle_events()
+        self.assertEqual(self.collected(), [('12', 'inter_digit_timeout')])
+        new_call.handle_events()
+        self.assertEqual(len(self.collected()), 1)
+
+    def test_collected_digits_select_choice(self):
+        menu = {
+            'id': 'account',
+            'collect_digits': {'terminator': '*'},
+            'choices': {'42': {'id': 'found', 'post_action': 'noop'}, 'default': {'id': 'wrong', 'post_action': 'noop'}},
+        }
+        new_call = self.create_call(menu)
+        self.press(new_call, '42*')
+        self.assertEqual(new_call.menu['id'], 'found')
+
+
+class AdaptiveSettleTest(CallTestCase):
+    def setUp(self):
+        super().setUp()
+        self.call = self.create_call({'id': 'main', 'message': None})
+        self.call.connected = False
+        self.call.settle_time = 5.0
+        self.call.settle_mode = 'adaptive'
+        self.call.settle_guard_time = 0.2
+
+    def settled_reason(self) -> Optional[str]:
+        return next((attributes['reason'] for _, name, attributes in self.call.timeline.milestones if name == 'settled'), None)
+
+    def test_settles_after_media_and_guard_time(self):
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertAlmostEqual(self.call.call_settled_at or 0.0, time.time() + 5.0, delta=0.1)
+        self.call.simulate_media_active()
+        self.assertEqual(self.call.settle_reason, 'media')
+        self.assertAlmostEqual(self.call.call_settled_at or 0.0, time.time() + 0.2, delta=0.1)
+        self.call.handle_events()
+        self.assertFalse(self.call.connected)
+        self.call.call_settled_at = time.time()
+        self.call.handle_events()
+        self.assertTrue(self.call.connected)
+        self.assertEqual(self.settled_reason(), 'media')
+
+    def test_media_before_confirmation(self):
+        self.call.simulate_media_active()
+        self.call.media_active_at = time.time() - 1.0
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.call.handle_events()
+        self.assertTrue(self.call.connected)
+        self.assertEqual(self.settled_reason(), 'media')
+
+    def test_settles_on_rtp(self):
+        self.call.settle_guard_time = 10.0
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.call.simulate_media_active()
+        self.assertEqual(self.call.settle_reason, 'timer')
+        self.call.handle_events()
+        self.assertFalse(self.call.connected)
+        self.call.fake_rx_packets = 1
+        self.call.handle_events()
+        self.assertTrue(self.call.connected)
+        self.assertEqual(self.settled_reason(), 'rtp')
+
+    def test_settle_time_is_the_cap(self):
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.call.handle_events()
+        self.assertFalse(self.call.connected)
+        self.call.call_settled_at = time.time() - 0.01
+        self.call.handle_events()
+        self.assertTrue(self.call.connected)
+        self.assertEqual(self.settled_reason(), 'timer')
+
+    def test_rtp_is_not_polled_once_media_is_the_settle_point(self):
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.call.simulate_media_active()
+        with mock.patch.object(fake_pjsua2.Call, 'getStreamStat') as get_stream_stat:
+            self.call.handle_events()
+            self.call.handle_events()
+            get_stream_stat.assert_not_called()
+
+    def test_fixed_mode_ignores_media(self):
+        self.call.settle_mode = 'fixed'
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.call.simulate_media_active()
+        self.call.fake_rx_packets = 1
+        self.call.handle_events()
+        self.assertFalse(self.call.connected)
+        self.assertEqual(self.call.settle_reason, 'timer')
+
+
+class CallInfoSnapshotTest(CallTestCase):
+    def setUp(self):
+        super().setUp()
+        self.call = self.create_call({'id': 'main', 'message': None})
+
+    def test_call_id_is_refreshed_in_place(self):
+        snapshot = self.call.get_call_info()
+        self.call.fake_info.callIdString = 'new-call-id'
+        self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertIs(self.call.call_info, snapshot)
+        self.assertEqual(snapshot['call_id'], 'new-call-id')
+
+    def test_uris_are_only_parsed_when_changed(self):
+        self.call.get_call_info()
+        with mock.patch.object(call.Call, 'parse_caller', wraps=call.Call.parse_caller) as parse_caller:
+            self.call.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+            self.call.simulate_media_active()
+            self.assertEqual(parse_caller.call_count, 0)
+            self.call.fake_info.remoteUri = '"Bob" <sip:bob@x>'
+            self.call.simulate_media_active()
+            self.assertEqual(parse_caller.call_count, 2)
+        self.assertEqual(self.call.get_call_info()['parsed_caller'], 'bob')
+
+    def test_webhook_uses_refreshed_snapshot_of_outgoing_call(self):
+        command_handler = self.call.command_handler
+        outgoing = call.Call(
+            command_handler.end_point, self.call.account, pj.PJSUA_INVALID_ID, 'sip:**620@fritz.box', None, command_handler,
+            command_handler.event_sender, command_handler.ha_config, 300, None, {},
+        )
+        self.assertIsNone(outgoing.call_info)
+        # a snapshot taken before makeCall still has the placeholder info of the call
+        outgoing.get_call_info()
+        outgoing.makeCall('sip:**620@fritz.box', pj.CallOpParam(True))
+        outgoing.fake_info.callIdString = 'sip-call-id'
+        outgoing.simulate_state(pj.PJSIP_INV_STATE_CALLING)
+        with mock.patch.object(outgoing, 'getInfo', side_effect=AssertionError('web-hooks must use the snapshot')):
+            outgoing.trigger_webhook({'event': 'ring_timeout'})
+        event = self.events[-1]
+        self.assertEqual((event['caller'], event['parsed_caller'], event['call_id']), ('<sip:**620@fritz.box>', '**620', 'sip-call-id'))
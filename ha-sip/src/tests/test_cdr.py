@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+
+import cdr
+from timeline import CallTimeline
+
+
+def create_timeline(start: float, milestones: list) -> CallTimeline:
+    call_timeline = CallTimeline()
+    for offset, name, attributes in milestones:
+        call_timeline.milestones.append((start + offset, name, attributes))
+    return call_timeline
+
+
+class CdrTest(unittest.TestCase):
+    def test_create_record(self):
+        call_timeline = create_timeline(1000.0, [
+            (0.0, 'invite_received', {}),
+            (0.1, 'ringing_sent', {'status_code': 180}),
+            (2.0, 'confirmed', {}),
+            (3.0, 'dtmf', {'digit': '1'}),
+            (3.5, 'dtmf', {'digit': '#'}),
+            (10.0, 'disconnected', {}),
+        ])
+        record = cdr.create_record(call_timeline, 1, 'incoming', 'sip:a@b', 'id', 'a', 'b', 200, ['main'], [])
+        self.assertTrue(record['answered'])
+        self.assertAlmostEqual(record['setup_time'] or 0.0, 0.1)
+        self.assertAlmostEqual(record['ring_duration'], 2.0)
+        self.assertAlmostEqual(record['talk_duration'], 8.0)
+        self.assertEqual(record['digits'], '1#')
+        self.assertAlmostEqual(record['latencies']['confirmed'], 2.0)
+
+    def test_unanswered_call(self):
+        call_timeline = create_timeline(1000.0, [(0.0, 'make_call', {}), (30.0, 'disconnected', {})])
+        record = cdr.create_record(call_timeline, 1, 'outgoing', 'sip:a@b', None, 'a', None, 408, [], [])
+        self.assertFalse(record['answered'])
+        self.assertIsNone(record['setup_time'])
+        self.assertAlmostEqual(record['ring_duration'], 30.0)
+        self.assertEqual(record['talk_duration'], 0.0)
+
+    def test_percentile(self):
+        self.assertIsNone(cdr.percentile([], 50))
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(cdr.percentile(values, 50), 50.0)
+        self.assertEqual(cdr.percentile(values, 95), 95.0)
+        self.assertEqual(cdr.percentile([3.0], 95), 3.0)
+
+    def test_store_and_stats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = cdr.CdrStore(os.path.join(directory, 'cdr.db'))
+            now = time.time()
+            for index in range(4):
+                call_timeline = create_timeline(now - 60, [
+                    (0.0, 'make_call', {}),
+                    (0.1 * (index + 1), 'early', {}),
+                    (1.0, 'confirmed', {}),
+                    (5.0, 'disconnected', {}),
+                ])
+                store.add(cdr.create_record(call_timeline, 1, 'outgoing', f'call-{index}', None, None, None, 200, [], []))
+            self.assertEqual(store.pop_stats(), [])
+            self.assertTrue(store.request_stats(1.0))
+            store.writer.flush()
+            stats = store.pop_stats()[0]
+            self.assertEqual(stats['calls'], 4)
+            self.assertEqual(stats['answered'], 4)
+            self.assertAlmostEqual(stats['setup_time_p50'] or 0.0, 0.2, places=3)
+            self.assertAlmostEqual(stats['setup_time_p95'] or 0.0, 0.4, places=3)
+            self.assertEqual(sum(stats['calls_by_hour'].values()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from choice_trie import ChoiceTrie
+
+
+class ChoiceTrieTest(unittest.TestCase):
+    def test_empty(self):
+        trie = ChoiceTrie()
+        self.assertEqual(len(trie), 0)
+        self.assertEqual(trie.max_length, 0)
+        self.assertEqual('1' in trie, False)
+        self.assertEqual(trie.is_prefix('1'), False)
+
+    def test_contains(self):
+        trie = ChoiceTrie(['1', '23', '1234'])
+        self.assertEqual('1' in trie, True)
+        self.assertEqual('23' in trie, True)
+        self.assertEqual('1234' in trie, True)
+        self.assertEqual('2' in trie, False)
+        self.assertEqual('12' in trie, False)
+        self.assertEqual('12345' in trie, False)
+
+    def test_is_prefix(self):
+        trie = ChoiceTrie(['1234', '5432', '*9#'])
+        self.assertEqual(trie.is_prefix('1'), True)
+        self.assertEqual(trie.is_prefix('123'), True)
+        self.assertEqual(trie.is_prefix('1234'), True)
+        self.assertEqual(trie.is_prefix('12345'), False)
+        self.assertEqual(trie.is_prefix('13'), False)
+        self.assertEqual(trie.is_prefix('*9'), True)
+
+    def test_max_length_and_size(self):
+        trie = ChoiceTrie(['1', '22', '333', '22'])
+        self.assertEqual(len(trie), 3)
+        self.assertEqual(trie.max_length, 3)
+
+    def test_many_pins(self):
+        trie = ChoiceTrie(str(pin).zfill(6) for pin in range(0, 100000, 7))
+        self.assertEqual('000007' in trie, True)
+        self.assertEqual('000008' in trie, False)
+        self.assertEqual(trie.max_length, 6)
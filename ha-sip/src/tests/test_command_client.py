@@ -0,0 +1,54 @@
+import unittest
+
+from command_client import CommandClient, unwrap_envelope, validate_batch
+
+
+class CommandEnvelopeTest(unittest.TestCase):
+    def test_array_becomes_batch(self):
+        commands = [{'command': 'hangup', 'number': '1'}, {'command': 'state'}]
+        self.assertEqual(unwrap_envelope(commands), {'command': 'batch', 'commands': commands, 'id': None, 'atomic': False})
+
+    def test_batch_envelope(self):
+        batch = unwrap_envelope({'batch': [{'command': 'state'}], 'id': 'morning', 'atomic': True})
+        self.assertEqual(batch, {'command': 'batch', 'commands': [{'command': 'state'}], 'id': 'morning', 'atomic': True})
+
+    def test_single_command_is_unchanged(self):
+        self.assertEqual(unwrap_envelope({'command': 'state'}), {'command': 'state'})
+
+    def test_list_to_json(self):
+        commands = CommandClient.list_to_json(['{"command": "state"}', '', '[{"command": "quit"}]', '{"broken'])
+        self.assertEqual(commands, [
+            {'command': 'state'},
+            {'command': 'batch', 'commands': [{'command': 'quit'}], 'id': None, 'atomic': False},
+        ])
+
+
+class ValidateBatchTest(unittest.TestCase):
+    def test_valid_batch(self):
+        errors = validate_batch([
+            {'command': 'dial', 'number': 'sip:1@fritz.box'},
+            {'command': 'play_message', 'number': 'sip:1@fritz.box', 'message': 'Hello'},
+            {'command': 'start_recording', 'number': '42', 'recording_file': '/tmp/42.wav'},
+            {'domain': 'light', 'service': 'turn_on'},
+        ], lambda number: number == '42')
+        self.assertEqual(errors, [None, None, None, None])
+
+    def test_invalid_commands(self):
+        errors = validate_batch([
+            'hangup',
+            {'command': 'unknown'},
+            {'command': 'transfer', 'number': '42'},
+            {'command': 'hangup', 'number': '43'},
+            {'command': 'dial', 'number': '42'},
+            {'command': 'batch', 'commands': []},
+            {'service': 'turn_on'},
+        ], lambda number: number == '42')
+        self.assertEqual(errors, [
+            'Not an object',
+            'Unknown command: unknown',
+            'Missing transfer_to for command "transfer"',
+            'call not in progress: 43',
+            'call already in progress: 42',
+            'Nested batches are not supported',
+            'Missing domain for command "call_service"',
+        ])
@@ -0,0 +1,94 @@
+import time
+import unittest
+from typing import Any, List, Optional
+
+import metrics
+from command_client import CommandResult
+from command_queue import CommandQueue, ResultCallback, PRIORITY_CONTROL, PRIORITY_MEDIA, get_priority
+
+
+class CommandQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = CommandQueue()
+        self.executed = []
+
+    def put(self, command: Any, source: str, on_result: Optional[ResultCallback] = None) -> None:
+        self.queue.put(command, source, on_result)
+
+    def handle_command(self, command: Any) -> CommandResult:
+        self.executed.append(command.get('command'))
+        return {'command': command.get('command'), 'ok': True, 'error': None, 'call_id': None}
+
+    def test_control_commands_preempt_media_commands(self):
+        self.put({'command': 'play_message', 'number': '1', 'message': 'Hello'}, 'stdin')
+        self.put({'domain': 'light', 'service': 'turn_on'}, 'stdin')
+        self.put({'command': 'send_dtmf', 'number': '2', 'digits': '1'}, 'stdin')
+        self.put({'command': 'hangup', 'number': '3'}, 'mqtt')
+        self.put({'command': 'dial', 'number': '4'}, 'mqtt')
+        self.queue.run(self.handle_command)
+        self.assertEqual(self.executed, ['hangup', 'send_dtmf', 'play_message', None, 'dial'])
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(metrics.COMMAND_QUEUE_LENGTH.get(), 0)
+
+    def test_command_is_not_moved_ahead_of_dial_for_same_call(self):
+        self.put({'command': 'dial', 'number': '1'}, 'stdin')
+        self.put({'command': 'hangup', 'number': '1'}, 'stdin')
+        self.put({'command': 'hangup', 'number': '2'}, 'stdin')
+        self.queue.run(self.handle_command)
+        self.assertEqual(self.executed, ['hangup', 'dial', 'hangup'])
+
+    def test_command_is_not_moved_ahead_of_dial_many_or_dial_group(self):
+        self.put({'command': 'dial_many', 'numbers': ['1', {'number': '2'}]}, 'stdin')
+        self.put({'command': 'dial_group', 'numbers': [3]}, 'stdin')
+        self.put({'command': 'hangup', 'number': '2'}, 'stdin')
+        self.put({'command': 'hangup', 'number': '3'}, 'stdin')
+        self.put({'command': 'hangup', 'number': '4'}, 'stdin')
+        self.queue.run(self.handle_command)
+        self.assertEqual(self.executed, ['hangup', 'dial_many', 'dial_group', 'hangup', 'hangup'])
+
+    def test_stop_playback_is_not_moved_ahead_of_play_message_for_same_call(self):
+        self.put({'command': 'play_message', 'number': '1', 'message': 'Hello'}, 'stdin')
+        self.put({'command': 'play_message', 'number': '2', 'message': 'Hello'}, 'stdin')
+        self.put({'command': 'stop_playback', 'number': '1'}, 'stdin')
+        self.put({'command': 'stop_playback', 'number': '3'}, 'stdin')
+        self.queue.run(self.handle_command)
+        self.assertEqual(self.executed, ['stop_playback', 'play_message', 'play_message', 'stop_playback'])
+
+    def test_command_is_not_moved_ahead_of_batch_for_same_call(self):
+        self.put({'command': 'batch', 'commands': [{'command': 'answer', 'number': '1'}, {'command': 'play_message', 'number': '1'}]}, 'stdin')
+        self.put({'command': 'hangup', 'number': '1'}, 'stdin')
+        self.queue.run(self.handle_command)
+        self.assertEqual(self.executed, ['batch', 'hangup'])
+
+    def test_result_callback(self):
+        results: List[CommandResult] = []
+
+        def failing_handle_command(command: Any) -> CommandResult:
+            if command.get('command') == 'fail':
+                raise ValueError('broken')
+            return self.handle_command(command)
+        self.put({'command': 'fail'}, 'http', results.append)
+        self.put({'command': 'hangup', 'number': '1'}, 'socket', results.append)
+        self.queue.run(failing_handle_command)
+        self.assertEqual([(r['command'], r['ok'], r['error']) for r in results], [('hangup', True, None), ('fail', False, 'broken')])
+
+    def test_time_budget_defers_slow_commands_but_not_control(self):
+        self.queue.time_budget = 0.01
+
+        def slow_handle_command(command: Any) -> CommandResult:
+            time.sleep(0.02)
+            return self.handle_command(command)
+        self.put({'command': 'play_message', 'number': '1'}, 'stdin')
+        self.put({'command': 'play_message', 'number': '2'}, 'stdin')
+        self.queue.run(slow_handle_command)
+        self.assertEqual(self.executed, ['play_message'])
+        self.put({'command': 'hangup', 'number': '4'}, 'mqtt')
+        self.put({'command': 'hangup', 'number': '3'}, 'mqtt')
+        self.queue.run(slow_handle_command)
+        self.assertEqual(self.executed, ['play_message', 'hangup', 'hangup'])
+        self.queue.run(slow_handle_command)
+        self.assertEqual(self.executed, ['play_message', 'hangup', 'hangup', 'play_message'])
+
+    def test_batch_priority(self):
+        self.assertEqual(get_priority({'command': 'batch', 'commands': [{'command': 'hangup', 'number': '1'}]}), PRIORITY_CONTROL)
+        self.assertEqual(get_priority({'command': 'batch', 'commands': [{'command': 'hangup'}, {'command': 'dial'}]}), PRIORITY_MEDIA)
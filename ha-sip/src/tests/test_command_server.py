@@ -0,0 +1,113 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from typing import Any
+
+import command_server
+from command_client import CommandResult
+from command_queue import CommandQueue
+
+
+def handle_command(command: Any) -> CommandResult:
+    if command.get('command') == 'fail':
+        raise ValueError('broken')
+    return {'command': command.get('command'), 'ok': True, 'error': None, 'call_id': command.get('number')}
+
+
+class CommandServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, 'ha-sip.sock')
+        self.server = command_server.CommandServer(self.socket_path, 0, timeout=2.0)
+        self.server.start()
+        self.running = True
+        self.main_loop = threading.Thread(target=self.run_main_loop)
+        self.main_loop.start()
+
+    def tearDown(self):
+        self.running = False
+        self.main_loop.join()
+        self.server.stop()
+        self.directory.cleanup()
+
+    def run_main_loop(self):
+        command_queue = CommandQueue()
+        while self.running:
+            self.server.handle_pending(command_queue.put)
+            command_queue.run(handle_command)
+            time.sleep(0.001)
+
+    def send_lines(self, lines):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            reader = client.makefile('rb')
+            responses = []
+            for line in lines:
+                client.sendall(line.encode() + b'\n')
+                responses.append(json.loads(reader.readline()))
+            return responses
+
+    def test_socket_answers_each_line_on_one_connection(self):
+        responses = self.send_lines([
+            json.dumps({'command': 'hangup', 'number': '42'}),
+            json.dumps([{'command': 'dial', 'number': '1'}, {'command': 'fail'}]),
+            '{"command": ',
+        ])
+        self.assertEqual(responses[0], {'command': 'hangup', 'ok': True, 'error': None, 'call_id': '42'})
+        self.assertEqual([r['ok'] for r in responses[1]], [True, False])
+        self.assertEqual(responses[1][1]['error'], 'broken')
+        self.assertFalse(responses[2]['ok'])
+        self.assertTrue(responses[2]['error'].startswith('invalid JSON'))
+
+    def test_results_keep_request_order_when_commands_are_reordered(self):
+        responses = self.send_lines([json.dumps([
+            {'command': 'play_message', 'number': '1'},
+            {'command': 'hangup', 'number': '2'},
+            {'command': 'send_dtmf', 'number': '3'},
+        ])])
+        self.assertEqual([(r['command'], r['call_id']) for r in responses[0]], [('play_message', '1'), ('hangup', '2'), ('send_dtmf', '3')])
+
+    def test_timeout_when_main_loop_is_not_running(self):
+        self.running = False
+        self.main_loop.join()
+        self.server.timeout = 0.05
+        responses = self.send_lines([json.dumps({'command': 'hangup', 'number': '42'})])
+        self.assertEqual(responses[0]['error'], 'timeout waiting for the main loop')
+
+
+class CommandHttpServerTest(unittest.TestCase):
+    def test_http_keep_alive(self):
+        server = command_server.CommandServer(None, 0)
+        http_server = command_server.CommandHttpServer(('127.0.0.1', 0), server)
+        server.start_thread(http_server, 'command-http-test')
+        running = True
+
+        def run_main_loop():
+            command_queue = CommandQueue()
+            while running:
+                server.handle_pending(command_queue.put)
+                command_queue.run(handle_command)
+                time.sleep(0.001)
+        main_loop = threading.Thread(target=run_main_loop)
+        main_loop.start()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', http_server.server_address[1])
+            connection.request('POST', '/command', json.dumps({'command': 'answer', 'number': '7'}))
+            first = connection.getresponse()
+            self.assertEqual(first.status, 200)
+            self.assertEqual(json.loads(first.read())['call_id'], '7')
+            connection.request('POST', '/command', json.dumps([{'command': 'hangup', 'number': '7'}]))
+            second = connection.getresponse()
+            self.assertEqual(json.loads(second.read())[0]['command'], 'hangup')
+            connection.request('POST', '/command', b'not json')
+            self.assertEqual(connection.getresponse().status, 400)
+            connection.close()
+        finally:
+            running = False
+            main_loop.join()
+            server.stop()
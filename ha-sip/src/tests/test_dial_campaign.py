@@ -0,0 +1,168 @@
+import time
+import unittest
+from typing import Any, List, Set
+from unittest import mock
+
+from tests.fake_sip import fake_pjsua2_modules
+
+with fake_pjsua2_modules():
+    from benchmarks import fixtures
+    import call
+    import pjsua2 as pj
+    from admission import AdmissionControl
+    from dial_campaign import DialCampaign, parse_targets
+
+
+class StubAccount(object):
+    def __init__(self):
+        self.config: Any = mock.Mock(index=1)
+        self.admission = AdmissionControl(0, 0, 'queue')
+
+
+class StubCommandHandler(object):
+    def __init__(self):
+        self.events: List[Any] = []
+        self.event_sender = fixtures.create_event_sender(self.events)
+        self.end_point = None
+        self.ha_config = None
+        self.active_numbers: Set[str] = set()
+
+    def active_calls_on_account(self, sip_account: Any) -> int:
+        return len(self.active_numbers)
+
+    def is_active(self, number: str) -> bool:
+        return number in self.active_numbers
+
+
+class StubCall(object):
+    def __init__(self, number: str):
+        self.number = number
+        self.listeners: List[Any] = []
+
+    def add_state_listener(self, listener: Any) -> None:
+        self.listeners.append(listener)
+
+
+class ParseTargetsTest(unittest.TestCase):
+    def test_valid_targets(self):
+        menu: Any = {'message': 'Hello'}
+        targets = parse_targets(['1', 2, {'number': '3'}, {'number': 4, 'menu': {'message': 'Hi'}}], menu)
+        assert targets is not None
+        self.assertEqual([t['number'] for t in targets], ['1', '2', '3', '4'])
+        self.assertIs(targets[0]['menu'], menu)
+        self.assertEqual(targets[3]['menu'], {'message': 'Hi'})
+
+    def test_invalid_targets(self):
+        self.assertIsNone(parse_targets([], None))
+        self.assertIsNone(parse_targets('123', None))
+        self.assertIsNone(parse_targets(['1', {'menu': {}}], None))
+        self.assertIsNone(parse_targets(['1', None], None))
+        self.assertIsNone(parse_targets([''], None))
+
+
+class DialCampaignTest(unittest.TestCase):
+    def setUp(self):
+        self.command_handler = StubCommandHandler()
+        self.calls: List[StubCall] = []
+        patcher = mock.patch.object(call, 'make_call', side_effect=self.make_call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_call(self, end_point: Any, sip_account: Any, number: str, *args: Any) -> StubCall:
+        new_call = StubCall(number)
+        self.calls.append(new_call)
+        self.command_handler.active_numbers.add(number)
+        return new_call
+
+    def create_campaign(self, numbers: List[str], max_concurrent: int = 10, calls_per_second: float = 0.0, retries: int = 2) -> DialCampaign:
+        targets = parse_targets(numbers, None)
+        assert targets is not None
+        command_handler: Any = self.command_handler
+        sip_account: Any = StubAccount()
+        return DialCampaign('test', targets, sip_account, command_handler, 30, None, max_concurrent, calls_per_second, retries, 5.0)
+
+    def end_call(self, stub_call: StubCall, answered: bool, status_code: int) -> None:
+        self.command_handler.active_numbers.discard(stub_call.number)
+        if answered:
+            for listener in stub_call.listeners:
+                listener(stub_call, pj.PJSIP_INV_STATE_CONFIRMED, 200)
+        for listener in stub_call.listeners:
+            listener(stub_call, pj.PJSIP_INV_STATE_DISCONNECTED, status_code)
+
+    def events(self, name: str) -> List[Any]:
+        return [event for event in self.command_handler.events if event['event'] == name]
+
+    def test_calls_per_second(self):
+        campaign = self.create_campaign(['1', '2', '3'], calls_per_second=2)
+        campaign.handle_events()
+        self.assertEqual([c.number for c in self.calls], ['1'])
+        self.assertAlmostEqual(campaign.next_start_at, time.time() + 0.5, delta=0.1)
+        campaign.handle_events()
+        self.assertEqual(len(self.calls), 1)
+        campaign.next_start_at = 0.0
+        campaign.handle_events()
+        self.assertEqual([c.number for c in self.calls], ['1', '2'])
+
+    def test_max_concurrent(self):
+        campaign = self.create_campaign(['1', '2', '3'], max_concurrent=2)
+        campaign.handle_events()
+        self.assertEqual([c.number for c in self.calls], ['1', '2'])
+        self.end_call(self.calls[0], True, 200)
+        campaign.handle_events()
+        self.assertEqual([c.number for c in self.calls], ['1', '2', '3'])
+
+    def test_busy_is_retried_with_exponential_backoff(self):
+        campaign = self.create_campaign(['1'], retries=2)
+        campaign.handle_events()
+        attempt = campaign.attempts[0]
+        self.end_call(self.calls[-1], False, 486)
+        self.assertAlmostEqual(attempt.next_attempt_at, time.time() + 5.0, delta=0.1)
+        campaign.handle_events()
+        self.assertEqual(len(self.calls), 1)
+        attempt.next_attempt_at = 0.0
+        campaign.handle_events()
+        self.end_call(self.calls[-1], False, 503)
+        self.assertAlmostEqual(attempt.next_attempt_at, time.time() + 10.0, delta=0.1)
+        attempt.next_attempt_at = 0.0
+        campaign.handle_events()
+        self.end_call(self.calls[-1], False, 486)
+        self.assertEqual(len(self.calls), 3)
+        self.assertTrue(campaign.handle_events())
+        self.assertEqual(attempt.result, {'number': '1', 'result': 'busy', 'status_code': 486, 'attempts': 3})
+
+    def test_busy_everywhere_is_not_retried(self):
+        campaign = self.create_campaign(['1'])
+        campaign.handle_events()
+        self.end_call(self.calls[0], False, 600)
+        self.assertTrue(campaign.handle_events())
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.events('dial_result')[0]['result'], 'busy')
+
+    def test_active_number_is_skipped_without_using_the_call_rate(self):
+        campaign = self.create_campaign(['1', '2'])
+        campaign.sip_account.admission = AdmissionControl(0, 1, 'queue')
+        self.command_handler.active_numbers.add('1')
+        campaign.handle_events()
+        self.assertEqual([c.number for c in self.calls], ['2'])
+        self.assertEqual(self.events('dial_result')[0]['result'], 'skipped')
+
+    def test_summary(self):
+        campaign = self.create_campaign(['1', '2', '3', '4'], retries=0)
+        self.command_handler.active_numbers.add('4')
+        campaign.handle_events()
+        self.command_handler.active_numbers.discard('4')
+        self.end_call(self.calls[0], True, 200)
+        self.end_call(self.calls[1], False, 486)
+        self.end_call(self.calls[2], False, 404)
+        self.assertTrue(campaign.handle_events())
+        campaign.send_summary()
+        summary = self.events('dial_many_completed')[0]
+        self.assertEqual(
+            (summary['total'], summary['answered'], summary['busy'], summary['failed'], summary['skipped']),
+            (4, 1, 1, 1, 1),
+        )
+        self.assertEqual(len(self.events('dial_result')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from typing import Any, List
+from unittest import mock
+
+from tests.fake_sip import fake_pjsua2_modules
+
+with fake_pjsua2_modules():
+    from benchmarks import fake_pjsua2, fixtures
+    import pjsua2 as pj
+    from admission import AdmissionControl
+    from dial_campaign import DialTarget
+    from dial_group import DialGroup
+
+
+def targets(*numbers: str) -> List[DialTarget]:
+    return [{'number': number, 'menu': None} for number in numbers]
+
+
+class DialGroupTest(unittest.TestCase):
+    def setUp(self):
+        self.events: List[Any] = []
+        self.command_handler = fixtures.create_command_handler(events=self.events)
+        self.sip_account = fixtures.create_account(self.command_handler)
+        self.group = DialGroup('group', self.sip_account, self.command_handler)
+
+    def event_names(self, internal_id: str) -> List[str]:
+        return [event['event'] for event in self.events if event.get('internal_id') == internal_id]
+
+    @staticmethod
+    def hangups(member: Any) -> int:
+        return sum(1 for operation in member.operations if operation[0] == 'hangup')
+
+    def results(self) -> List[Any]:
+        return [event for event in self.events if event['event'] == 'dial_group_completed']
+
+    def test_first_confirmed_call_wins(self):
+        self.assertEqual(self.group.dial(targets('sip:1@x', 'sip:2@x', 'sip:3@x'), 30, None), 3)
+        first, second, third = self.group.ringing
+        second.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertIs(self.group.winner, second)
+        self.assertEqual(self.hangups(first), 1)
+        self.assertEqual(self.hangups(second), 0)
+        self.assertEqual(self.hangups(third), 1)
+        self.assertTrue(first.silent and third.silent)
+        self.assertFalse(second.silent)
+        self.assertEqual(len(self.results()), 1)
+        self.assertEqual(self.results()[0]['answered_by'], 'sip:2@x')
+        self.assertEqual(self.results()[0]['numbers'], ['sip:1@x', 'sip:2@x', 'sip:3@x'])
+        # a loser answering before its cancellation went through is hung up again and sends nothing
+        first.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertIs(self.group.winner, second)
+        self.assertEqual(self.hangups(first), 2)
+        for member in (first, second, third):
+            member.handle_events()
+        first.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 487)
+        third.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 487)
+        self.assertEqual(self.event_names('sip:1@x'), [])
+        self.assertEqual(self.event_names('sip:3@x'), [])
+        self.assertIn('call_established', self.event_names('sip:2@x'))
+        second.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 200)
+        self.assertIn('call_disconnected', self.event_names('sip:2@x'))
+        self.assertEqual(len(self.results()), 1)
+
+    def test_nobody_answered(self):
+        self.group.dial(targets('sip:1@x', 'sip:2@x'), 30, None)
+        first, second = self.group.ringing
+        first.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 486)
+        self.assertEqual(self.results(), [])
+        second.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 408)
+        self.assertEqual(len(self.results()), 1)
+        self.assertIsNone(self.results()[0]['answered_by'])
+        self.assertEqual(self.group.ringing, [])
+
+    def test_failed_make_call_is_left_out(self):
+        original_make_call = fake_pjsua2.Call.makeCall
+
+        def make_call(fake_call: Any, dest_uri: str, prm: Any) -> None:
+            if dest_uri == 'sip:2@x':
+                raise RuntimeError('no route')
+            original_make_call(fake_call, dest_uri, prm)
+        with mock.patch.object(fake_pjsua2.Call, 'makeCall', make_call):
+            self.assertEqual(self.group.dial(targets('sip:1@x', 'sip:2@x', 'sip:3@x'), 30, None), 2)
+        self.assertEqual(self.group.numbers, ['sip:1@x', 'sip:3@x'])
+        self.assertFalse(self.command_handler.is_active('sip:2@x'))
+        self.group.ringing[1].simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertEqual(self.results()[0]['answered_by'], 'sip:3@x')
+
+    def test_number_already_in_call_is_skipped(self):
+        self.group.dial(targets('sip:1@x'), 30, None)
+        other_group = DialGroup('other', self.sip_account, self.command_handler)
+        self.assertEqual(other_group.dial(targets('sip:1@x', 'sip:2@x'), 30, None), 1)
+        self.assertEqual(other_group.numbers, ['sip:2@x'])
+
+
+    def test_numbers_beyond_the_call_rate_are_queued(self):
+        self.sip_account.admission = AdmissionControl(0, 1, 'queue')
+        self.assertEqual(self.group.dial(targets('sip:1@x', 'sip:2@x', 'sip:3@x'), 30, None), 3)
+        self.assertEqual(self.group.numbers, ['sip:1@x'])
+        self.assertEqual(self.group.queued, {'sip:2@x', 'sip:3@x'})
+        self.assertNotIn('call_rejected', [event['event'] for event in self.events])
+        self.sip_account.admission.tokens = 1.0
+        self.command_handler.handle_queued_dials()
+        self.assertEqual(self.group.numbers, ['sip:1@x', 'sip:2@x'])
+        self.group.ringing[1].simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        self.assertEqual(self.results()[0]['answered_by'], 'sip:2@x')
+        self.assertEqual(self.hangups(self.group.ringing[0]), 1)
+        # the number still queued is not dialed anymore once the group has a winner
+        self.assertEqual(len(self.sip_account.admission.queue), 0)
+        self.sip_account.admission.tokens = 1.0
+        self.command_handler.handle_queued_dials()
+        self.assertFalse(self.command_handler.is_active('sip:3@x'))
+
+    def test_nobody_answered_waits_for_queued_numbers(self):
+        self.sip_account.admission = AdmissionControl(0, 1, 'queue', queue_timeout=0)
+        self.group.dial(targets('sip:1@x', 'sip:2@x'), 30, None)
+        self.group.ringing[0].simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 486)
+        self.assertEqual(self.results(), [])
+        self.command_handler.handle_queued_dials()
+        self.assertEqual([event['reason'] for event in self.events if event['event'] == 'call_rejected'], ['queue_timeout'])
+        self.assertEqual(len(self.results()), 1)
+        self.assertIsNone(self.results()[0]['answered_by'])
+
+    def test_numbers_beyond_the_call_rate_are_rejected_with_reject_policy(self):
+        self.sip_account.admission = AdmissionControl(0, 1, 'reject')
+        self.assertEqual(self.group.dial(targets('sip:1@x', 'sip:2@x'), 30, None), 1)
+        self.assertEqual(self.group.queued, set())
+        self.assertEqual([event['reason'] for event in self.events if event['event'] == 'call_rejected'], ['max_call_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,3 +50,13 @@ class GlobalOptionsTest(unittest.TestCase):
     def test_parse_debug_headers_disabled(self):
         options = parse_global_options('--debug-headers disabled')
         self.assertEqual(options.debug_headers, False)
+
+    def test_parse_settle_mode_default(self):
+        options = parse_global_options('')
+        self.assertEqual(options.settle_mode, 'fixed')
+        self.assertEqual(options.settle_guard_time, 0.2)
+
+    def test_parse_settle_mode_adaptive(self):
+        options = parse_global_options('--settle-mode adaptive --settle-guard-time 0.1')
+        self.assertEqual(options.settle_mode, 'adaptive')
+        self.assertEqual(options.settle_guard_time, 0.1)
@@ -0,0 +1,162 @@
+import tempfile
+import time
+import unittest
+from typing import Any, List
+from unittest import mock
+
+from tests.fake_sip import fake_pjsua2_modules
+
+with fake_pjsua2_modules():
+    from benchmarks import fixtures
+    import audio_cache
+    import early_media
+    import pjsua2 as pj
+    import ha
+    import incoming_call
+    from admission import AdmissionControl
+
+
+class IncomingCallAdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.events: List[Any] = []
+        self.command_handler = fixtures.create_command_handler(events=self.events)
+        config = incoming_call.compile_number_lists({'menu': {'message': None}, 'blocked_numbers': ['666']})
+        self.sip_account = fixtures.create_account(self.command_handler, incoming_call_config=config)
+
+    def call_from(self, caller: str) -> Any:
+        self.sip_account.simulate_incoming_call(f'<sip:{caller}@x>', '<sip:me@x>', f'call-{caller}-{len(self.events)}')
+        return self.command_handler.call_state.current_call_dict[f'<sip:{caller}@x>']
+
+    def event_names(self) -> List[str]:
+        return [event['event'] for event in self.events]
+
+    def test_blocked_callers_do_not_use_the_call_rate(self):
+        self.sip_account.admission = AdmissionControl(0, 1, 'reject')
+        blocked_call = self.call_from('666')
+        self.assertEqual(blocked_call.operations, [('answer', 180)])
+        self.call_from('42')
+        self.assertEqual(self.event_names(), ['incoming_call', 'incoming_call'])
+        rejected_call = self.call_from('43')
+        self.assertEqual(rejected_call.operations, [('hangup', 503)])
+        self.assertTrue(rejected_call.silent)
+        self.assertEqual(self.events[-1]['event'], 'call_rejected')
+        self.assertEqual((self.events[-1]['number'], self.events[-1]['reason']), ('43', 'max_call_rate'))
+
+    def test_concurrent_calls(self):
+        self.sip_account.admission = AdmissionControl(1, 0, 'reject')
+        self.call_from('42')
+        rejected_call = self.call_from('43')
+        self.assertEqual(rejected_call.operations, [('hangup', 486)])
+        self.assertEqual(self.events[-1]['reason'], 'max_concurrent_calls')
+
+
+
+class EarlyMediaPreparationTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        ha_config = fixtures.create_ha_config(self.cache_dir.name)
+        self.command_handler = fixtures.create_command_handler(ha_config)
+        config = incoming_call.compile_number_lists({'menu': {'message': None}, 'early_media': {'message': 'Please hold', 'ringback': True}})
+        self.sip_account = fixtures.create_account(self.command_handler, incoming_call_config=config)
+
+    def test_failed_preparation_is_retried_from_the_main_loop(self):
+        with mock.patch.object(early_media, 'prepare_prompt', return_value=None) as prepare_prompt:
+            self.sip_account.prepare_early_media()
+            self.assertAlmostEqual(self.sip_account.early_media_retry_at or 0.0, time.time() + early_media.PREPARE_RETRY_DELAY, delta=0.1)
+            self.sip_account.simulate_incoming_call('<sip:42@x>', '<sip:me@x>', 'call-42')
+            self.assertEqual(prepare_prompt.call_count, 1)
+            incoming = self.command_handler.call_state.current_call_dict['<sip:42@x>']
+            self.assertEqual(incoming.operations, [('answer', 183)])
+            self.assertIsNone(incoming.early_media_file)
+            self.command_handler.handle_early_media_retries()
+            self.assertEqual(prepare_prompt.call_count, 1)
+            self.sip_account.early_media_retry_at = time.time() - 1
+            self.command_handler.handle_early_media_retries()
+            self.assertEqual(prepare_prompt.call_count, 2)
+            self.assertEqual(self.sip_account.early_media_retry_delay, early_media.PREPARE_RETRY_DELAY * 4)
+            prepare_prompt.return_value = '/cache/prompt.wav'
+            self.sip_account.early_media_retry_at = time.time() - 1
+            self.command_handler.handle_early_media_retries()
+        self.assertEqual(self.sip_account.early_media_file, '/cache/prompt.wav')
+        self.assertIsNone(self.sip_account.early_media_retry_at)
+
+
+
+class EarlyMediaTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        with open(audio_cache.get_cache_file_name(self.cache_dir.name, 'message', 'Welcome'), 'wb') as f:
+            f.write(b'RIFF')
+        tts_patcher = mock.patch.object(ha, 'create_and_get_tts', side_effect=AssertionError('prompt must not be synthesized again'))
+        tts_patcher.start()
+        self.addCleanup(tts_patcher.stop)
+
+    def create_account(self, early_media_config: Any) -> Any:
+        ha_config = fixtures.create_ha_config(self.cache_dir.name)
+        self.command_handler = fixtures.create_command_handler(ha_config)
+        config: Any = {'menu': {'message': 'Welcome', 'post_action': 'noop'}, 'answer_after': 1}
+        if early_media_config:
+            config['early_media'] = early_media_config
+        sip_account = fixtures.create_account(self.command_handler, incoming_call_config=incoming_call.compile_number_lists(config))
+        sip_account.prepare_early_media()
+        return sip_account
+
+    def incoming_call(self, sip_account: Any) -> Any:
+        sip_account.simulate_incoming_call('<sip:42@x>', '<sip:me@x>', 'call-42')
+        return self.command_handler.call_state.current_call_dict['<sip:42@x>']
+
+    def answer(self, incoming: Any) -> None:
+        incoming.answer_at = time.time()
+        incoming.handle_events()
+        incoming.simulate_state(pj.PJSIP_INV_STATE_CONFIRMED)
+        incoming.handle_events()
+        self.assertTrue(incoming.connected)
+
+    def test_provisional_response(self):
+        self.assertEqual(self.incoming_call(self.create_account(None)).operations, [('answer', 180)])
+        self.command_handler.call_state.current_call_dict.clear()
+        self.assertEqual(self.incoming_call(self.create_account({'message': 'Welcome'})).operations, [('answer', 183)])
+        self.command_handler.call_state.current_call_dict.clear()
+        self.assertEqual(self.incoming_call(self.create_account({'ringback': True})).operations, [('answer', 183)])
+
+    def test_menu_continues_playing_prompt(self):
+        incoming = self.incoming_call(self.create_account({'message': 'Welcome'}))
+        incoming.simulate_media_active()
+        prompt_player = incoming.early_media_player
+        self.assertIsNotNone(prompt_player)
+        self.assertIn(incoming.fake_audio_media, prompt_player.transmitting_to)
+        self.answer(incoming)
+        self.assertIs(incoming.player, prompt_player)
+        self.assertIsNone(incoming.early_media_player)
+        self.assertFalse(incoming.playback_is_done)
+        prompt_player.onEof2()
+        self.assertTrue(incoming.playback_is_done)
+
+    def test_ringback_after_prompt(self):
+        incoming = self.incoming_call(self.create_account({'message': 'Welcome', 'ringback': True}))
+        incoming.simulate_media_active()
+        incoming.early_media_player.onEof2()
+        self.assertIsNone(incoming.early_media_player)
+        ringback_generator = incoming.ringback_generator
+        self.assertIsNotNone(ringback_generator)
+        self.assertIn(incoming.fake_audio_media, ringback_generator.transmitting_to)
+        self.answer(incoming)
+        self.assertIsNone(incoming.ringback_generator)
+        self.assertEqual(ringback_generator.transmitting_to, [])
+        self.assertIsNotNone(incoming.player)
+
+    def test_cleanup_on_disconnect(self):
+        incoming = self.incoming_call(self.create_account({'message': 'Welcome', 'ringback': True}))
+        incoming.simulate_media_active()
+        prompt_player = incoming.early_media_player
+        incoming.simulate_state(pj.PJSIP_INV_STATE_DISCONNECTED, 487)
+        self.assertEqual(prompt_player.transmitting_to, [])
+        self.assertIsNone(incoming.early_media_player)
+        self.assertIsNone(incoming.ringback_generator)
+        self.assertFalse(self.command_handler.is_active('<sip:42@x>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
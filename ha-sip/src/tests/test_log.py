@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+import log
+from log import LogLevel
+
+
+class LogTest(unittest.TestCase):
+    def tearDown(self):
+        log.configure_logging(LogLevel.INFO, {}, False)
+
+    def test_parse_module_levels(self):
+        self.assertEqual(log.parse_module_levels(None), {})
+        self.assertEqual(log.parse_module_levels('ha=debug, mqtt=WARNING,invalid'), {'ha': LogLevel.DEBUG, 'mqtt': LogLevel.WARNING})
+
+    def test_is_enabled(self):
+        log.configure_logging(LogLevel.INFO, {'ha': LogLevel.DEBUG, 'mqtt': LogLevel.ERROR}, False)
+        self.assertEqual(log.is_enabled(LogLevel.DEBUG, None), False)
+        self.assertEqual(log.is_enabled(LogLevel.INFO, 'call'), True)
+        self.assertEqual(log.is_enabled(LogLevel.DEBUG, 'ha'), True)
+        self.assertEqual(log.is_enabled(LogLevel.WARNING, 'mqtt'), False)
+
+    def test_set_log_level(self):
+        log.set_log_level(LogLevel.DEBUG)
+        self.assertEqual(log.is_enabled(LogLevel.DEBUG, 'call'), True)
+        log.set_log_level(LogLevel.ERROR, 'call')
+        self.assertEqual(log.is_enabled(LogLevel.WARNING, 'call'), False)
+
+    def test_format_text(self):
+        line = log.format_record((0.0, LogLevel.INFO, None, 1, 'Digit %s', ('5',)))
+        self.assertTrue(line.startswith('| '))
+        self.assertTrue(line.endswith('[1] Digit 5'))
+
+    def test_format_json(self):
+        log.configure_logging(LogLevel.INFO, {}, True)
+        line = log.format_record((0.0, LogLevel.DEBUG, 'call', None, 'Digit %s', ('5',)))
+        self.assertIn('"level": "debug"', line)
+        self.assertIn('"module": "call"', line)
+        self.assertIn('"message": "Digit 5"', line)
+
+    def test_levels_are_explicit(self):
+        with mock.patch.object(log.writer, 'put') as put:
+            log.log(1, 'Error codes are listed in the README')
+            log.warning(1, 'Warning: call not in progress: %s', '42')
+            log.error(None, 'Error: Command failed: %s', 'boom')
+            log.log(None, 'Dial group %s: Could not dial', 'g', level=LogLevel.ERROR)
+        records = [call.args[0] for call in put.call_args_list]
+        self.assertEqual([record[1] for record in records], [LogLevel.INFO, LogLevel.WARNING, LogLevel.ERROR, LogLevel.ERROR])
+        self.assertEqual(records[1][4:], ('Warning: call not in progress: %s', ('42',)))
+
+    def test_warnings_are_filtered_by_level(self):
+        log.configure_logging(LogLevel.ERROR, {}, False)
+        with mock.patch.object(log.writer, 'put') as put:
+            log.warning(None, 'Warning: %s', 'dropped')
+            log.error(None, 'Error: %s', 'kept')
+        self.assertEqual(put.call_count, 1)
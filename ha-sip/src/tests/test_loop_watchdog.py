@@ -0,0 +1,40 @@
+import time
+import unittest
+from unittest import mock
+
+from loop_watchdog import LoopWatchdog
+
+
+class LoopWatchdogTest(unittest.TestCase):
+    def test_detects_stall(self):
+        loop_watchdog = LoopWatchdog(threshold=0.01, dump_timeout=0)
+        loop_watchdog.begin_iteration()
+        time.sleep(0.02)
+        loop_watchdog.check()
+        loop_watchdog.check()
+        loop_watchdog.end_iteration()
+        self.assertEqual(sum(loop_watchdog.stall_counts.values()), 1)
+        call_site = next(iter(loop_watchdog.stall_counts))
+        self.assertTrue(call_site.startswith('loop_watchdog.py:'), call_site)
+        self.assertGreaterEqual(loop_watchdog.max_lag, 0.02)
+
+    def test_no_stall_below_threshold(self):
+        loop_watchdog = LoopWatchdog(threshold=10, dump_timeout=0)
+        loop_watchdog.begin_iteration()
+        loop_watchdog.check()
+        loop_watchdog.end_iteration()
+        loop_watchdog.check()
+        self.assertEqual(loop_watchdog.stall_counts, {})
+        self.assertEqual(loop_watchdog.iteration, 1)
+
+    def test_dump_is_not_rearmed_on_every_iteration(self):
+        loop_watchdog = LoopWatchdog(threshold=10, dump_timeout=60)
+        with mock.patch('faulthandler.dump_traceback_later') as dump_traceback_later:
+            for _ in range(100):
+                loop_watchdog.begin_iteration()
+                loop_watchdog.end_iteration()
+            self.assertEqual(dump_traceback_later.call_count, 1)
+            assert loop_watchdog.dump_armed_at is not None
+            loop_watchdog.dump_armed_at -= 7
+            loop_watchdog.begin_iteration()
+            self.assertEqual(dump_traceback_later.call_count, 2)
@@ -0,0 +1,57 @@
+import unittest
+
+import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = metrics.Counter(self.registry, 'test_total', 'Test counter', ('result',))
+        counter.inc(result='hit')
+        counter.inc(2, result='hit')
+        counter.inc(result='miss')
+        self.assertEqual(counter.get(result='hit'), 3)
+        self.assertEqual(self.registry.render(), (
+            '# HELP test_total Test counter\n'
+            '# TYPE test_total counter\n'
+            'test_total{result="hit"} 3\n'
+            'test_total{result="miss"} 1\n'
+        ))
+
+    def test_gauge(self):
+        gauge = metrics.Gauge(self.registry, 'test_active', 'Test gauge', ('account',))
+        gauge.inc(account=1)
+        gauge.inc(account=1)
+        gauge.dec(account=1)
+        gauge.set(5, account=2)
+        self.assertIn('test_active{account="1"} 1\n', self.registry.render())
+        self.assertIn('test_active{account="2"} 5\n', self.registry.render())
+
+    def test_histogram(self):
+        histogram = metrics.Histogram(self.registry, 'test_seconds', 'Test histogram', buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.get_count(), 3)
+        self.assertEqual(self.registry.render(), (
+            '# HELP test_seconds Test histogram\n'
+            '# TYPE test_seconds histogram\n'
+            'test_seconds_bucket{le="0.1"} 1\n'
+            'test_seconds_bucket{le="1"} 2\n'
+            'test_seconds_bucket{le="+Inf"} 3\n'
+            'test_seconds_sum 5.55\n'
+            'test_seconds_count 3\n'
+        ))
+
+    def test_histogram_timer(self):
+        histogram = metrics.Histogram(self.registry, 'test_timer_seconds', 'Test timer', ('stage',))
+        with histogram.time(stage='download'):
+            pass
+        self.assertEqual(histogram.get_count(stage='download'), 1)
+
+    def test_label_escaping(self):
+        counter = metrics.Counter(self.registry, 'test_escape_total', 'Test escaping', ('name',))
+        counter.inc(name='a"b\\c')
+        self.assertIn('test_escape_total{name="a\\"b\\\\c"} 1\n', self.registry.render())
@@ -0,0 +1,48 @@
+import unittest
+
+from number_matcher import NumberMatcher
+
+
+class NumberMatcherTest(unittest.TestCase):
+    def test_matches(self):
+        self.assertEqual(NumberMatcher(['12345']).matches(None), False)
+        self.assertEqual(NumberMatcher([]).matches(None), False)
+        self.assertEqual(NumberMatcher(None).matches('12345'), False)
+        self.assertEqual(NumberMatcher([]).matches('12345'), False)
+        self.assertEqual(NumberMatcher(['12345']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['12345']).matches('1234'), False)
+        self.assertEqual(NumberMatcher(['1234{*}']).matches('123456'), True)
+        self.assertEqual(NumberMatcher(['1234{*}']).matches('1234'), True)
+        self.assertEqual(NumberMatcher(['1234{*}']).matches('123'), False)
+        self.assertEqual(NumberMatcher(['1234{?}']).matches('123456'), False)
+        self.assertEqual(NumberMatcher(['1234{?}']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['1{*}5']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['12{?}45']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['{*}45']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['{?}345']).matches('12345'), False)
+        self.assertEqual(NumberMatcher(['{?}2345']).matches('12345'), True)
+        self.assertEqual(NumberMatcher(['**620']).matches('**620'), True)
+        self.assertEqual(NumberMatcher(['**{*}']).matches('**620'), True)
+        self.assertEqual(NumberMatcher(['+49.{*}']).matches('+49123'), False)
+
+    def test_mixed_list(self):
+        matcher = NumberMatcher(['5551234456', '555{*}', '12{?}45', 5559876543])
+        self.assertEqual(len(matcher), 4)
+        self.assertEqual(matcher.matches('5551234456'), True)
+        self.assertEqual(matcher.matches('5559876543'), True)
+        self.assertEqual(matcher.matches('555'), True)
+        self.assertEqual(matcher.matches('12945'), True)
+        self.assertEqual(matcher.matches('1294'), False)
+        self.assertEqual(matcher.matches('666'), False)
+
+    def test_large_block_list(self):
+        matcher = NumberMatcher([str(n) for n in range(1000000, 1050000)] + ['0800{*}', '0900{?}{?}'])
+        self.assertEqual(matcher.matches('1049999'), True)
+        self.assertEqual(matcher.matches('1050000'), False)
+        self.assertEqual(matcher.matches('08001234'), True)
+        self.assertEqual(matcher.matches('090012'), True)
+        self.assertEqual(matcher.matches('0900123'), False)
+
+    def test_empty_is_falsy(self):
+        self.assertEqual(bool(NumberMatcher(None)), False)
+        self.assertEqual(bool(NumberMatcher(['1'])), True)
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+from typing import Any
+
+from profiling import Profiler
+from tests.fake_sip import fake_pjsua2_modules
+
+with fake_pjsua2_modules():
+    from benchmarks import fixtures
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_cpu_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = Profiler(directory)
+            profiler.start_profile()
+            sum(range(1000))
+            file_name, error = profiler.stop_profile('tottime')
+            self.assertIsNone(error)
+            assert file_name is not None
+            self.assertTrue(os.path.isfile(file_name))
+            self.assertTrue(os.path.isfile(file_name.replace('.prof', '.txt')))
+            self.assertEqual(profiler.stop_profile(), (None, 'No CPU profile running'))
+
+    def test_memory_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = Profiler(directory)
+            self.assertEqual(profiler.memory_snapshot(), (None, None))
+            self.assertTrue(tracemalloc.is_tracing())
+            file_name, error = profiler.memory_snapshot(stop=True)
+            self.assertFalse(tracemalloc.is_tracing())
+            self.assertIsNone(error)
+            assert file_name is not None
+            with open(file_name) as f:
+                self.assertIn('Top 50 allocations', f.read())
+
+    def test_without_profile_dir(self):
+        profiler = Profiler(None)
+        self.assertIsNotNone(profiler.start_profile())
+        self.assertIsNone(profiler.profile)
+        self.assertIsNotNone(profiler.stop_profile()[1])
+        self.assertIsNotNone(profiler.memory_snapshot()[1])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_profile_dir_is_created(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profile_dir = os.path.join(directory, 'profiles')
+            profiler = Profiler(profile_dir)
+            self.assertIsNone(profiler.start_profile())
+            self.assertTrue(os.path.isdir(profile_dir))
+            self.assertIsNotNone(profiler.stop_profile()[0])
+
+    def test_profile_dir_not_usable(self):
+        with tempfile.NamedTemporaryFile() as f:
+            profiler = Profiler(os.path.join(f.name, 'profiles'))
+            self.assertIsNotNone(profiler.start_profile())
+            self.assertIsNone(profiler.profile)
+            self.assertIsNotNone(profiler.memory_snapshot()[1])
+            self.assertFalse(tracemalloc.is_tracing())
+
+    def test_memory_snapshot_fails_when_profile_dir_is_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profile_dir = os.path.join(directory, 'profiles')
+            profiler = Profiler(profile_dir)
+            self.assertEqual(profiler.memory_snapshot(), (None, None))
+            os.rmdir(profile_dir)
+            with open(profile_dir, 'w'):
+                pass
+            file_name, error = profiler.memory_snapshot(stop=True)
+            self.assertIsNone(file_name)
+            self.assertIsNotNone(error)
+            self.assertTrue(tracemalloc.is_tracing())
+            tracemalloc.stop()
+
+
+class ProfileCommandTest(unittest.TestCase):
+    def test_failures_are_returned_as_command_errors(self):
+        command_handler = fixtures.create_command_handler()
+        for verb in ['profile_start', 'profile_stop', 'memory_snapshot']:
+            command: Any = {'command': verb}
+            result = command_handler.handle_command(command, None)
+            self.assertEqual(result['ok'], False)
+            self.assertEqual(result['command'], verb)
+            self.assertIsNotNone(result['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from sip_headers import SipHeaders
+
+INVITE = (
+    'INVITE sip:homeassistant@192.168.178.20:5060 SIP/2.0\r\n'
+    'Via: SIP/2.0/UDP 192.168.178.1:5060;branch=z9hG4bK1\r\n'
+    'From: <sip:5551234456@fritz.box>;tag=1\r\n'
+    'To: <sip:homeassistant@fritz.box>\r\n'
+    'i: 7490FE75C2CB1D45@192.168.178.1\r\n'
+    'X-Caller-ID: John\r\n'
+    ' Doe\r\n'
+    'P-Asserted-Identity: <sip:+15551234456@provider.com>\r\n'
+    'P-Asserted-Identity: <tel:+15551234456>\r\n'
+    'Content-Length: 15\r\n'
+    '\r\n'
+    'X-Not-A-Header: body\r\n'
+)
+
+
+class SipHeadersTest(unittest.TestCase):
+    def test_extract_case_insensitive(self):
+        headers = SipHeaders(INVITE)
+        self.assertEqual(headers.extract(['x-caller-id', 'FROM', 'X-Missing']), {
+            'x-caller-id': 'John Doe',
+            'FROM': '<sip:5551234456@fritz.box>;tag=1',
+            'X-Missing': None,
+        })
+
+    def test_compact_form(self):
+        headers = SipHeaders(INVITE)
+        self.assertEqual(headers.get('Call-ID'), '7490FE75C2CB1D45@192.168.178.1')
+        self.assertEqual(headers.get('i'), '7490FE75C2CB1D45@192.168.178.1')
+
+    def test_multiple_values(self):
+        headers = SipHeaders(INVITE)
+        self.assertEqual(headers.get_all('p-asserted-identity'), ['<sip:+15551234456@provider.com>', '<tel:+15551234456>'])
+        self.assertEqual(headers.get('p-asserted-identity'), '<tel:+15551234456>')
+
+    def test_stops_at_blank_line(self):
+        headers = SipHeaders(INVITE)
+        self.assertEqual(headers.get('X-Not-A-Header'), None)
+        self.assertEqual(len(headers.items()), 8)
+        self.assertEqual(headers.items()[0][0], 'Via')
+
+    def test_response_with_lf_only(self):
+        headers = SipHeaders('SIP/2.0 200 OK\nTo: <sip:a@b>\n\nbody: text')
+        self.assertEqual(headers.items(), [('To', '<sip:a@b>')])
+
+    def test_empty_message(self):
+        headers = SipHeaders('')
+        self.assertEqual(headers.items(), [])
+        self.assertEqual(headers.get('To'), None)
@@ -87,3 +87,14 @@ class SipOptionsTest(unittest.TestCase):
         options = parse_sip_options('--extract-headers X-Custom-Header,P-Asserted-Identity,X-Another')
         self.assertEqual(options.extract_headers, ['X-Custom-Header', 'P-Asserted-Identity', 'X-Another'])
 
+    def test_parse_admission_control_default(self):
+        options = parse_sip_options('')
+        self.assertEqual(options.max_concurrent_calls, 0)
+        self.assertEqual(options.max_call_rate, 0.0)
+        self.assertEqual(options.overload_policy, 'queue')
+
+    def test_parse_admission_control(self):
+        options = parse_sip_options('--max-concurrent-calls 4 --max-call-rate 0.5 --overload-policy reject')
+        self.assertEqual(options.max_concurrent_calls, 4)
+        self.assertEqual(options.max_call_rate, 0.5)
+        self.assertEqual(options.overload_policy, 'reject')
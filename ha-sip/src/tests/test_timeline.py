@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from timeline import CallTimeline, RotatingFile
+
+
+class CallTimelineTest(unittest.TestCase):
+    def test_record_contains_milestones_in_order(self):
+        call_timeline = CallTimeline()
+        call_timeline.mark('invite_received')
+        call_timeline.mark('dtmf', digit='1')
+        call_timeline.mark('dtmf', digit='2')
+        record = call_timeline.to_record({'internal_id': 'abc'})
+        self.assertEqual(record['internal_id'], 'abc')
+        self.assertEqual([m['name'] for m in record['milestones']], ['invite_received', 'dtmf', 'dtmf'])
+        self.assertEqual(record['milestones'][0]['offset_ms'], 0)
+        self.assertEqual(record['milestones'][2]['digit'], '2')
+        self.assertEqual(list(call_timeline.offsets().keys()), ['invite_received', 'dtmf'])
+
+    def test_otel_span(self):
+        call_timeline = CallTimeline()
+        call_timeline.mark('make_call')
+        call_timeline.mark('confirmed')
+        call_timeline.mark('disconnected', status_code=200)
+        span = call_timeline.to_otel_span({'sip_account': 1, 'call_id': None})['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertEqual(span['name'], 'call')
+        self.assertEqual(len(span['traceId']), 32)
+        self.assertEqual([event['name'] for event in span['events']], ['make_call', 'confirmed', 'disconnected'])
+        self.assertEqual(span['events'][2]['attributes'], [{'key': 'status_code', 'value': {'intValue': '200'}}])
+        self.assertEqual(span['attributes'], [{'key': 'sip_account', 'value': {'intValue': '1'}}])
+        self.assertLessEqual(int(span['startTimeUnixNano']), int(span['endTimeUnixNano']))
+
+
+class RotatingFileTest(unittest.TestCase):
+    def test_rotates_when_full(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'timeline.jsonl')
+            rotating_file = RotatingFile(file_name, max_bytes=30, backup_count=2)
+            for index in range(4):
+                rotating_file.write_lines([json.dumps({'index': index, 'padding': 'x'})])
+            with open(file_name) as f:
+                self.assertEqual(json.loads(f.read())['index'], 3)
+            with open(file_name + '.1') as f:
+                self.assertEqual(json.loads(f.read())['index'], 2)
+            with open(file_name + '.2') as f:
+                self.assertEqual(json.loads(f.read())['index'], 1)
+            self.assertFalse(os.path.exists(file_name + '.3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+import trace_recorder
+from event_sender import EventSender
+
+
+class TraceRecorderTest(unittest.TestCase):
+    def tearDown(self):
+        trace_recorder.recorder = None
+
+    def test_records_are_read_back_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'trace.jsonl')
+            trace_recorder.configure(file_name, {1: {'mode': 'ACCEPT', 'settle_time': 1.0}})
+            trace_recorder.record('command', source='stdin', command={'command': 'dial', 'number': 'sip:1@fritz.box'})
+            trace_recorder.record('dtmf', call='sip:1@fritz.box', digit='5')
+            assert trace_recorder.recorder is not None
+            trace_recorder.recorder.writer.flush()
+            trace_recorder.recorder.file.close()
+            records = list(trace_recorder.read(file_name))
+        self.assertEqual([record['k'] for record in records], ['start', 'command', 'dtmf'])
+        self.assertEqual(records[0]['accounts'], {'1': {'mode': 'ACCEPT', 'settle_time': 1.0}})
+        self.assertEqual(records[1]['command']['number'], 'sip:1@fritz.box')
+        self.assertEqual(records[2]['digit'], '5')
+        self.assertLessEqual(records[1]['t'], records[2]['t'])
+
+    def test_event_sender_records_events(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'trace.jsonl')
+            trace_recorder.configure(file_name, {})
+            EventSender().send_event({'event': 'call_established'}, 'webhook-id')
+            assert trace_recorder.recorder is not None
+            trace_recorder.recorder.writer.flush()
+            trace_recorder.recorder.file.close()
+            records = list(trace_recorder.read(file_name))
+        self.assertEqual(records[1]['k'], 'event')
+        self.assertEqual(records[1]['event'], {'event': 'call_established'})
+        self.assertEqual(records[1]['webhook_id'], 'webhook-id')
+
+    def test_nothing_is_recorded_without_file(self):
+        trace_recorder.configure(None, {})
+        trace_recorder.record('dtmf', call='sip:1@fritz.box', digit='5')
+        self.assertIsNone(trace_recorder.recorder)
+
+    def test_skips_malformed_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'trace.jsonl')
+            with open(file_name, 'w') as f:
+                f.write('{"t":0,"k":"start"}\n{"t":0.1,\n\n{"t":0.2,"k":"dtmf"}\n')
+            records = list(trace_recorder.read(file_name))
+        self.assertEqual([record['k'] for record in records], ['start', 'dtmf'])
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from background_writer import BackgroundWriter
+from log import log, warning
+
+# time stamp, milestone name, attributes
+Milestone = Tuple[float, str, Dict[str, Any]]
+
+
+class CallTimeline(object):
+    """Timestamped milestones of one call, from INVITE/makeCall until disconnect."""
+    def __init__(self):
+        self.milestones: List[Milestone] = []
+
+    def mark(self, name: str, **attributes: Any) -> None:
+        self.milestones.append((time.time(), name, attributes))
+
+    def first(self, name: str) -> Optional[float]:
+        return next((time_stamp for time_stamp, milestone_name, _ in self.milestones if milestone_name == name), None)
+
+    def started_at(self) -> float:
+        return self.milestones[0][0] if self.milestones else time.time()
+
+    def offsets(self) -> Dict[str, float]:
+        """Seconds from the start of the call until the first occurrence of each milestone."""
+        start = self.started_at()
+        result: Dict[str, float] = {}
+        for time_stamp, name, _ in self.milestones:
+            if name not in result:
+                result[name] = round(time_stamp - start, 6)
+        return result
+
+    def to_record(self, base_fields: Dict[str, Any]) -> Dict[str, Any]:
+        start = self.started_at()
+        return {
+            **base_fields,
+            'start': datetime.fromtimestamp(start).isoformat(timespec='milliseconds'),
+            'milestones': [
+                {'name': name, 'offset_ms': round((time_stamp - start) * 1000, 3), **attributes}
+                for time_stamp, name, attributes in self.milestones
+            ],
+        }
+
+    def to_otel_span(self, base_fields: Dict[str, Any]) -> Dict[str, Any]:
+        """One span per call in OTLP/JSON format, every milestone becomes a span event."""
+        start = self.started_at()
+        end = self.milestones[-1][0] if self.milestones else start
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [otel_attribute('service.name', 'ha-sip')]},
+                'scopeSpans': [{
+                    'scope': {'name': 'ha-sip'},
+                    'spans': [{
+                        'traceId': secrets.token_hex(16),
+                        'spanId': secrets.token_hex(8),
+                        'name': 'call',
+                        'kind': 1,
+                        'startTimeUnixNano': str(int(start * 1e9)),
+                        'endTimeUnixNano': str(int(end * 1e9)),
+                        'attributes': [otel_attribute(key, value) for key, value in base_fields.items() if value is not None],
+                        'events': [
+                            {
+                                'timeUnixNano': str(int(time_stamp * 1e9)),
+                                'name': name,
+                                'attributes': [otel_attribute(key, value) for key, value in attributes.items()],
+                            }
+                            for time_stamp, name, attributes in self.milestones
+                        ],
+                    }],
+                }],
+            }],
+        }
+
+
+def otel_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class RotatingFile(object):
+    def __init__(self, file_name: str, max_bytes: int, backup_count: int):
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write_lines(self, lines: List[str]) -> None:
+        data = ''.join(line + '\n' for line in lines)
+        if self.max_bytes and os.path.exists(self.file_name) and os.path.getsize(self.file_name) + len(data) > self.max_bytes:
+            self.rotate()
+        with open(self.file_name, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+    def rotate(self) -> None:
+        if self.backup_count <= 0:
+            os.remove(self.file_name)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.file_name}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.file_name}.{index + 1}')
+        os.replace(self.file_name, self.file_name + '.1')
+
+
+class TimelineWriter(object):
+    def __init__(self, timeline_file: Optional[RotatingFile], otel_file: Optional[RotatingFile]):
+        self.timeline_file = timeline_file
+        self.otel_file = otel_file
+        self.writer: BackgroundWriter[Tuple[Dict[str, Any], Dict[str, Any]]] = BackgroundWriter('timeline-writer', self.write_batch, max_size=1000)
+
+    def write(self, timeline: CallTimeline, base_fields: Dict[str, Any]) -> None:
+        record = timeline.to_record(base_fields)
+        span = timeline.to_otel_span(base_fields) if self.otel_file else {}
+        if not self.writer.put((record, span)):
+            warning(None, 'Warning: Timeline buffer is full, dropping timeline record')
+
+    def write_batch(self, batch: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        if self.timeline_file:
+            self.timeline_file.write_lines([json.dumps(record) for record, _ in batch])
+        if self.otel_file:
+            self.otel_file.write_lines([json.dumps(span) for _, span in batch])
+
+
+timeline_writer: Optional[TimelineWriter] = None
+
+
+def configure_writer(timeline_file: Optional[str], otel_file: Optional[str], max_bytes: int, backup_count: int) -> None:
+    global timeline_writer
+    if not timeline_file and not otel_file:
+        return
+    log(None, f'Writing call timelines to {timeline_file or "-"} (OpenTelemetry spans: {otel_file or "-"})')
+    timeline_writer = TimelineWriter(
+        RotatingFile(timeline_file, max_bytes, backup_count) if timeline_file else None,
+        RotatingFile(otel_file, max_bytes, backup_count) if otel_file else None,
+    )
+    atexit.register(timeline_writer.writer.flush)
+
+
+def write(timeline: CallTimeline, base_fields: Dict[str, Any]) -> None:
+    if timeline_writer:
+        timeline_writer.write(timeline, base_fields)
@@ -0,0 +1,71 @@
+"""
+Records every inbound command, every PJSIP callback and every outbound event to a JSON lines file, so production
+incidents can be replayed later with benchmarks/replay.py.
+
+Each line has the seconds since the start of the recording ("t"), the kind of record ("k") and its fields:
+start, command, incoming_call, call_state, media_state, dtmf, playback_done and event.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from background_writer import BackgroundWriter
+from log import log, error, warning
+
+TRACE_VERSION = 1
+
+
+class TraceRecorder(object):
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.started_at = time.monotonic()
+        self.file = open(file_name, 'a', encoding='utf-8')
+        self.writer: BackgroundWriter[str] = BackgroundWriter('trace-writer', self.write_batch)
+
+    def record(self, kind: str, fields: Dict[str, Any]) -> None:
+        # serialize right away, the payloads may be changed after the callback returned
+        line = json.dumps({'t': round(time.monotonic() - self.started_at, 4), 'k': kind, **fields}, separators=(',', ':'), default=str)
+        if not self.writer.put(line):
+            warning(None, 'Warning: Trace buffer is full, dropping trace record')
+
+    def write_batch(self, lines: List[str]) -> None:
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+
+
+recorder: Optional[TraceRecorder] = None
+
+
+def configure(file_name: Optional[str], accounts: Dict[int, Dict[str, Any]]) -> None:
+    """Starts recording to file_name, accounts holds the settings of each enabled account needed for a replay."""
+    global recorder
+    if not file_name:
+        return
+    try:
+        recorder = TraceRecorder(file_name)
+    except OSError as e:
+        error(None, 'Error: Could not open trace file %s: %s', file_name, e)
+        return
+    log(None, f'Recording trace to {file_name}')
+    atexit.register(recorder.writer.flush)
+    record('start', version=TRACE_VERSION, time=datetime.now().isoformat(timespec='milliseconds'), accounts=accounts)
+
+
+def record(kind: str, **fields: Any) -> None:
+    if recorder:
+        recorder.record(kind, fields)
+
+
+def read(file_name: str) -> Iterator[Dict[str, Any]]:
+    with open(file_name, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                error(None, 'Error: Could not deserialize trace record in line %s', line_number)
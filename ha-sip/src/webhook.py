@@ -6,7 +6,7 @@ from typing_extensions import TypedDict
 
 import ha
 from event_sender import EventSender
-from log import log
+from log import debug
 
 
 class WebhookToCall(TypedDict):
@@ -17,6 +17,7 @@ class WebhookToCall(TypedDict):
     timeout: Optional[str]
     ring_timeout: Optional[str]
     playback_done: Optional[str]
+    digits_collected: Optional[str]
 
 
 class CallInfo(TypedDict):
@@ -52,6 +53,6 @@ def trigger_webhook(
     }
     event_id = event.get('event')
     if webhooks and (additional_webhook := webhooks.get(event_id)):
-        log(sip_account, f'Calling additional webhook {additional_webhook} for event {event_id}')
+        debug(sip_account, 'Calling additional webhook %s for event %s', additional_webhook, event_id)
         event_sender_callback.send_event(complete_event, additional_webhook)
     event_sender_callback.send_event(complete_event)